@@ -43,6 +43,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "mailing.profiling.ProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -139,12 +140,53 @@ EMAIL_HOST_USER = config("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = config("EMAIL_HOST_PASSWORD")
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
+# Доставка рассылок (python manage.py run_delivery_worker)
+MAILING_DELIVERY_INTERVAL = 120  # пауза между раундами рассылки, в секундах
+MAILING_WORKER_THREADS = 4
+MAILING_WORKER_POLL_INTERVAL = 5  # в секундах
+MAILING_JOB_LOCK_TIMEOUT = 30 * 60  # задача зависшего воркера снова берётся в работу
+MAILING_SMTP_BATCH_SIZE = 100  # писем на одну пачку через общее SMTP-соединение
+MAILING_SMTP_MAX_MESSAGES_PER_CONNECTION = 1000  # затем соединение переоткрывается
+MAILING_DELIVERY_ENGINE = "sync"  # "sync" или "async" (asyncio + aiosmtplib)
+MAILING_ASYNC_CONCURRENCY = 50  # одновременных SMTP-сессий на процесс
+MAILING_ASYNC_CONCURRENCY_PER_NEWSLETTER = 10  # одновременных отправок на рассылку
+MAILING_PREPARED_MESSAGE_CACHE_SIZE = 256  # подготовленных писем в памяти процесса
+MAILING_SERVER_RESPONSE_CACHE_SIZE = 1024  # id текстов ответов сервера в памяти
+MAILING_RECIPIENT_CHUNK_SIZE = 2000  # получателей на один запрос при доставке
+MAILING_ATTEMPT_BATCH_SIZE = 500  # попыток на один bulk_create
+MAILING_ATTEMPT_FLUSH_INTERVAL = 5  # не реже чем раз в N секунд
+# Лимиты отправки (писем в секунду, запас писем) хранятся в Redis и общие
+# для всех воркеров; None — без ограничения
+MAILING_ACCOUNT_RATE_LIMIT = None  # на учётную запись SMTP (EMAIL_HOST_USER)
+MAILING_DOMAIN_RATE_LIMIT = (20, 100)  # на домен получателя
+MAILING_DOMAIN_RATE_LIMITS = {}  # отдельные лимиты, например {"gmail.com": (10, 50)}
+MAILING_DOMAIN_BACKOFF = 60  # пауза домена после временного отказа (4xx), в секундах
+MAILING_TEMPORARY_FAILURE_RETRIES = 3  # повторов письма после 4xx за раунд
+MAILING_DEFERRED_LIMIT = 1000  # отложенных лимитом получателей на раунд
+# Пауза и остановка приходят воркерам через Redis pub/sub; если кэш не Redis,
+# воркер опрашивает статусы выполняемых рассылок с этим интервалом
+MAILING_CONTROL_POLL_INTERVAL = 1  # в секундах
+# Планировщик (python manage.py run_scheduler)
+MAILING_SCHEDULER_MAX_SLEEP = 60  # в секундах, на случай пропущенного уведомления
+MAILING_SCHEDULER_CHUNK_SIZE = 1000  # задач/рассылок за одно обновление
+MAILING_ATTEMPTS_PAGE_SIZE = 50  # попыток на странице журнала рассылки
+MAILING_DASHBOARD_PAGE_SIZE = 25  # пользователей и рассылок на странице менеджера
+MAILING_OWNER_CACHE_TIMEOUT = 10 * 60  # списки и статистика владельца в кэше (mailing.cache)
+MAILING_EXPORT_CHUNK_SIZE = 2000  # строк на порцию при выгрузке журнала попыток
+MAILING_IMPORT_CHUNK_SIZE = 5000  # строк на транзакцию при импорте получателей из CSV
+MAILING_ATTEMPT_RETENTION_DAYS = 90  # попытки старше сворачиваются в итоги по дням
+MAILING_COMPACTION_BATCH_SIZE = 5000  # попыток на одну транзакцию сворачивания
+# Профилирование запросов (python manage.py profile_report)
+MAILING_PROFILING = True  # счётчики SQL, кэша и времени по имени URL в Redis
+MAILING_SLOW_REQUEST_MS = 500  # более медленные запросы пишутся в лог с дублями SQL
+
 CACHES = {
     "default": {
         "BACKEND": "django_redis.cache.RedisCache",
         "LOCATION": config('REDIS_URL'),
         "OPTIONS": {
-            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            # DefaultClient с сигналами попаданий/промахов для профилирования
+            "CLIENT_CLASS": "mailing.cache_clients.ProfiledRedisClient",
         },
     }
 }
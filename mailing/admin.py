@@ -1,7 +1,22 @@
 from django.contrib import admin
-from .models import Recipient, Message, Newsletter, Attempt
+from .models import (
+    Recipient,
+    Message,
+    Newsletter,
+    Attempt,
+    DeliveryJob,
+    OwnerStatistics,
+    ServerResponse,
+    Segment,
+    SuppressedAddress,
+)
 
 admin.site.register(Recipient)
 admin.site.register(Message)
 admin.site.register(Newsletter)
 admin.site.register(Attempt)
+admin.site.register(DeliveryJob)
+admin.site.register(OwnerStatistics)
+admin.site.register(ServerResponse)
+admin.site.register(Segment)
+admin.site.register(SuppressedAddress)
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import threading
+
+import aiosmtplib
+from django.conf import settings
+
+from .rendering import encode_address
+
+logger = logging.getLogger(__name__)
+
+_engine = None
+_engine_lock = threading.Lock()
+_SKIPPED = object()
+
+
+class _SessionPool:
+    # Общий для процесса пул SMTP-сессий: размер ограничивает
+    # суммарное число одновременных отправок по всем рассылкам
+    def __init__(self, size):
+        self._slots = asyncio.Semaphore(size)
+        self._idle = []
+
+    @staticmethod
+    async def _connect():
+        client = aiosmtplib.SMTP(
+            hostname=settings.EMAIL_HOST,
+            port=settings.EMAIL_PORT,
+            username=settings.EMAIL_HOST_USER or None,
+            password=settings.EMAIL_HOST_PASSWORD or None,
+            use_tls=settings.EMAIL_USE_SSL,
+            start_tls=settings.EMAIL_USE_TLS,
+            timeout=getattr(settings, "EMAIL_TIMEOUT", None) or 60,
+        )
+        await client.connect()
+        return client
+
+    async def send(self, sender, recipients, payload):
+        async with self._slots:
+            client = self._idle.pop() if self._idle else None
+            for retry in (False, True):
+                if client is None or not client.is_connected:
+                    client = await self._connect()
+                try:
+                    await client.sendmail(sender, recipients, payload)
+                except aiosmtplib.SMTPServerDisconnected:
+                    client = None
+                    if retry:
+                        raise
+                    continue
+                except Exception:
+                    # Отказ по конкретному письму не ломает сессию
+                    self._idle.append(client)
+                    raise
+                self._idle.append(client)
+                return
+
+
+class _Engine:
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.pool = _SessionPool(settings.MAILING_ASYNC_CONCURRENCY)
+        threading.Thread(
+            target=self.loop.run_forever, name="async-delivery", daemon=True
+        ).start()
+
+    def run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+
+def _get_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = _Engine()
+    return _engine
+
+
+class AsyncDeliveryConnection:
+    # Тот же интерфейс, что и у smtp.DeliveryConnection, но пачка писем
+    # отправляется конкурентно через несколько SMTP-сессий
+    def __init__(self, concurrency=None):
+        self.concurrency = (
+            concurrency or settings.MAILING_ASYNC_CONCURRENCY_PER_NEWSLETTER
+        )
+
+    def send_messages(self, messages, should_stop=None):
+        envelopes = []
+        for message in messages:
+            encoding = message.encoding or settings.DEFAULT_CHARSET
+            envelopes.append(
+                (
+                    encode_address(message.from_email, encoding),
+                    [
+                        encode_address(address, encoding)
+                        for address in message.recipients()
+                    ],
+                    message.message().as_bytes(linesep="\r\n"),
+                )
+            )
+        engine = _get_engine()
+        results = engine.run(self._send_all(engine.pool, envelopes, should_stop))
+        # Письма стартуют по порядку, поэтому пропущенные после команды
+        # остановки образуют хвост списка
+        if _SKIPPED in results:
+            results = results[: results.index(_SKIPPED)]
+        return results
+
+    async def _send_all(self, pool, envelopes, should_stop):
+        limit = asyncio.Semaphore(self.concurrency)
+
+        async def send(envelope):
+            async with limit:
+                if should_stop is not None and should_stop():
+                    return _SKIPPED
+                try:
+                    await pool.send(*envelope)
+                except Exception as e:
+                    return e
+                return None
+
+        return await asyncio.gather(*(send(envelope) for envelope in envelopes))
+
+    def close(self):
+        pass
@@ -0,0 +1,58 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# Разделы данных владельца. Версия раздела увеличивается сигналами при
+# изменении моделей (mailing.signals), поэтому закэшированные по старой
+# версии списки просто перестают читаться и истекают сами
+MESSAGES = "messages"
+RECIPIENTS = "recipients"
+NEWSLETTERS = "newsletters"
+SEGMENTS = "segments"
+STATISTICS = "statistics"
+
+
+def _version_key(owner_id, section):
+    return f"mailing:owner:{owner_id}:{section}:version"
+
+
+def get_version(owner_id, section):
+    key = _version_key(owner_id, section)
+    version = cache.get(key)
+    if version is None:
+        # Если счётчик вытеснен из кэша, новая версия не должна совпасть
+        # ни с одной из прежних, поэтому начинаем с текущего времени
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def _bump(owner_id, sections):
+    for section in sections:
+        key = _version_key(owner_id, section)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def bump_version(owner_id, *sections):
+    # После фиксации транзакции: иначе параллельный запрос успеет
+    # закэшировать старые данные уже под новой версией
+    transaction.on_commit(lambda: _bump(owner_id, sections))
+
+
+def get_versions(owner_id, *sections):
+    # Версии для ключей {% cache %} во фрагментах шаблонов
+    return {section: get_version(owner_id, section) for section in sections}
+
+
+def get_cached(owner_id, section, name, builder):
+    key = f"mailing:owner:{owner_id}:{section}:{get_version(owner_id, section)}:{name}"
+    value = cache.get(key)
+    if value is None:
+        value = builder()
+        cache.set(key, value, settings.MAILING_OWNER_CACHE_TIMEOUT)
+    return value
@@ -0,0 +1,26 @@
+from django_redis.client import DefaultClient
+
+from .profiling import cache_hit, cache_miss
+
+_MISSING = object()
+
+
+class ProfiledRedisClient(DefaultClient):
+    # Клиент django-redis, сообщающий о попаданиях и промахах кэша
+    # сигналами cache_hit/cache_miss (их считает ProfilingMiddleware)
+    def get(self, key, default=None, version=None, client=None):
+        value = super().get(key, default=_MISSING, version=version, client=client)
+        if value is _MISSING:
+            cache_miss.send(sender=self.__class__, key=key)
+            return default
+        cache_hit.send(sender=self.__class__, key=key)
+        return value
+
+    def get_many(self, keys, version=None, client=None):
+        keys = list(keys)
+        values = super().get_many(keys, version=version, client=client)
+        if values:
+            cache_hit.send(sender=self.__class__, count=len(values))
+        if len(keys) > len(values):
+            cache_miss.send(sender=self.__class__, count=len(keys) - len(values))
+        return values
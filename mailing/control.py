@@ -0,0 +1,152 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = "mailing:newsletter-control:"
+# Пробуждение воркеров (появились задачи в очереди) и планировщика
+QUEUE_CHANNEL = "mailing:delivery-queue"
+SCHEDULER_CHANNEL = "mailing:scheduler"
+
+_monitor = None
+_monitor_lock = threading.Lock()
+
+
+def get_redis():
+    # Прямое соединение с Redis из настроек кэша, None для других бэкендов
+    try:
+        from django_redis import get_redis_connection
+
+        return get_redis_connection("default")
+    except (ImportError, NotImplementedError):
+        return None
+
+
+def publish_command(newsletter_id, command):
+    # command: "pause" или "stop"; статус в БД уже должен быть обновлён
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        client.publish(f"{CHANNEL_PREFIX}{newsletter_id}", command)
+    except Exception:
+        # Воркер всё равно заметит новый статус в начале следующего раунда
+        logger.warning(
+            f"Не удалось отправить команду {command} рассылке {newsletter_id}",
+            exc_info=True,
+        )
+
+
+def notify(channel):
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        client.publish(channel, "wakeup")
+    except Exception:
+        logger.warning(f"Не удалось отправить уведомление в {channel}", exc_info=True)
+
+
+class Wakeup:
+    # Ожидание с таймаутом, которое прерывается уведомлением notify(channel)
+    def __init__(self, channel):
+        self._pubsub = None
+        client = get_redis()
+        if client is not None:
+            self._pubsub = client.pubsub(ignore_subscribe_messages=True)
+            self._pubsub.subscribe(channel)
+
+    def wait(self, timeout):
+        if timeout <= 0:
+            return
+        if self._pubsub is None:
+            time.sleep(timeout)
+            return
+        try:
+            self._pubsub.get_message(timeout=timeout)
+        except Exception:
+            logger.warning("Ошибка ожидания уведомления", exc_info=True)
+            time.sleep(timeout)
+
+
+class _Monitor:
+    # Один подписчик на процесс: выставляет Event рассылки, получив команду
+    def __init__(self):
+        self._events = {}
+        client = get_redis()
+        if client is not None:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.psubscribe(**{f"{CHANNEL_PREFIX}*": self._on_message})
+            pubsub.run_in_thread(
+                sleep_time=1, daemon=True, exception_handler=self._on_error
+            )
+        else:
+            threading.Thread(target=self._poll_database, daemon=True).start()
+
+    def watch(self, newsletter_id):
+        event = threading.Event()
+        self._events[newsletter_id] = event
+        return event
+
+    def unwatch(self, newsletter_id):
+        self._events.pop(newsletter_id, None)
+
+    def _on_message(self, message):
+        channel = message["channel"]
+        if isinstance(channel, bytes):
+            channel = channel.decode()
+        event = self._events.get(int(channel.rsplit(":", 1)[1]))
+        if event is not None:
+            event.set()
+
+    @staticmethod
+    def _on_error(error, pubsub, thread):
+        logger.warning(f"Ошибка канала управления рассылками: {error}")
+        time.sleep(1)
+
+    def _poll_database(self):
+        from .models import Newsletter
+
+        while True:
+            time.sleep(settings.MAILING_CONTROL_POLL_INTERVAL)
+            ids = list(self._events)
+            if not ids:
+                continue
+            try:
+                stopped = (
+                    Newsletter.objects.filter(pk__in=ids)
+                    .exclude(status="Запущена")
+                    .values_list("pk", flat=True)
+                )
+                for pk in stopped:
+                    event = self._events.get(pk)
+                    if event is not None:
+                        event.set()
+            except Exception:
+                logger.warning("Ошибка проверки статусов рассылок", exc_info=True)
+            finally:
+                close_old_connections()
+
+
+def _get_monitor():
+    global _monitor
+    with _monitor_lock:
+        if _monitor is None:
+            _monitor = _Monitor()
+    return _monitor
+
+
+@contextmanager
+def watch_newsletter(newsletter_id):
+    # Event выставляется, когда рассылку приостановили или остановили
+    monitor = _get_monitor()
+    event = monitor.watch(newsletter_id)
+    try:
+        yield event
+    finally:
+        monitor.unwatch(newsletter_id)
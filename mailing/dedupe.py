@@ -0,0 +1,94 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, Count, Min, Value, When
+from django.db.models.functions import Lower
+
+from .models import Recipient
+
+MERGE_BATCH_SIZE = 500  # групп дубликатов на транзакцию
+
+
+def merge_duplicate_recipients(owner_id=None, batch_size=None):
+    # Схлопывает получателей владельца с одинаковым email (без учёта
+    # регистра) в самого раннего. Попытки и связи многие-ко-многим
+    # переносятся пакетными запросами; связи берутся из метаданных модели,
+    # поэтому новые ссылки на Recipient учитываются сами.
+    # Возвращает {owner_id: число удалённых дубликатов}
+    relations = Recipient._meta.related_objects
+    batch_size = batch_size or MERGE_BATCH_SIZE
+
+    recipients = Recipient.objects.annotate(email_key=Lower("email"))
+    if owner_id is not None:
+        recipients = recipients.filter(owner_id=owner_id)
+    groups = list(
+        recipients.order_by()
+        .values("owner_id", "email_key")
+        .annotate(keep_id=Min("id"), copies=Count("id"))
+        .filter(copies__gt=1)
+        .values_list("owner_id", "email_key", "keep_id")
+    )
+
+    merged = Counter()
+    for start in range(0, len(groups), batch_size):
+        keep = {
+            (owner, key): pk for owner, key, pk in groups[start : start + batch_size]
+        }
+        with transaction.atomic():
+            rows = recipients.filter(
+                owner_id__in={owner for owner, _ in keep},
+                email_key__in={key for _, key in keep},
+            ).values_list("id", "owner_id", "email_key")
+            # {id дубликата: id оставляемого получателя}
+            replacement = {}
+            for pk, owner, key in rows:
+                target = keep.get((owner, key))
+                if target is not None and target != pk:
+                    replacement[pk] = target
+                    merged[owner] += 1
+
+            for relation in relations:
+                if relation.many_to_many:
+                    _move_links(relation, replacement)
+                else:
+                    _move_references(relation, replacement)
+            # Ссылок на дубликаты уже нет, поэтому удаляем без сигналов:
+            # иначе каждый получатель пересчитывал бы статистику владельца.
+            # Её пересчитывает команда merge_recipients
+            duplicates = Recipient.objects.filter(id__in=list(replacement))
+            duplicates._raw_delete(duplicates.db)
+    return dict(merged)
+
+
+def _move_references(relation, replacement):
+    # Один UPDATE ... CASE на порцию вместо запроса на каждый дубликат
+    column = relation.field.attname
+    relation.related_model.objects.filter(
+        **{f"{column}__in": list(replacement)}
+    ).update(
+        **{
+            column: Case(
+                *(
+                    When(**{column: old}, then=Value(new))
+                    for old, new in replacement.items()
+                )
+            )
+        }
+    )
+
+
+def _move_links(relation, replacement):
+    # Связь переносится на оставляемого получателя; если она у него уже
+    # есть, ignore_conflicts пропускает повтор
+    through = relation.through
+    source = f"{relation.field.m2m_field_name()}_id"
+    target = f"{relation.field.m2m_reverse_field_name()}_id"
+    links = through.objects.filter(**{f"{target}__in": list(replacement)})
+    through.objects.bulk_create(
+        [
+            through(**{source: source_id, target: replacement[old]})
+            for source_id, old in links.values_list(source, target)
+        ],
+        ignore_conflicts=True,
+    )
+    links.delete()
@@ -0,0 +1,531 @@
+import itertools
+import logging
+import time
+from collections import Counter, defaultdict, namedtuple
+from datetime import timedelta
+from operator import attrgetter
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from .control import QUEUE_CHANNEL, SCHEDULER_CHANNEL, notify, watch_newsletter
+from .models import Attempt, DeliveryJob, Newsletter, Recipient
+from .rendering import PreparedEmailMessage, get_prepared_message
+from .responses import intern_response
+from .smtp import get_delivery_connection
+from .statistics import record_attempts
+from .suppression import not_suppressed, permanent_failure, suppress_addresses
+from .throttling import pause_domain, take_tokens, temporary_failure
+
+logger = logging.getLogger(__name__)
+
+
+RoundResult = namedtuple(
+    "RoundResult", ["sent", "last_recipient_id", "stopped", "deferred_ids"]
+)
+_NOT_SENT = object()
+
+
+def enqueue_newsletter(newsletter):
+    # Одна задача на рассылку. Выполняющуюся задачу не трогаем: по окончании
+    # раунда воркер сам вернёт её в очередь, если рассылка всё ещё запущена.
+    # Курсор last_recipient_id сохраняется, поэтому возобновлённая рассылка
+    # продолжает раунд с места остановки
+    run_after = max(newsletter.start_time, timezone.now())
+    status = _job_status_for(run_after)
+    updated = (
+        DeliveryJob.objects.filter(newsletter=newsletter)
+        .exclude(status="Выполняется")
+        .update(
+            status=status,
+            run_after=run_after,
+            worker="",
+            locked_at=None,
+            last_error="",
+        )
+    )
+    if not updated:
+        DeliveryJob.objects.get_or_create(
+            newsletter=newsletter, defaults={"status": status, "run_after": run_after}
+        )
+    _notify_for(status)
+    return run_after
+
+
+def _job_status_for(run_after):
+    # Задачи на будущее ждут планировщика, остальные сразу идут воркерам
+    return "Запланирована" if run_after > timezone.now() else "В очереди"
+
+
+def _notify_for(status):
+    notify(SCHEDULER_CHANNEL if status == "Запланирована" else QUEUE_CHANNEL)
+
+
+def claim_jobs(worker, limit):
+    now = timezone.now()
+    stale_before = now - timedelta(seconds=settings.MAILING_JOB_LOCK_TIMEOUT)
+
+    with transaction.atomic():
+        # skip_locked позволяет нескольким воркерам разбирать очередь параллельно
+        jobs = list(
+            DeliveryJob.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status="В очереди")
+                | Q(status="Выполняется", locked_at__lt=stale_before)
+            )
+            .order_by("run_after")[:limit]
+        )
+        if jobs:
+            DeliveryJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+                status="Выполняется", worker=worker, locked_at=now
+            )
+    return jobs
+
+
+def claim_job(newsletter, worker):
+    # Захват задачи одной рассылки вне очереди (команда send_newsletter).
+    # Задачу, которую держит воркер со свежей блокировкой, захватить нельзя:
+    # UPDATE с условием атомарен относительно claim_jobs(). Возвращает
+    # захваченную задачу или None
+    now = timezone.now()
+    stale_before = now - timedelta(seconds=settings.MAILING_JOB_LOCK_TIMEOUT)
+    DeliveryJob.objects.get_or_create(newsletter=newsletter)
+    claimed = (
+        DeliveryJob.objects.filter(newsletter=newsletter)
+        .exclude(status="Выполняется", locked_at__gte=stale_before)
+        .update(status="Выполняется", worker=worker, locked_at=now)
+    )
+    if not claimed:
+        return None
+    return DeliveryJob.objects.get(newsletter=newsletter)
+
+
+def release_job(job, result):
+    # Освобождение задачи после раунда вне очереди: курсор прерванного
+    # раунда сохраняется, пройденный раунд закрывается
+    if result.stopped:
+        save_cursor(job, result)
+    else:
+        complete_round(job)
+    _finish_job(job)
+
+
+def fail_job(job, error):
+    # Курсор уже сохранён вместе с последней пачкой попыток
+    DeliveryJob.objects.filter(pk=job.pk).update(
+        status="Ошибка", last_error=str(error), worker="", locked_at=None
+    )
+
+
+def run_job(job, engine=None):
+    # Подписываемся на команды до проверки статуса, чтобы не пропустить паузу
+    with watch_newsletter(job.newsletter_id) as stop_requested:
+        newsletter = Newsletter.objects.select_related("message", "segment").get(
+            pk=job.newsletter_id
+        )
+
+        if newsletter.status != "Запущена":
+            _finish_job(job)
+            return
+
+        end_time = newsletter.end_time
+        if end_time.tzinfo is None:
+            end_time = timezone.make_aware(end_time)
+
+        if timezone.now() >= end_time:
+            newsletter.status = "Завершена"
+            newsletter.save()
+            _finish_job(job)
+            return
+
+        try:
+            result = send_newsletter_round(
+                newsletter,
+                get_delivery_connection(engine),
+                should_stop=stop_requested.is_set,
+                job=job,
+            )
+        except Exception as e:
+            logger.exception(f"Ошибка доставки рассылки {newsletter.id}")
+            fail_job(job, e)
+            return
+
+    newsletter.refresh_from_db(fields=["status"])
+    if result.stopped:
+        # Раунд прерван командой: запоминаем, докуда дошли
+        save_cursor(job, result)
+        if newsletter.status == "Запущена":
+            # Рассылку успели возобновить, пока воркер дорабатывал пачку
+            _requeue_job(job, timezone.now())
+        else:
+            _finish_job(job)
+        return
+
+    complete_round(job)
+    if newsletter.status != "Запущена":
+        _finish_job(job)
+        return
+
+    # Следующий раунд ставится в очередь вместо sleep() в потоке;
+    # последний запуск приходится ровно на end_time и завершает рассылку
+    next_run = min(
+        timezone.now() + timedelta(seconds=settings.MAILING_DELIVERY_INTERVAL),
+        end_time,
+    )
+    _requeue_job(job, next_run)
+
+
+def complete_round(job):
+    # Раунд пройден целиком: следующий начнётся с первого получателя
+    _this_round(job).update(
+        round_number=F("round_number") + 1,
+        last_recipient_id=None,
+        deferred_recipient_ids=[],
+    )
+
+
+def restart_round(newsletter):
+    # Рассылку изменили (сообщение, сегмент, сроки): следующий запуск
+    # начинается с первого получателя. Номер раунда меняется, поэтому воркер,
+    # ещё отправляющий прежний раунд, не перезапишет курсор
+    DeliveryJob.objects.filter(newsletter=newsletter).update(
+        round_number=F("round_number") + 1,
+        last_recipient_id=None,
+        deferred_recipient_ids=[],
+    )
+
+
+def save_cursor(job, result):
+    _this_round(job).update(
+        last_recipient_id=result.last_recipient_id,
+        deferred_recipient_ids=result.deferred_ids,
+    )
+
+
+def _this_round(job):
+    # Курсор пишется только в раунд, который выполняет воркер: после
+    # restart_round() его запись пропускается
+    return DeliveryJob.objects.filter(pk=job.pk, round_number=job.round_number)
+
+
+def _requeue_job(job, run_after, **fields):
+    status = _job_status_for(run_after)
+    DeliveryJob.objects.filter(pk=job.pk).update(
+        status=status, run_after=run_after, worker="", locked_at=None, **fields
+    )
+    if status == "В очереди":
+        _notify_for(status)
+
+
+def _finish_job(job, **fields):
+    DeliveryJob.objects.filter(pk=job.pk).update(
+        status="Выполнена", worker="", locked_at=None, **fields
+    )
+
+
+class AttemptBuffer:
+    # Копит попытки и пишет их одним bulk_create по размеру пачки или по времени.
+    # Сброс происходит только в checkpoint(), когда все получатели до курсора
+    # обработаны или отложены, и курсор задачи вместе со списком отложенных
+    # обновляется в той же транзакции, что и попытки.
+    # При выходе из with остаток сохраняется. Если выход вызван исключением,
+    # сохраняются только попытки до последнего checkpoint(): получатели
+    # после курсора будут обработаны заново при продолжении раунда, и их
+    # попытки иначе записались бы дважды
+    def __init__(self, job=None, batch_size=None, flush_interval=None):
+        self.job = job
+        self.batch_size = batch_size or settings.MAILING_ATTEMPT_BATCH_SIZE
+        self.flush_interval = flush_interval or settings.MAILING_ATTEMPT_FLUSH_INTERVAL
+        self._attempts = []
+        self._checkpointed = 0  # попыток, добавленных до последнего checkpoint()
+        self._cursor = None
+        self._deferred = []
+        self._flushed_at = self._locked_at = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            del self._attempts[self._checkpointed :]
+        self.flush()
+
+    def add(self, attempt):
+        self._attempts.append(attempt)
+
+    def checkpoint(self, recipient_id, deferred_ids=()):
+        self._cursor = recipient_id
+        self._deferred = list(deferred_ids)
+        self._checkpointed = len(self._attempts)
+        if (
+            len(self._attempts) >= self.batch_size
+            or time.monotonic() - self._flushed_at >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self):
+        if self._attempts:
+            with transaction.atomic():
+                Attempt.objects.bulk_create(self._attempts)
+                self._record_statistics()
+                if self.job is not None and self._cursor is not None:
+                    _this_round(self.job).update(
+                        last_recipient_id=self._cursor,
+                        deferred_recipient_ids=self._deferred,
+                    )
+            self._attempts = []
+            self._checkpointed = 0
+        self._flushed_at = time.monotonic()
+        self.heartbeat()
+
+    def heartbeat(self):
+        # Продление блокировки долгого раунда, в том числе пока он только
+        # ждёт токенов и попыток не пишет. Иначе через MAILING_JOB_LOCK_TIMEOUT
+        # задачу захватил бы другой воркер
+        if (
+            self.job is not None
+            and time.monotonic() - self._locked_at >= self.flush_interval
+        ):
+            DeliveryJob.objects.filter(pk=self.job.pk).update(locked_at=timezone.now())
+            self._locked_at = time.monotonic()
+
+    def _record_statistics(self):
+        counts = defaultdict(lambda: [0, 0])
+        for attempt in self._attempts:
+            counts[attempt.newsletter.owner_id][
+                attempt.status != Attempt.Status.SUCCESS
+            ] += 1
+        for owner_id, (successful, unsuccessful) in counts.items():
+            record_attempts(owner_id, successful, unsuccessful)
+
+
+def iter_recipients(newsletter, after_id=None, chunk_size=None):
+    # Сегмент рассылки раскрывается только здесь, при отправке. Получатели
+    # читаются порциями по первичному ключу (keyset), а не одним запросом,
+    # поэтому память не растёт с размером аудитории. Повторяющиеся адреса
+    # (без учёта регистра) пропускаются: письмо уходит только первому из них.
+    # Некорректные и заблокированные после постоянного отказа адреса
+    # отсекаются тем же запросом порции
+    segment = newsletter.segment
+    if segment is None:
+        return
+    chunk_size = chunk_size or settings.MAILING_RECIPIENT_CHUNK_SIZE
+    queryset = _segment_recipients(segment).order_by("id")
+    while True:
+        chunk = queryset if after_id is None else queryset.filter(id__gt=after_id)
+        chunk = list(chunk[:chunk_size])
+        if not chunk:
+            return
+        # В первой порции раньше встречаться было негде
+        seen = set() if after_id is None else _earlier_addresses(segment, chunk)
+        for recipient in chunk:
+            if recipient.email_key not in seen:
+                seen.add(recipient.email_key)
+                yield recipient
+        if len(chunk) < chunk_size:
+            return
+        after_id = chunk[-1].id
+
+
+def _segment_recipients(segment):
+    return (
+        segment.members()
+        .only("id", "email", "full_name", "comment", "validation_status")
+        .annotate(email_key=Lower("email"))
+        .exclude(validation_status=Recipient.Validation.INVALID)
+        .filter(not_suppressed())
+    )
+
+
+def _earlier_addresses(segment, chunk):
+    # Адреса порции, которые уже встречались раньше в сегменте. Запрос идёт
+    # от индекса (lower(email), owner) и проверяет членство для каждого
+    # найденного адреса, поэтому его цена зависит от размера порции, а не
+    # от размера аудитории
+    return set(
+        Recipient.objects.annotate(email_key=Lower("email"))
+        .filter(
+            segment.membership(),
+            id__lt=chunk[0].id,
+            email_key__in={recipient.email_key for recipient in chunk},
+        )
+        .values_list("email_key", flat=True)
+    )
+
+
+def send_newsletter_round(newsletter, connection=None, should_stop=None, job=None):
+    # Если передана задача, раунд продолжается с её курсора и сохраняет его.
+    # Получатели доменов, исчерпавших лимит отправки (mailing.throttling),
+    # откладываются, а письма в другие домены продолжают уходить. Курсор
+    # означает «все получатели до него обработаны, кроме отложенных».
+    # Отложенных набирается не больше MAILING_DEFERRED_LIMIT, затем раунд
+    # ждёт токенов для них
+    connection = connection or get_delivery_connection()
+    batch_size = settings.MAILING_SMTP_BATCH_SIZE
+    deferred_limit = settings.MAILING_DEFERRED_LIMIT
+    sent = 0
+    last_recipient_id = job.last_recipient_id if job is not None else None
+    deferred = _deferred_recipients(newsletter, job)
+    recipients = iter_recipients(newsletter, last_recipient_id)
+    exhausted = False
+    retries = Counter()  # {id получателя: повторов после временного отказа}
+
+    with AttemptBuffer(job) as attempts:
+        while True:
+            if should_stop is not None and should_stop():
+                return RoundResult(sent, last_recipient_id, True, _ids(deferred))
+
+            batch = []
+            if not exhausted and len(deferred) < deferred_limit:
+                batch = list(itertools.islice(recipients, batch_size))
+                exhausted = len(batch) < batch_size
+            if batch:
+                last_recipient_id = batch[-1].id
+            elif not deferred:
+                return RoundResult(sent, None, False, [])
+
+            batch_sent, deferred, wait, stopped = _send_batch(
+                newsletter, deferred + batch, connection, attempts, retries, should_stop
+            )
+            sent += batch_sent
+            attempts.checkpoint(last_recipient_id, _ids(deferred))
+            if stopped:
+                return RoundResult(sent, last_recipient_id, True, _ids(deferred))
+            if wait and (exhausted or len(deferred) >= deferred_limit):
+                # Брать новых получателей нельзя: ждём токенов отложенных доменов
+                attempts.heartbeat()
+                time.sleep(min(wait, settings.MAILING_CONTROL_POLL_INTERVAL))
+
+
+def _deferred_recipients(newsletter, job):
+    # Отложенные при прошлом запуске раунда получатели отправляются первыми
+    if job is None or not job.deferred_recipient_ids or newsletter.segment is None:
+        return []
+    return list(
+        _segment_recipients(newsletter.segment).filter(
+            id__in=job.deferred_recipient_ids
+        )
+    )
+
+
+def _ids(recipients):
+    return [recipient.id for recipient in recipients]
+
+
+def _domain(recipient):
+    return recipient.email_key.rpartition("@")[2]
+
+
+def _send_batch(
+    newsletter, recipients, connection, attempts, retries, should_stop=None
+):
+    # Пачка группируется по доменам, и каждый домен получает столько писем,
+    # сколько ему разрешают лимиты. Возвращает (отправлено, отложенные
+    # получатели, секунд до ближайшего токена для них, прервано ли командой)
+    prepared = get_prepared_message(newsletter.message)
+    checked = defaultdict(list)  # {статус проверки: [id получателей]}
+    by_domain = defaultdict(list)
+    for recipient in recipients:
+        if recipient.validation_status == Recipient.Validation.UNKNOWN:
+            recipient.validation_status = _check_address(recipient.email)
+            checked[recipient.validation_status].append(recipient.id)
+        if recipient.validation_status == Recipient.Validation.INVALID:
+            _add_attempt(
+                attempts,
+                newsletter,
+                recipient,
+                Attempt.Status.FAILURE,
+                "Некорректный адрес электронной почты",
+            )
+            continue
+        by_domain[_domain(recipient)].append(recipient)
+    for status, ids in checked.items():
+        Recipient.objects.filter(id__in=ids).update(validation_status=status)
+
+    plan = []
+    deferred = []
+    waits = []
+    if by_domain:
+        tokens = take_tokens(
+            {domain: len(group) for domain, group in by_domain.items()}
+        )
+        for domain, (granted, wait) in tokens.items():
+            group = by_domain[domain]
+            plan += group[:granted]
+            if granted < len(group):
+                deferred += group[granted:]
+                waits.append(wait)
+    plan.sort(key=attrgetter("id"))
+
+    messages = []
+    for recipient in plan:
+        context = None
+        if prepared.is_personalised:
+            context = {
+                "full_name": recipient.full_name,
+                "comment": recipient.comment,
+                "email": recipient.email,
+            }
+        messages.append(PreparedEmailMessage(prepared, recipient.email, context))
+    # Список ошибок короче списка писем, если отправку прервали командой
+    errors = iter(connection.send_messages(messages, should_stop) if messages else ())
+
+    sent = 0
+    stopped = False
+    bounces = {}
+    paused = set()
+    for index, recipient in enumerate(plan):
+        error = next(errors, _NOT_SENT)
+        if error is _NOT_SENT:
+            # Неотправленные письма остаются за отложенными получателями
+            deferred += plan[index:]
+            stopped = True
+            break
+        if error is None:
+            sent += 1
+            status, response = Attempt.Status.SUCCESS, "Сообщение отправлено"
+        elif (
+            temporary_failure(error)
+            and retries[recipient.id] < settings.MAILING_TEMPORARY_FAILURE_RETRIES
+        ):
+            # Сервер просит повторить позже: домен ставится на паузу,
+            # а письмо уходит повторно без записи неудачной попытки
+            retries[recipient.id] += 1
+            domain = _domain(recipient)
+            if domain not in paused:
+                pause_domain(domain)
+                paused.add(domain)
+            deferred.append(recipient)
+            continue
+        else:
+            status, response = Attempt.Status.FAILURE, str(error)
+            code = permanent_failure(error)
+            if code is not None:
+                bounces[recipient.email_key] = (code, response)
+        _add_attempt(attempts, newsletter, recipient, status, response)
+    suppress_addresses(bounces)
+    return sent, deferred, min(waits, default=0), stopped
+
+
+def _add_attempt(attempts, newsletter, recipient, status, response):
+    attempts.add(
+        Attempt(
+            newsletter=newsletter,
+            recipient=recipient,
+            status=status,
+            response_id=intern_response(response),
+        )
+    )
+
+
+def _check_address(email):
+    try:
+        validate_email(email)
+    except ValidationError:
+        return Recipient.Validation.INVALID
+    return Recipient.Validation.VALID
@@ -0,0 +1,120 @@
+import csv
+import json
+import zlib
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Attempt
+
+EXPORT_FIELDS = [
+    "id",
+    "newsletter_id",
+    "recipient_email",
+    "attempt_time",
+    "status",
+    "server_response",
+]
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+}
+
+
+def parse_moment(value):
+    # None, если значение не задано; ValueError, если его не удалось разобрать
+    if not value:
+        return None
+    moment = parse_datetime(value)
+    if moment is None:
+        raise ValueError(f"Некорректная дата: {value}")
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def export_rows(newsletter_id=None, owner_id=None, since=None, until=None):
+    # Кортежи вместо моделей и серверный курсор через iterator(): в памяти
+    # держится только одна порция строк независимо от объёма журнала
+    queryset = Attempt.objects.all()
+    if newsletter_id is not None:
+        queryset = queryset.filter(newsletter_id=newsletter_id)
+    if owner_id is not None:
+        queryset = queryset.filter(newsletter__owner_id=owner_id)
+    if since is not None:
+        queryset = queryset.filter(attempt_time__gte=since)
+    if until is not None:
+        queryset = queryset.filter(attempt_time__lt=until)
+    return (
+        queryset.order_by("id")
+        .values_list(
+            "id",
+            "newsletter_id",
+            "recipient__email",
+            "attempt_time",
+            "status",
+            "response__text",
+        )
+        .iterator(chunk_size=settings.MAILING_EXPORT_CHUNK_SIZE)
+    )
+
+
+class _Buffer:
+    # Файловый объект для csv.writer: строки копятся до выдачи порции,
+    # чтобы ответ состоял из крупных блоков, а не из строки на итерацию
+    def __init__(self):
+        self.parts = []
+
+    def write(self, value):
+        self.parts.append(value)
+
+    def pop(self):
+        data = "".join(self.parts).encode()
+        self.parts = []
+        return data
+
+
+def _format(row):
+    return row[:3] + (row[3].isoformat(), Attempt.Status(row[4]).label, row[5])
+
+
+def iter_csv(rows):
+    chunk_size = settings.MAILING_EXPORT_CHUNK_SIZE
+    buffer = _Buffer()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for count, row in enumerate(rows, 1):
+        writer.writerow(_format(row))
+        if count % chunk_size == 0:
+            yield buffer.pop()
+    yield buffer.pop()
+
+
+def iter_jsonl(rows):
+    chunk_size = settings.MAILING_EXPORT_CHUNK_SIZE
+    buffer = _Buffer()
+    for count, row in enumerate(rows, 1):
+        buffer.write(
+            json.dumps(dict(zip(EXPORT_FIELDS, _format(row))), ensure_ascii=False)
+        )
+        buffer.write("\n")
+        if count % chunk_size == 0:
+            yield buffer.pop()
+    yield buffer.pop()
+
+
+def gzip_chunks(chunks):
+    # wbits=31: формат gzip, сжатие на лету по мере выдачи порций
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_attempts(export_format, compress=False, **filters):
+    rows = export_rows(**filters)
+    chunks = iter_csv(rows) if export_format == "csv" else iter_jsonl(rows)
+    return gzip_chunks(chunks) if compress else chunks
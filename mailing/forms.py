@@ -1,5 +1,8 @@
 from django import forms
-from .models import Recipient, Message, Newsletter
+from django.db.models import Value
+from django.db.models.functions import Lower
+
+from .models import Recipient, Message, Newsletter, Segment
 
 
 class RecipientForm(forms.ModelForm):
@@ -23,6 +26,67 @@ class RecipientForm(forms.ModelForm):
             ),
         }
 
+    def clean_email(self):
+        # Владельца нет среди полей формы, поэтому уникальное ограничение
+        # Recipient проверяется здесь, а не в ModelForm
+        email = self.cleaned_data["email"]
+        duplicates = (
+            Recipient.objects.annotate(email_key=Lower("email"))
+            .filter(owner_id=self.instance.owner_id, email_key=Lower(Value(email)))
+            .exclude(pk=self.instance.pk)
+        )
+        if duplicates.exists():
+            raise forms.ValidationError("Получатель с таким email уже есть.")
+        # Адрес прошёл проверку EmailField, при отправке его можно не проверять
+        self.instance.validation_status = Recipient.Validation.VALID
+        return email
+
+
+class RecipientImportForm(forms.Form):
+    file = forms.FileField(
+        label="CSV-файл",
+        help_text="Первая строка — заголовок со столбцами email, full_name, comment",
+        widget=forms.ClearableFileInput(
+            attrs={"class": "form-control", "accept": ".csv"}
+        ),
+    )
+    segment = forms.ModelChoiceField(
+        label="Добавить в список",
+        queryset=Segment.objects.none(),
+        required=False,
+        help_text="Все адреса файла, в том числе уже известные, попадут в список",
+        widget=forms.Select(attrs={"class": "form-control"}),
+    )
+
+    def __init__(self, user, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["segment"].queryset = Segment.objects.filter(
+            owner=user, kind="Список"
+        )
+
+
+class SegmentForm(forms.ModelForm):
+    class Meta:
+        model = Segment
+        fields = ["name", "kind", "email_domain", "comment_contains"]
+        labels = {
+            "name": "Название",
+            "kind": "Тип",
+            "email_domain": "Домен email",
+            "comment_contains": "Комментарий содержит",
+        }
+        help_texts = {
+            "kind": "Список заполняется импортом CSV, фильтр выбирает получателей "
+            "при каждой отправке",
+            "email_domain": "Только для фильтра, например example.com",
+        }
+        widgets = {
+            "name": forms.TextInput(attrs={"class": "form-control"}),
+            "kind": forms.Select(attrs={"class": "form-control"}),
+            "email_domain": forms.TextInput(attrs={"class": "form-control"}),
+            "comment_contains": forms.TextInput(attrs={"class": "form-control"}),
+        }
+
 
 class MessageForm(forms.ModelForm):
     class Meta:
@@ -32,6 +96,10 @@ class MessageForm(forms.ModelForm):
             "subject": "Тема",
             "body": "Сообщение",
         }
+        help_texts = {
+            "body": "Можно подставить данные получателя: "
+            "{{ full_name }}, {{ comment }}, {{ email }}",
+        }
         widgets = {
             "subject": forms.TextInput(
                 attrs={"class": "form-control", "placeholder": "Введите тему сообщения"}
@@ -45,17 +113,17 @@ class MessageForm(forms.ModelForm):
 class NewsletterForm(forms.ModelForm):
     class Meta:
         model = Newsletter
-        fields = ["start_time", "end_time", "message", "recipients"]
+        fields = ["start_time", "end_time", "message", "segment"]
         widgets = {
             "start_time": forms.DateTimeInput(attrs={"type": "datetime-local"}),
             "end_time": forms.DateTimeInput(attrs={"type": "datetime-local"}),
-            "recipients": forms.CheckboxSelectMultiple(),
+            "segment": forms.Select(attrs={"class": "form-control"}),
         }
 
     def __init__(self, user, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.fields["message"].queryset = Message.objects.filter(owner=user)
-        self.fields["recipients"].queryset = Recipient.objects.filter(owner=user)
+        self.fields["segment"].queryset = Segment.objects.filter(owner=user)
 
     def clean(self):
         cleaned_data = super().clean()
@@ -0,0 +1,201 @@
+import csv
+import io
+import itertools
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, connection, transaction
+from django.db.models.functions import Lower
+
+from .cache import RECIPIENTS, bump_version
+from .models import Recipient
+from .statistics import refresh_newsletter_counts
+
+IMPORT_FIELDS = ["email", "full_name", "comment"]
+# Повторов порции, если её адрес одновременно добавили в другом запросе
+CONFLICT_RETRIES = 3
+
+
+class ImportResult(
+    namedtuple("ImportResult", ["rows", "created", "duplicates", "invalid", "seconds"])
+):
+    @property
+    def rate(self):
+        # Строк в секунду с начала импорта
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def read_rows(stream):
+    # Файл (бинарный поток) разбирается построчно: в памяти только текущая
+    # строка. Разделитель определяется по заголовку, чтобы принимать и
+    # выгрузки Excel с «;». Обязателен только столбец email
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    header_line = text.readline()
+    try:
+        dialect = csv.Sniffer().sniff(header_line, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(itertools.chain([header_line], text), dialect)
+    header = [name.strip().lower() for name in next(reader, [])]
+    if "email" not in header:
+        raise ValueError("В файле нет столбца email")
+    positions = [
+        header.index(field) if field in header else None for field in IMPORT_FIELDS
+    ]
+    for row in reader:
+        if not row:
+            continue
+        yield tuple(
+            (
+                row[position].strip()
+                if position is not None and position < len(row)
+                else ""
+            )
+            for position in positions
+        )
+
+
+def _is_valid(email, full_name):
+    if len(email) > Recipient._meta.get_field("email").max_length:
+        return False
+    if len(full_name) > Recipient._meta.get_field("full_name").max_length:
+        return False
+    try:
+        validate_email(email)
+    except ValidationError:
+        return False
+    return True
+
+
+def _clean_chunk(chunk):
+    # Проверка всей порции до обращения к базе. Повторы внутри порции
+    # схлопываются без учёта регистра: остаётся первая строка с адресом
+    rows = {}
+    invalid = 0
+    for email, full_name, comment in chunk:
+        if not _is_valid(email, full_name):
+            invalid += 1
+        elif email.lower() not in rows:
+            rows[email.lower()] = (email, full_name, comment)
+    return rows, invalid
+
+
+def _create_recipients(owner_id, rows):
+    Recipient.objects.bulk_create(
+        [
+            Recipient(
+                email=email,
+                full_name=full_name,
+                comment=comment,
+                owner_id=owner_id,
+                validation_status=Recipient.Validation.VALID,
+            )
+            for email, full_name, comment in rows
+        ]
+    )
+
+
+def _copy_recipients(owner_id, rows):
+    # COPY в PostgreSQL быстрее INSERT в несколько раз. QUOTE_ALL нужен,
+    # потому что в формате csv пустое значение без кавычек означает NULL
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_ALL)
+    for email, full_name, comment in rows:
+        writer.writerow(
+            (email, full_name, comment, owner_id, Recipient.Validation.VALID)
+        )
+    buffer.seek(0)
+
+    quote_name = connection.ops.quote_name
+    columns = ", ".join(
+        quote_name(Recipient._meta.get_field(field).column)
+        for field in (*IMPORT_FIELDS, "owner", "validation_status")
+    )
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {quote_name(Recipient._meta.db_table)} ({columns}) "
+            "FROM STDIN WITH (FORMAT csv)",
+            buffer,
+        )
+
+
+def _existing_keys(owner_id, cleaned):
+    return set(
+        Recipient.objects.annotate(email_key=Lower("email"))
+        .filter(owner_id=owner_id, email_key__in=list(cleaned))
+        .values_list("email_key", flat=True)
+    )
+
+
+def _import_chunk(owner_id, cleaned, insert, segment):
+    # Возвращает число созданных получателей. Если тот же адрес успели
+    # добавить между сверкой и вставкой (форма, другой импорт), уникальный
+    # индекс (lower(email), owner) отклонит вставку и откатит всю порцию
+    for attempt in range(1, CONFLICT_RETRIES + 1):
+        try:
+            with transaction.atomic():
+                existing = _existing_keys(owner_id, cleaned)
+                new_rows = [row for key, row in cleaned.items() if key not in existing]
+                if new_rows:
+                    insert(owner_id, new_rows)
+                    bump_version(owner_id, RECIPIENTS)
+                if segment is not None and cleaned:
+                    _add_to_segment(owner_id, segment, cleaned)
+        except IntegrityError:
+            # Повторная сверка уже увидит адрес как существующий
+            if attempt == CONFLICT_RETRIES:
+                raise
+        else:
+            return len(new_rows)
+
+
+def _add_to_segment(owner_id, segment, cleaned):
+    Member = segment.recipients.through
+    Member.objects.bulk_create(
+        [
+            Member(segment_id=segment.pk, recipient_id=pk)
+            for pk in Recipient.objects.annotate(email_key=Lower("email"))
+            .filter(owner_id=owner_id, email_key__in=list(cleaned))
+            .values_list("id", flat=True)
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def import_recipients(owner_id, rows, chunk_size=None, progress=None, segment=None):
+    # rows — итератор кортежей (email, full_name, comment), например read_rows().
+    # Каждая порция проверяется (созданные получатели сразу помечаются
+    # корректными), сверяется с уже существующими адресами владельца
+    # (индекс lower(email), owner) и записывается в своей транзакции,
+    # поэтому прерванный импорт можно просто запустить повторно. Порция, адрес
+    # которой одновременно добавили в другом запросе, сверяется и пишется
+    # заново (не больше CONFLICT_RETRIES раз). Если передан
+    # статический сегмент, в него добавляются все корректные адреса файла
+    chunk_size = chunk_size or settings.MAILING_IMPORT_CHUNK_SIZE
+    insert = (
+        _copy_recipients if connection.vendor == "postgresql" else _create_recipients
+    )
+    started = time.perf_counter()
+    total = created = duplicates = invalid = 0
+    result = ImportResult(0, 0, 0, 0, 0.0)
+    rows = iter(rows)
+    while chunk := list(itertools.islice(rows, chunk_size)):
+        cleaned, chunk_invalid = _clean_chunk(chunk)
+        chunk_created = _import_chunk(owner_id, cleaned, insert, segment)
+
+        total += len(chunk)
+        created += chunk_created
+        invalid += chunk_invalid
+        duplicates += len(chunk) - chunk_invalid - chunk_created
+        result = ImportResult(
+            total, created, duplicates, invalid, time.perf_counter() - started
+        )
+        if progress is not None:
+            progress(result)
+    if result.created or segment is not None:
+        # bulk_create и COPY не вызывают сигналы модели
+        refresh_newsletter_counts([owner_id])
+    return result
@@ -0,0 +1,125 @@
+import time
+import uuid
+from datetime import timedelta
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from mailing.delivery import send_newsletter_round
+from mailing.models import Message, Newsletter, Recipient, Segment
+from users.models import CustomUser
+
+
+class NullConnection:
+    # «Отправляет» письма без SMTP: замеряется только чтение получателей,
+    # подготовка писем и запись попыток
+    def send_messages(self, messages, should_stop=None):
+        for message in messages:
+            message.message()
+        return [None] * len(messages)
+
+    def close(self):
+        pass
+
+
+def peak_rss():
+    # ru_maxrss в Linux измеряется в килобайтах
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Command(BaseCommand):
+    help = "Замерить пиковую память раунда рассылки при растущем числе получателей"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--recipients",
+            type=int,
+            nargs="+",
+            default=[1_000, 10_000, 100_000],
+            help="Числа получателей, по раунду рассылки на каждое",
+        )
+
+    def handle(self, *args, **kwargs):
+        if resource is None:
+            raise CommandError("Замер памяти требует модуля resource (Linux, macOS).")
+        # В отличие от benchmark_statistics, раунд идёт не внутри общей
+        # транзакции: в ней копились бы обработчики on_commit каждой пачки
+        # попыток, и замер показал бы их, а не память доставки. Тестовый
+        # пользователь удаляется вместе с данными после замера. Лимиты
+        # отправки отключены, чтобы раунд не ждал токенов, а DEBUG — чтобы
+        # не копился журнал SQL
+        name = f"delivery-benchmark-{uuid.uuid4().hex[:8]}"
+        owner = CustomUser.objects.create(
+            email=f"{name}@example.com", username=name, is_active=False
+        )
+        try:
+            with override_settings(
+                MAILING_ACCOUNT_RATE_LIMIT=None,
+                MAILING_DOMAIN_RATE_LIMIT=None,
+                MAILING_DOMAIN_RATE_LIMITS={},
+                DEBUG=False,
+            ):
+                self.benchmark(owner, sorted(kwargs["recipients"]))
+        finally:
+            # Сегмент защищён от удаления, пока на него ссылаются рассылки
+            Newsletter.objects.filter(owner=owner).delete()
+            owner.delete()
+
+    def benchmark(self, owner, counts):
+        message = Message.objects.create(
+            owner=owner, subject="Замер доставки", body="Здравствуйте, {{ full_name }}!"
+        )
+        segment = Segment.objects.create(name="Замер доставки", owner=owner)
+        self.stdout.write(
+            f"Порция получателей: {settings.MAILING_RECIPIENT_CHUNK_SIZE}, "
+            f"исходный пиковый RSS: {peak_rss():.1f} МБ"
+        )
+
+        seeded = 0
+        for count in counts:
+            # Получатели добавляются порциями, чтобы подготовка данных
+            # сама не поднимала пиковую память
+            while seeded < count:
+                size = min(settings.MAILING_IMPORT_CHUNK_SIZE, count - seeded)
+                recipients = Recipient.objects.bulk_create(
+                    Recipient(
+                        email=f"user{seeded + i}@example.com",
+                        full_name=f"Получатель {seeded + i}",
+                        owner=owner,
+                    )
+                    for i in range(size)
+                )
+                Segment.recipients.through.objects.bulk_create(
+                    Segment.recipients.through(
+                        segment_id=segment.pk, recipient_id=recipient.pk
+                    )
+                    for recipient in recipients
+                )
+                seeded += size
+            now = timezone.now()
+            newsletter = Newsletter.objects.create(
+                start_time=now,
+                end_time=now + timedelta(days=1),
+                message=message,
+                segment=segment,
+                owner=owner,
+                status="Запущена",
+            )
+
+            before = peak_rss()
+            started = time.monotonic()
+            result = send_newsletter_round(newsletter, NullConnection())
+            elapsed = time.monotonic() - started
+            after = peak_rss()
+            self.stdout.write(
+                f"Получателей {count}: отправлено {result.sent} "
+                f"за {elapsed:.2f} с, пиковый RSS {after:.1f} МБ "
+                f"(+{after - before:.1f} МБ за раунд)"
+            )
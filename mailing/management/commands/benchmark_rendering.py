@@ -0,0 +1,87 @@
+import time
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.core.management.base import BaseCommand
+
+from mailing.rendering import CompiledTemplate, PreparedEmailMessage, PreparedMessage
+
+
+class Command(BaseCommand):
+    help = "Измерить затраты CPU на подготовку одного письма рассылки"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=2000, help="Количество писем")
+        parser.add_argument(
+            "--body-size",
+            type=int,
+            default=50_000,
+            help="Размер текста письма в символах",
+        )
+
+    def handle(self, *args, **kwargs):
+        count = kwargs["count"]
+        subject = "Ежемесячная рассылка"
+        body = (
+            "Текст рассылки для проверки производительности. "
+            * (kwargs["body_size"] // 40 + 1)
+        )[: kwargs["body_size"]]
+        recipients = [f"user{i}@example.com" for i in range(count)]
+        from_email = settings.DEFAULT_FROM_EMAIL
+
+        def build_each():
+            for to in recipients:
+                EmailMessage(subject, body, from_email, [to]).message().as_bytes(
+                    linesep="\r\n"
+                )
+
+        def build_prepared():
+            prepared = PreparedMessage(subject, body, from_email)
+            for to in recipients:
+                PreparedEmailMessage(prepared, to).message().as_bytes(linesep="\r\n")
+
+        def build_personalised():
+            prepared = PreparedMessage(
+                "{{ full_name }}, " + subject,
+                "Здравствуйте, {{ full_name }}! " + body,
+                from_email,
+            )
+            for context in contexts:
+                PreparedEmailMessage(
+                    prepared, context["email"], context
+                ).message().as_bytes(linesep="\r\n")
+
+        def render_templates():
+            template = CompiledTemplate(
+                "Здравствуйте, {{ full_name }}! {{ comment }}\n" + body[:500]
+            )
+            for _ in range(10):
+                for context in contexts:
+                    template.render(context)
+
+        contexts = [
+            {"full_name": f"Получатель {i}", "comment": "VIP", "email": to}
+            for i, to in enumerate(recipients)
+        ]
+
+        results = {}
+        for name, func in (
+            ("EmailMessage на каждого получателя", build_each),
+            ("Подготовленное письмо", build_prepared),
+            ("Подготовленное письмо с подстановкой", build_personalised),
+        ):
+            started = time.process_time()
+            func()
+            per_message = (time.process_time() - started) / count * 1_000_000
+            results[name] = per_message
+            self.stdout.write(f"{name}: {per_message:.1f} мкс CPU на письмо")
+
+        baseline, prepared, _ = results.values()
+        self.stdout.write(self.style.SUCCESS(f"Ускорение: {baseline / prepared:.1f}x"))
+
+        started = time.process_time()
+        render_templates()
+        rate = count * 10 / (time.process_time() - started)
+        self.stdout.write(
+            self.style.SUCCESS(f"Подстановок в шаблон: {rate:,.0f} в секунду на ядро")
+        )
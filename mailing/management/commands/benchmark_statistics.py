@@ -0,0 +1,129 @@
+import statistics
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from mailing.models import Attempt, Message, Newsletter, Recipient, Segment
+from mailing.responses import intern_response
+from mailing.statistics import (
+    attempt_counts,
+    get_owner_statistics,
+    newsletter_counts,
+    rebuild_owner_statistics,
+)
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = "Сравнить способы подсчёта статистики пользователя на большом числе попыток"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--attempts",
+            type=int,
+            default=1_000_000,
+            help="Сколько попыток должно быть у тестового пользователя",
+        )
+        parser.add_argument("--repeat", type=int, default=5, help="Число замеров")
+
+    def handle(self, *args, **kwargs):
+        # Тестовые данные создаются и замеряются в одной транзакции, которая
+        # всегда откатывается: в базе после команды ничего не остаётся
+        with transaction.atomic():
+            try:
+                self.benchmark(self.seed(kwargs["attempts"]), kwargs["repeat"])
+            finally:
+                transaction.set_rollback(True)
+
+    def benchmark(self, owner, repeat):
+        def separate_counts():
+            # Прежний вариант StatisticsView: шесть отдельных запросов
+            newsletters = Newsletter.objects.filter(owner=owner)
+            attempts = Attempt.objects.filter(newsletter__owner=owner)
+            newsletters.count()
+            newsletters.filter(status="Запущена").count()
+            Recipient.objects.filter(
+                segments__newsletters__in=newsletters
+            ).distinct().count()
+            attempts.count()
+            attempts.filter(status=Attempt.Status.SUCCESS).count()
+            attempts.filter(status=Attempt.Status.FAILURE).count()
+
+        def conditional_aggregation():
+            Newsletter.objects.filter(owner=owner).aggregate(**newsletter_counts())
+            Attempt.objects.filter(newsletter__owner=owner).aggregate(
+                **attempt_counts()
+            )
+
+        def rollup():
+            get_owner_statistics(owner)
+
+        for name, func in (
+            ("Отдельные COUNT", separate_counts),
+            ("Условная агрегация", conditional_aggregation),
+            ("Сводная таблица", rollup),
+        ):
+            timings = []
+            for _ in range(repeat):
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    func()
+                    timings.append((time.perf_counter() - started) * 1000)
+            self.stdout.write(
+                f"{name}: запросов {len(queries)}, "
+                f"медиана {statistics.median(timings):.1f} мс"
+            )
+
+    def seed(self, count):
+        self.stdout.write(f"Создание {count} попыток...")
+        name = f"statistics-benchmark-{uuid.uuid4().hex[:8]}"
+        owner = CustomUser.objects.create(
+            email=f"{name}@example.com", username=name, is_active=False
+        )
+        message = Message.objects.create(
+            owner=owner, subject="Замер статистики", body="Текст"
+        )
+        recipients = Recipient.objects.bulk_create(
+            Recipient(email=f"user{i}@example.com", full_name="", owner=owner)
+            for i in range(1000)
+        )
+        segment = Segment.objects.create(name="Замер статистики", owner=owner)
+        segment.recipients.set(recipients)
+        now = timezone.now()
+        newsletters = [
+            Newsletter.objects.create(
+                start_time=now,
+                end_time=now + timedelta(days=1),
+                message=message,
+                segment=segment,
+                owner=owner,
+                status="Завершена",
+            )
+            for _ in range(10)
+        ]
+
+        response_id = intern_response("Сообщение отправлено")
+        batch = []
+        for i in range(count):
+            batch.append(
+                Attempt(
+                    newsletter=newsletters[i % len(newsletters)],
+                    recipient=recipients[i % len(recipients)],
+                    status=(
+                        Attempt.Status.SUCCESS if i % 10 else Attempt.Status.FAILURE
+                    ),
+                    response_id=response_id,
+                )
+            )
+            if len(batch) == 10_000:
+                Attempt.objects.bulk_create(batch)
+                batch = []
+        Attempt.objects.bulk_create(batch)
+        # bulk_create минует счётчики сводной таблицы
+        rebuild_owner_statistics(owner.pk)
+        return owner
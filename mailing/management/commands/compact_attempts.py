@@ -0,0 +1,53 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from mailing.models import Attempt
+from mailing.retention import compact_attempts
+
+
+class Command(BaseCommand):
+    help = "Свернуть старые попытки рассылок в итоги по дням"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.MAILING_ATTEMPT_RETENTION_DAYS,
+            help="Сколько дней хранить попытки целиком",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.MAILING_COMPACTION_BATCH_SIZE,
+            help="Попыток на одну транзакцию",
+        )
+        parser.add_argument(
+            "--vacuum",
+            action="store_true",
+            help="Выполнить VACUUM ANALYZE журнала попыток (PostgreSQL)",
+        )
+
+    def handle(self, *args, **kwargs):
+        before = timezone.now() - timedelta(days=kwargs["days"])
+        started = time.monotonic()
+        compacted = compact_attempts(before, kwargs["batch_size"])
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Свёрнуто попыток старше {before:%d.%m.%Y %H:%M}: {compacted} "
+                f"за {elapsed:.1f} с"
+            )
+        )
+
+        if kwargs["vacuum"] and connection.vendor == "postgresql":
+            # Освобождает место удалённых строк для новых записей
+            # и обновляет статистику планировщика
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"VACUUM ANALYZE {connection.ops.quote_name(Attempt._meta.db_table)}"
+                )
@@ -0,0 +1,45 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mailing.export import EXPORT_FORMATS, export_attempts, parse_moment
+
+
+class Command(BaseCommand):
+    help = "Выгрузить журнал попыток рассылок в CSV или JSONL"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--newsletter", type=int, help="ID рассылки")
+        parser.add_argument("--owner", type=int, help="ID владельца рассылок")
+        parser.add_argument(
+            "--format", choices=sorted(EXPORT_FORMATS), default="csv", help="Формат"
+        )
+        parser.add_argument("--since", help="Начало периода (ISO 8601, включительно)")
+        parser.add_argument("--until", help="Конец периода (ISO 8601, не включая)")
+        parser.add_argument("--gzip", action="store_true", help="Сжать выгрузку gzip")
+        parser.add_argument(
+            "--output", help="Файл для выгрузки (по умолчанию стандартный вывод)"
+        )
+
+    def handle(self, *args, **kwargs):
+        try:
+            since = parse_moment(kwargs["since"])
+            until = parse_moment(kwargs["until"])
+        except ValueError as e:
+            raise CommandError(str(e)) from None
+
+        chunks = export_attempts(
+            kwargs["format"],
+            kwargs["gzip"],
+            newsletter_id=kwargs["newsletter"],
+            owner_id=kwargs["owner"],
+            since=since,
+            until=until,
+        )
+        output = open(kwargs["output"], "wb") if kwargs["output"] else sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+        finally:
+            if kwargs["output"]:
+                output.close()
@@ -0,0 +1,67 @@
+import csv
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mailing.imports import import_recipients, read_rows
+from mailing.models import Segment
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = "Импортировать получателей пользователя из CSV-файла"
+
+    def add_arguments(self, parser):
+        parser.add_argument("email", help="Email владельца получателей")
+        parser.add_argument("path", help="CSV-файл («-» — стандартный ввод)")
+        parser.add_argument(
+            "--segment", type=int, help="ID списка, в который добавить адреса"
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            help="Строк на транзакцию (MAILING_IMPORT_CHUNK_SIZE)",
+        )
+
+    def handle(self, *args, **kwargs):
+        try:
+            owner = CustomUser.objects.get(email=kwargs["email"])
+        except CustomUser.DoesNotExist:
+            raise CommandError(f"Пользователь {kwargs['email']} не найден") from None
+        segment = None
+        if kwargs["segment"]:
+            try:
+                segment = Segment.objects.get(
+                    pk=kwargs["segment"], owner=owner, kind="Список"
+                )
+            except Segment.DoesNotExist:
+                raise CommandError(f"Список {kwargs['segment']} не найден") from None
+
+        stream = (
+            sys.stdin.buffer if kwargs["path"] == "-" else open(kwargs["path"], "rb")
+        )
+        try:
+            result = import_recipients(
+                owner.id,
+                read_rows(stream),
+                chunk_size=kwargs["chunk_size"],
+                progress=self._progress,
+                segment=segment,
+            )
+        except (ValueError, csv.Error) as e:
+            raise CommandError(f"Не удалось прочитать файл: {e}") from None
+        finally:
+            stream.close()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Строк: {result.rows}, добавлено: {result.created}, "
+                f"повторов: {result.duplicates}, с ошибками: {result.invalid}. "
+                f"{result.seconds:.1f} с, {result.rate:.0f} строк/с"
+            )
+        )
+
+    def _progress(self, result):
+        self.stdout.write(
+            f"Обработано строк: {result.rows} ({result.rate:.0f} строк/с)"
+        )
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from mailing.cache import NEWSLETTERS, RECIPIENTS, bump_version
+from mailing.dedupe import merge_duplicate_recipients
+from mailing.statistics import rebuild_owner_statistics
+
+
+class Command(BaseCommand):
+    help = "Объединить получателей владельца с одинаковым email"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--owner", type=int, help="ID владельца (по умолчанию все)")
+        parser.add_argument(
+            "--batch-size", type=int, help="Групп дубликатов на транзакцию"
+        )
+
+    def handle(self, *args, **kwargs):
+        merged = merge_duplicate_recipients(kwargs["owner"], kwargs["batch_size"])
+        for owner_id, count in merged.items():
+            rebuild_owner_statistics(owner_id)
+            bump_version(owner_id, RECIPIENTS, NEWSLETTERS)
+            self.stdout.write(f"Владелец {owner_id}: удалено дубликатов {count}")
+        self.stdout.write(
+            self.style.SUCCESS(f"Удалено дубликатов: {sum(merged.values())}")
+        )
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from mailing.profiling import load_profiles, reset_profiles
+
+SORT_FIELDS = {
+    "db_time": "db_time_ms",
+    "queries": "queries",
+    "wall": "wall_ms",
+    "duplicates": "duplicate_queries",
+    "cache_misses": "cache_misses",
+}
+
+
+class Command(BaseCommand):
+    help = "Показать представления с наибольшей нагрузкой на базу данных"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=10, help="Число строк отчёта")
+        parser.add_argument(
+            "--sort",
+            choices=sorted(SORT_FIELDS),
+            default="db_time",
+            help="Сортировка по суммарному значению",
+        )
+        parser.add_argument(
+            "--reset", action="store_true", help="Очистить накопленные данные"
+        )
+
+    def handle(self, *args, **kwargs):
+        profiles = load_profiles()
+        if profiles is None:
+            raise CommandError("Профили хранятся в Redis, а кэш настроен без него.")
+        if kwargs["reset"]:
+            reset_profiles()
+            self.stdout.write(self.style.SUCCESS("Данные профилирования очищены"))
+            return
+        if not profiles:
+            self.stdout.write("Данных пока нет")
+            return
+
+        field = SORT_FIELDS[kwargs["sort"]]
+        rows = sorted(profiles.items(), key=lambda item: -item[1].get(field, 0))
+        self.stdout.write(
+            f"{'Представление':<32} {'запросов':>9} {'SQL/запр':>9} {'дубли':>7} "
+            f"{'БД, мс':>9} {'всего, мс':>10} {'кэш':>6}"
+        )
+        for name, totals in rows[: kwargs["top"]]:
+            requests = totals.get("requests") or 1
+            lookups = totals.get("cache_hits", 0) + totals.get("cache_misses", 0)
+            hit_rate = (
+                f"{totals.get('cache_hits', 0) / lookups:.0%}" if lookups else "—"
+            )
+            self.stdout.write(
+                f"{name:<32} {int(requests):>9} "
+                f"{totals.get('queries', 0) / requests:>9.1f} "
+                f"{totals.get('duplicate_queries', 0) / requests:>7.1f} "
+                f"{totals.get('db_time_ms', 0) / requests:>9.1f} "
+                f"{totals.get('wall_ms', 0) / requests:>10.1f} {hit_rate:>6}"
+            )
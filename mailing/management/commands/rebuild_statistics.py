@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from mailing.statistics import rebuild_owner_statistics
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = "Пересчитать сводную статистику владельцев рассылок"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--owner", type=int, help="ID пользователя (по умолчанию все)"
+        )
+
+    def handle(self, *args, **kwargs):
+        owners = CustomUser.objects.order_by("pk")
+        if kwargs["owner"]:
+            owners = owners.filter(pk=kwargs["owner"])
+
+        count = 0
+        for owner_id in owners.values_list("pk", flat=True).iterator():
+            rebuild_owner_statistics(owner_id)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Пересчитана статистика: {count}"))
@@ -0,0 +1,85 @@
+import logging
+import os
+import socket
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from mailing.control import QUEUE_CHANNEL, Wakeup
+from mailing.delivery import claim_jobs, run_job
+
+logger = logging.getLogger(__name__)
+
+
+def _run_job_in_thread(job, engine):
+    close_old_connections()
+    try:
+        run_job(job, engine)
+    finally:
+        # У каждого потока пула своё соединение с БД
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = "Запустить воркер, выполняющий рассылки из очереди"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=settings.MAILING_WORKER_THREADS,
+            help="Количество потоков доставки",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=settings.MAILING_WORKER_POLL_INTERVAL,
+            help="Пауза между опросами очереди, в секундах",
+        )
+        parser.add_argument(
+            "--engine",
+            choices=["sync", "async"],
+            default=settings.MAILING_DELIVERY_ENGINE,
+            help="Движок отправки писем",
+        )
+
+    def handle(self, *args, **kwargs):
+        threads = kwargs["threads"]
+        poll_interval = kwargs["poll_interval"]
+        engine = kwargs["engine"]
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Воркер {worker} запущен, потоков: {threads}, движок: {engine}")
+        )
+
+        wakeup = Wakeup(QUEUE_CHANNEL)
+        running = set()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            try:
+                while True:
+                    free = threads - len(running)
+                    if free > 0:
+                        for job in claim_jobs(worker, free):
+                            running.add(executor.submit(_run_job_in_thread, job, engine))
+
+                    if running:
+                        done, running = wait(
+                            running, timeout=poll_interval, return_when=FIRST_COMPLETED
+                        )
+                        for future in done:
+                            if future.exception():
+                                logger.error(
+                                    "Задача рассылки завершилась с ошибкой",
+                                    exc_info=future.exception(),
+                                )
+                    else:
+                        close_old_connections()
+                        # Планировщик будит воркеров, когда ставит задачи в очередь
+                        wakeup.wait(poll_interval)
+            except KeyboardInterrupt:
+                self.stdout.write(
+                    self.style.WARNING("Остановка воркера, ожидание текущих задач...")
+                )
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from mailing.scheduler import Scheduler
+
+
+class Command(BaseCommand):
+    help = "Запустить планировщик: запуск рассылок по start_time и завершение по end_time"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Обработать наступившие события и выйти",
+        )
+
+    def handle(self, *args, **kwargs):
+        scheduler = Scheduler()
+
+        if kwargs["once"]:
+            dispatched, finished = scheduler.run_once()
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Поставлено в очередь задач: {dispatched}, завершено рассылок: {finished}"
+                )
+            )
+            return
+
+        self.stdout.write(self.style.SUCCESS("Планировщик запущен"))
+        try:
+            scheduler.run_forever()
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING("Планировщик остановлен"))
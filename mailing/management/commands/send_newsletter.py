@@ -1,7 +1,25 @@
-from django.core.management.base import BaseCommand
-from django.core.mail import send_mail
-from mailing.models import Newsletter, Attempt
 import logging
+import os
+import socket
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from mailing.control import watch_newsletter
+from mailing.delivery import (
+    claim_job,
+    fail_job,
+    release_job,
+    send_newsletter_round,
+)
+from mailing.models import DeliveryJob, Newsletter
+from mailing.smtp import DeliveryConnection, get_delivery_connection
 
 logger = logging.getLogger(__name__)
 
@@ -11,11 +29,24 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument("newsletter_id", type=int, help="ID рассылки")
+        parser.add_argument(
+            "--no-pool",
+            action="store_true",
+            help="Открывать новое SMTP-соединение для каждого письма (для сравнения)",
+        )
+        parser.add_argument(
+            "--engine",
+            choices=["sync", "async"],
+            default=settings.MAILING_DELIVERY_ENGINE,
+            help="Движок отправки писем",
+        )
 
     def handle(self, *args, **kwargs):
         newsletter_id = kwargs["newsletter_id"]
         try:
-            newsletter = Newsletter.objects.get(id=newsletter_id)
+            newsletter = Newsletter.objects.select_related("message", "segment").get(
+                id=newsletter_id
+            )
         except Newsletter.DoesNotExist:
             self.stdout.write(self.style.ERROR("Рассылка не найдена."))
             return
@@ -24,46 +55,62 @@ class Command(BaseCommand):
             self.stdout.write(self.style.WARNING("Эту рассылку нельзя отправить."))
             return
 
+        # Задача захватывается так же, как воркером, поэтому run_delivery_worker
+        # не начнёт тот же раунд параллельно
+        job = claim_job(
+            newsletter, f"send_newsletter:{socket.gethostname()}:{os.getpid()}"
+        )
+        if job is None:
+            worker = DeliveryJob.objects.get(newsletter=newsletter).worker
+            self.stdout.write(
+                self.style.ERROR(f"Рассылку уже отправляет воркер {worker}.")
+            )
+            return
+
         # Обновляем статус на "Запущена"
         newsletter.status = "Запущена"
         newsletter.save()
 
-        recipients = newsletter.recipients.all()
-        attempts = []
-
-        for recipient in recipients:
-            try:
-                send_mail(
-                    subject=newsletter.message.subject,
-                    message=newsletter.message.body,
-                    from_email="from@example.com",  # Укажите ваш email
-                    recipient_list=[recipient.email],
-                    fail_silently=False,
-                )
-                attempts.append(
-                    Attempt(
-                        newsletter=newsletter,
-                        recipient=recipient,
-                        status="Успешно",
-                        server_response="Message sent successfully.",
-                    )
-                )
-            except Exception as e:
-                error_message = str(e)
-                logger.error(
-                    f"Ошибка отправки письма для {recipient.email}: {error_message}"
-                )
-                attempts.append(
-                    Attempt(
-                        newsletter=newsletter,
-                        recipient=recipient,
-                        status="Не успешно",
-                        server_response=error_message,
-                    )
+        # Курсор задачи позволяет продолжить прерванный запуск с места остановки
+        if job.last_recipient_id is not None:
+            self.stdout.write(
+                f"Продолжение раунда {job.round_number + 1} "
+                f"после получателя {job.last_recipient_id} "
+                f"(отложено: {len(job.deferred_recipient_ids)})"
+            )
+
+        if kwargs["engine"] == "sync":
+            connection = DeliveryConnection(pooled=not kwargs["no_pool"])
+        else:
+            connection = get_delivery_connection(kwargs["engine"])
+        started = time.monotonic()
+        try:
+            with watch_newsletter(newsletter.id) as stop_requested:
+                result = send_newsletter_round(
+                    newsletter, connection, should_stop=stop_requested.is_set, job=job
                 )
+        except BaseException as e:
+            # В том числе Ctrl+C: задача не должна остаться захваченной
+            fail_job(job, e)
+            raise
+        finally:
+            connection.close()
+        release_job(job, result)
+        elapsed = time.monotonic() - started
 
-        # Сохраняем попытки
-        Attempt.objects.bulk_create(attempts)
+        rate = result.sent / elapsed if elapsed else 0
+        self.stdout.write(
+            f"Отправлено писем: {result.sent} за {elapsed:.2f} с ({rate:.1f} писем/с)"
+        )
+
+        if resource is not None:
+            # ru_maxrss в Linux измеряется в килобайтах
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            self.stdout.write(f"Пиковое потребление памяти: {peak:.1f} МБ")
+
+        if result.stopped:
+            self.stdout.write(self.style.WARNING("Рассылка прервана командой."))
+            return
 
         newsletter.status = "Завершена"
         newsletter.save()
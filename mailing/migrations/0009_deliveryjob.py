@@ -0,0 +1,56 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:47
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0008_alter_message_options_alter_newsletter_options_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DeliveryJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("В очереди", "В очереди"),
+                            ("Выполняется", "Выполняется"),
+                            ("Выполнена", "Выполнена"),
+                            ("Ошибка", "Ошибка"),
+                        ],
+                        default="В очереди",
+                        max_length=15,
+                    ),
+                ),
+                ("run_after", models.DateTimeField(default=django.utils.timezone.now)),
+                ("worker", models.CharField(blank=True, max_length=255)),
+                ("locked_at", models.DateTimeField(blank=True, null=True)),
+                ("last_error", models.TextField(blank=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "newsletter",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="delivery_job",
+                        to="mailing.newsletter",
+                    ),
+                ),
+            ],
+        ),
+    ]
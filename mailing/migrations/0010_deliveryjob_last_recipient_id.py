@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0009_deliveryjob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="deliveryjob",
+            name="last_recipient_id",
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0010_deliveryjob_last_recipient_id"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="deliveryjob",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("Запланирована", "Запланирована"),
+                    ("В очереди", "В очереди"),
+                    ("Выполняется", "Выполняется"),
+                    ("Выполнена", "Выполнена"),
+                    ("Ошибка", "Ошибка"),
+                ],
+                default="В очереди",
+                max_length=15,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="deliveryjob",
+            index=models.Index(
+                fields=["status", "run_after"], name="mailing_del_status_78cf4d_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="newsletter",
+            index=models.Index(
+                fields=["status", "end_time"], name="mailing_new_status_72e0c1_idx"
+            ),
+        ),
+    ]
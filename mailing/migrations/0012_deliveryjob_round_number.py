@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0011_delivery_schedule_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="deliveryjob",
+            name="round_number",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0012_deliveryjob_round_number"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="message",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+    ]
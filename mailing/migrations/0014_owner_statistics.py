@@ -0,0 +1,45 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0013_message_updated_at"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OwnerStatistics",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("total_newsletters", models.PositiveIntegerField(default=0)),
+                ("active_newsletters", models.PositiveIntegerField(default=0)),
+                ("unique_recipients", models.PositiveIntegerField(default=0)),
+                ("total_attempts", models.PositiveBigIntegerField(default=0)),
+                ("successful_attempts", models.PositiveBigIntegerField(default=0)),
+                ("unsuccessful_attempts", models.PositiveBigIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "owner",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="mailing_statistics",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+    ]
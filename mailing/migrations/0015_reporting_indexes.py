@@ -0,0 +1,58 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0014_owner_statistics"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="newsletter",
+            name="mailing_new_status_72e0c1_idx",
+        ),
+        migrations.AddIndex(
+            model_name="attempt",
+            index=models.Index(
+                fields=["newsletter", "-attempt_time"],
+                name="mailing_att_newslet_a87b6f_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="attempt",
+            index=models.Index(
+                fields=["newsletter", "status"], name="mailing_att_newslet_6d24de_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="newsletter",
+            index=models.Index(
+                fields=["owner", "status"], name="mailing_new_owner_i_5daf51_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="newsletter",
+            index=models.Index(
+                fields=["status", "start_time"], name="mailing_new_status_dd2697_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="newsletter",
+            index=models.Index(
+                condition=models.Q(("status", "Запущена")),
+                fields=["end_time"],
+                name="mailing_newsletter_active_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recipient",
+            index=models.Index(
+                fields=["owner", "email"], name="mailing_rec_owner_i_ac7943_idx"
+            ),
+        ),
+    ]
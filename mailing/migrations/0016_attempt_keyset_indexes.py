@@ -0,0 +1,35 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0015_reporting_indexes"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="attempt",
+            name="mailing_att_newslet_a87b6f_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="attempt",
+            name="mailing_att_newslet_6d24de_idx",
+        ),
+        migrations.AddIndex(
+            model_name="attempt",
+            index=models.Index(
+                fields=["newsletter", "-attempt_time", "-id"],
+                name="mailing_att_newslet_ec2527_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="attempt",
+            index=models.Index(
+                fields=["newsletter", "status", "-attempt_time", "-id"],
+                name="mailing_att_newslet_6f26ac_idx",
+            ),
+        ),
+    ]
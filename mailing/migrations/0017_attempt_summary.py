@@ -0,0 +1,48 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0016_attempt_keyset_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AttemptSummary",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("total_attempts", models.PositiveIntegerField(default=0)),
+                ("successful_attempts", models.PositiveIntegerField(default=0)),
+                ("unsuccessful_attempts", models.PositiveIntegerField(default=0)),
+                (
+                    "newsletter",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="attempt_summaries",
+                        to="mailing.newsletter",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("newsletter", "day"),
+                        name="mailing_attempt_summary_day_uniq",
+                    )
+                ],
+            },
+        ),
+    ]
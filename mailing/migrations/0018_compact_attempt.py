@@ -0,0 +1,147 @@
+import hashlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+STATUSES = {"Успешно": 1, "Не успешно": 2}
+CHUNK_SIZE = 10000
+
+
+def intern_responses(apps, schema_editor):
+    Attempt = apps.get_model("mailing", "Attempt")
+    ServerResponse = apps.get_model("mailing", "ServerResponse")
+
+    response_ids = {}
+    last_id = 0
+    while True:
+        rows = list(
+            Attempt.objects.filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", "status", "server_response")[:CHUNK_SIZE]
+        )
+        if not rows:
+            break
+        # Одно обновление на каждую пару (ответ, статус) в порции
+        groups = {}
+        for pk, status, text in rows:
+            if text not in response_ids:
+                response, _ = ServerResponse.objects.get_or_create(
+                    digest=hashlib.sha1(text.encode()).hexdigest(),
+                    defaults={"text": text},
+                )
+                response_ids[text] = response.pk
+            key = (response_ids[text], STATUSES.get(status, 2))
+            groups.setdefault(key, []).append(pk)
+        for (response_id, status), ids in groups.items():
+            Attempt.objects.filter(id__in=ids).update(
+                response_id=response_id, status_code=status
+            )
+        last_id = rows[-1][0]
+
+
+def restore_responses(apps, schema_editor):
+    Attempt = apps.get_model("mailing", "Attempt")
+    ServerResponse = apps.get_model("mailing", "ServerResponse")
+
+    labels = {code: label for label, code in STATUSES.items()}
+    for response in ServerResponse.objects.iterator():
+        for code, label in labels.items():
+            Attempt.objects.filter(response=response, status_code=code).update(
+                server_response=response.text, status=label
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0017_attempt_summary"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ServerResponse",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("digest", models.CharField(max_length=40, unique=True)),
+                ("text", models.TextField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name="attempt",
+            name="response",
+            field=models.ForeignKey(
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="+",
+                to="mailing.serverresponse",
+            ),
+        ),
+        migrations.AddField(
+            model_name="attempt",
+            name="status_code",
+            field=models.PositiveSmallIntegerField(null=True),
+        ),
+        migrations.RunPython(intern_responses, restore_responses),
+        migrations.RemoveIndex(
+            model_name="attempt",
+            name="mailing_att_newslet_6f26ac_idx",
+        ),
+        # Значения по умолчанию нужны только для отката: при возврате
+        # столбцов их заполняет restore_responses
+        migrations.AlterField(
+            model_name="attempt",
+            name="status",
+            field=models.CharField(default="", max_length=20),
+        ),
+        migrations.AlterField(
+            model_name="attempt",
+            name="server_response",
+            field=models.TextField(default=""),
+        ),
+        migrations.RemoveField(
+            model_name="attempt",
+            name="status",
+        ),
+        migrations.RemoveField(
+            model_name="attempt",
+            name="server_response",
+        ),
+        migrations.RenameField(
+            model_name="attempt",
+            old_name="status_code",
+            new_name="status",
+        ),
+        migrations.AlterField(
+            model_name="attempt",
+            name="status",
+            field=models.PositiveSmallIntegerField(
+                choices=[(1, "Успешно"), (2, "Не успешно")]
+            ),
+        ),
+        migrations.AlterField(
+            model_name="attempt",
+            name="response",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="+",
+                to="mailing.serverresponse",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="attempt",
+            index=models.Index(
+                fields=["newsletter", "status", "-attempt_time", "-id"],
+                name="mailing_att_newslet_6f26ac_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,73 @@
+from django.db import migrations
+from django.db.models import Case, Count, Min, Value, When
+from django.db.models.functions import Lower
+
+BATCH_SIZE = 500  # групп дубликатов за один проход
+
+
+def merge_recipients(apps, schema_editor):
+    # Перед уникальным ограничением 0020 существующие дубликаты нужно
+    # объединить в самого раннего получателя владельца с тем же email (без
+    # учёта регистра). Это замороженная копия mailing.dedupe на момент
+    # миграции: связи на этой схеме перечислены явно, поэтому правки кода
+    # приложения не меняют поведение миграции. Сводную статистику после
+    # миграции пересчитывает python manage.py rebuild_statistics
+    Attempt = apps.get_model("mailing", "Attempt")
+    Newsletter = apps.get_model("mailing", "Newsletter")
+    Recipient = apps.get_model("mailing", "Recipient")
+    Link = Newsletter.recipients.through
+
+    recipients = Recipient.objects.annotate(email_key=Lower("email"))
+    groups = list(
+        recipients.order_by()
+        .values("owner_id", "email_key")
+        .annotate(keep_id=Min("id"), copies=Count("id"))
+        .filter(copies__gt=1)
+        .values_list("owner_id", "email_key", "keep_id")
+    )
+    for start in range(0, len(groups), BATCH_SIZE):
+        keep = {
+            (owner, key): pk for owner, key, pk in groups[start : start + BATCH_SIZE]
+        }
+        rows = recipients.filter(
+            owner_id__in={owner for owner, _ in keep},
+            email_key__in={key for _, key in keep},
+        ).values_list("id", "owner_id", "email_key")
+        # {id дубликата: id оставляемого получателя}
+        replacement = {}
+        for pk, owner, key in rows:
+            target = keep.get((owner, key))
+            if target is not None and target != pk:
+                replacement[pk] = target
+
+        Attempt.objects.filter(recipient_id__in=list(replacement)).update(
+            recipient_id=Case(
+                *(
+                    When(recipient_id=old, then=Value(new))
+                    for old, new in replacement.items()
+                )
+            )
+        )
+        links = Link.objects.filter(recipient_id__in=list(replacement))
+        Link.objects.bulk_create(
+            [
+                Link(newsletter_id=newsletter_id, recipient_id=replacement[old])
+                for newsletter_id, old in links.values_list(
+                    "newsletter_id", "recipient_id"
+                )
+            ],
+            ignore_conflicts=True,
+        )
+        links.delete()
+        Recipient.objects.filter(id__in=list(replacement)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0018_compact_attempt"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_recipients, migrations.RunPython.noop),
+    ]
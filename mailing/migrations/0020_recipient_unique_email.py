@@ -0,0 +1,29 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:37
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0019_merge_duplicate_recipients"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="recipient",
+            name="mailing_rec_owner_i_ac7943_idx",
+        ),
+        migrations.AddConstraint(
+            model_name="recipient",
+            constraint=models.UniqueConstraint(
+                django.db.models.functions.text.Lower("email"),
+                models.F("owner"),
+                name="mailing_recipient_owner_email_uniq",
+                violation_error_message="Получатель с таким email уже есть.",
+            ),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0020_recipient_unique_email"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Segment",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=255)),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("Список", "Список"), ("Фильтр", "Фильтр")],
+                        default="Список",
+                        max_length=10,
+                    ),
+                ),
+                ("email_domain", models.CharField(blank=True, max_length=255)),
+                ("comment_contains", models.CharField(blank=True, max_length=255)),
+                (
+                    "owner",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "recipients",
+                    models.ManyToManyField(
+                        blank=True, related_name="segments", to="mailing.recipient"
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="newsletter",
+            name="segment",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="newsletters",
+                to="mailing.segment",
+            ),
+        ),
+    ]
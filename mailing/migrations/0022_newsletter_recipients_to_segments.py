@@ -0,0 +1,85 @@
+from django.db import migrations
+
+CHUNK_SIZE = 10000
+
+
+def _copy(source, target, source_filter, target_values):
+    # Связи копируются порциями по recipient_id, без загрузки всего списка
+    last_id = 0
+    while True:
+        ids = list(
+            source.objects.filter(recipient_id__gt=last_id, **source_filter)
+            .order_by("recipient_id")
+            .values_list("recipient_id", flat=True)[:CHUNK_SIZE]
+        )
+        if not ids:
+            return
+        target.objects.bulk_create(
+            [target(recipient_id=pk, **target_values) for pk in ids],
+            ignore_conflicts=True,
+        )
+        last_id = ids[-1]
+
+
+def newsletter_recipients_to_segments(apps, schema_editor):
+    # Каждый прежний набор получателей рассылки становится списком владельца
+    Newsletter = apps.get_model("mailing", "Newsletter")
+    Segment = apps.get_model("mailing", "Segment")
+    for newsletter in Newsletter.objects.filter(segment=None).iterator():
+        segment = Segment.objects.create(
+            name=f"Получатели рассылки №{newsletter.pk}",
+            kind="Список",
+            owner_id=newsletter.owner_id,
+        )
+        _copy(
+            Newsletter.recipients.through,
+            Segment.recipients.through,
+            {"newsletter_id": newsletter.pk},
+            {"segment_id": segment.pk},
+        )
+        Newsletter.objects.filter(pk=newsletter.pk).update(segment=segment)
+
+
+def segments_to_newsletter_recipients(apps, schema_editor):
+    Newsletter = apps.get_model("mailing", "Newsletter")
+    Recipient = apps.get_model("mailing", "Recipient")
+    Segment = apps.get_model("mailing", "Segment")
+    Link = Newsletter.recipients.through
+    for newsletter in Newsletter.objects.exclude(segment=None).select_related(
+        "segment"
+    ):
+        segment = newsletter.segment
+        if segment.kind == "Список":
+            _copy(
+                Segment.recipients.through,
+                Link,
+                {"segment_id": segment.pk},
+                {"newsletter_id": newsletter.pk},
+            )
+            continue
+        recipients = Recipient.objects.filter(owner_id=segment.owner_id)
+        if segment.email_domain:
+            recipients = recipients.filter(email__iendswith=f"@{segment.email_domain}")
+        if segment.comment_contains:
+            recipients = recipients.filter(comment__icontains=segment.comment_contains)
+        Link.objects.bulk_create(
+            [
+                Link(newsletter_id=newsletter.pk, recipient_id=pk)
+                for pk in recipients.values_list("id", flat=True).iterator()
+            ],
+            batch_size=CHUNK_SIZE,
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0021_segment"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            newsletter_recipients_to_segments, segments_to_newsletter_recipients
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0022_newsletter_recipients_to_segments"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="newsletter",
+            name="recipients",
+        ),
+        migrations.AddIndex(
+            model_name="recipient",
+            index=models.Index(
+                fields=["owner", "id"], name="mailing_rec_owner_i_ba2850_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0023_remove_newsletter_recipients"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SuppressedAddress",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("email", models.CharField(max_length=254, unique=True)),
+                ("smtp_code", models.PositiveSmallIntegerField(blank=True, null=True)),
+                ("reason", models.TextField(blank=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="recipient",
+            name="validation_status",
+            field=models.PositiveSmallIntegerField(
+                choices=[(0, "Не проверен"), (1, "Корректный"), (2, "Некорректный")],
+                default=0,
+            ),
+        ),
+    ]
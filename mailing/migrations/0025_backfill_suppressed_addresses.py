@@ -0,0 +1,63 @@
+import re
+
+from django.db import migrations
+
+CHUNK_SIZE = 1000
+INVALID_RESPONSE = "Некорректный адрес электронной почты"
+
+# Отказы получателям в сохранённых ответах сервера:
+# smtplib: {'a@b.ru': (550, b'5.1.1 User unknown')}
+# aiosmtplib: [SMTPRecipientRefused(550, '5.1.1 User unknown', 'a@b.ru')]
+REFUSED_PATTERNS = [
+    (re.compile(r"'([^'\s]+@[^'\s]+)': \((5\d\d), "), 1, 2),
+    (re.compile(r"\((5\d\d), '(?:[^'\\]|\\.)*', '([^'\s]+@[^'\s]+)'\)"), 2, 1),
+]
+
+
+def _bounces(text):
+    for pattern, email_group, code_group in REFUSED_PATTERNS:
+        for match in pattern.finditer(text):
+            yield match.group(email_group).lower(), int(match.group(code_group))
+
+
+def backfill(apps, schema_editor):
+    # Адреса, на которые уже были постоянные отказы или которые не прошли
+    # проверку при прошлых отправках, сразу исключаются из доставки
+    Attempt = apps.get_model("mailing", "Attempt")
+    Recipient = apps.get_model("mailing", "Recipient")
+    ServerResponse = apps.get_model("mailing", "ServerResponse")
+    SuppressedAddress = apps.get_model("mailing", "SuppressedAddress")
+
+    Recipient.objects.filter(
+        id__in=Attempt.objects.filter(response__text=INVALID_RESPONSE).values(
+            "recipient_id"
+        )
+    ).update(validation_status=2)
+
+    suppressed = {}
+    for text in (
+        ServerResponse.objects.filter(text__contains="(5")
+        .values_list("text", flat=True)
+        .iterator(chunk_size=CHUNK_SIZE)
+    ):
+        for email, code in _bounces(text):
+            suppressed.setdefault(email, (code, text))
+    SuppressedAddress.objects.bulk_create(
+        [
+            SuppressedAddress(email=email, smtp_code=code, reason=text)
+            for email, (code, text) in suppressed.items()
+        ],
+        batch_size=CHUNK_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0024_recipient_validation_suppressedaddress"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
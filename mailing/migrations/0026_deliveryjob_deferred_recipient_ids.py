@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0025_backfill_suppressed_addresses"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="deliveryjob",
+            name="deferred_recipient_ids",
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 17:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0026_deliveryjob_deferred_recipient_ids"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="ownerstatistics",
+            name="unique_recipients",
+            field=models.PositiveIntegerField(default=0, null=True),
+        ),
+    ]
@@ -1,16 +1,27 @@
 from django.db import models
+from django.db.models.functions import Lower
 from django.utils import timezone
 from django.utils.timezone import now
 from django.conf import settings
 
 
 class Recipient(models.Model):
+    class Validation(models.IntegerChoices):
+        UNKNOWN = 0, "Не проверен"
+        VALID = 1, "Корректный"
+        INVALID = 2, "Некорректный"
+
     email = models.EmailField(unique=False)
     full_name = models.CharField(max_length=255)
     comment = models.TextField(blank=True)
     owner = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE, default=1
     )
+    # Адрес проверяется один раз (форма, импорт или первая отправка),
+    # некорректные больше не попадают в порции доставки
+    validation_status = models.PositiveSmallIntegerField(
+        choices=Validation.choices, default=Validation.UNKNOWN
+    )
 
     class Meta:
         permissions = [
@@ -18,17 +29,92 @@ class Recipient(models.Model):
             ("can_edit_recipient", "Can edit recipient"),
             ("can_delete_recipient", "Can delete recipient"),
         ]
+        constraints = [
+            # Один получатель на адрес у владельца, без учёта регистра.
+            # lower(email) идёт первым, чтобы индекс подходил и для поиска
+            # адреса среди получателей рассылки (mailing.delivery)
+            models.UniqueConstraint(
+                Lower("email"),
+                "owner",
+                name="mailing_recipient_owner_email_uniq",
+                violation_error_message="Получатель с таким email уже есть.",
+            )
+        ]
+        # Порции получателей динамического сегмента читаются по (owner, id)
+        indexes = [models.Index(fields=["owner", "id"])]
 
     def __str__(self):
         return self.full_name
 
 
+class Segment(models.Model):
+    # Аудитория рассылки. «Список» — фиксированный набор получателей
+    # (заполняется импортом CSV), «Фильтр» — получатели владельца, подходящие
+    # под условия на момент отправки. Пустые условия — все получатели
+    KIND_CHOICES = [
+        ("Список", "Список"),
+        ("Фильтр", "Фильтр"),
+    ]
+
+    name = models.CharField(max_length=255)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default="Список")
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    recipients = models.ManyToManyField(
+        "Recipient", blank=True, related_name="segments"
+    )
+    email_domain = models.CharField(max_length=255, blank=True)
+    comment_contains = models.CharField(max_length=255, blank=True)
+
+    def is_static(self):
+        return self.kind == "Список"
+
+    def membership(self):
+        # Условие на Recipient «входит в сегмент». Для списка это EXISTS по
+        # связи, чтобы его можно было сочетать с поиском по индексу адреса
+        if self.is_static():
+            return models.Exists(
+                Segment.recipients.through.objects.filter(
+                    segment_id=self.pk, recipient_id=models.OuterRef("pk")
+                )
+            )
+        condition = models.Q(owner_id=self.owner_id)
+        if self.email_domain:
+            condition &= models.Q(email__iendswith=f"@{self.email_domain}")
+        if self.comment_contains:
+            condition &= models.Q(comment__icontains=self.comment_contains)
+        return condition
+
+    def members(self):
+        # Ленивый queryset: состав сегмента определяется при отправке
+        if self.is_static():
+            return self.recipients.all()
+        return Recipient.objects.filter(self.membership())
+
+    def __str__(self):
+        return self.name
+
+
+class SuppressedAddress(models.Model):
+    # Адреса с постоянным отказом SMTP (5xx на RCPT TO). Общие для всех
+    # владельцев: почтовый ящик не существует независимо от отправителя.
+    # email хранится в нижнем регистре и сравнивается с lower(Recipient.email)
+    email = models.CharField(max_length=254, unique=True)
+    smtp_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    reason = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.email
+
+
 class Message(models.Model):
     subject = models.CharField(max_length=255)
     body = models.TextField()
     owner = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE, default=1
     )
+    # Ревизия сообщения для кэша подготовленных писем
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         permissions = [
@@ -55,7 +141,11 @@ class Newsletter(models.Model):
         max_length=15, choices=STATUS_CHOICES, default="Создана"
     )
     message = models.ForeignKey("Message", on_delete=models.CASCADE)
-    recipients = models.ManyToManyField("Recipient")
+    # Получатели выбираются сегментом, поэтому размер аудитории не влияет
+    # на создание и сохранение рассылки
+    segment = models.ForeignKey(
+        "Segment", on_delete=models.PROTECT, null=True, related_name="newsletters"
+    )
     owner = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE, default=1
     )
@@ -66,6 +156,16 @@ class Newsletter(models.Model):
             ("can_edit_newsletter", "Can edit newsletter"),
             ("can_delete_newsletter", "Can delete newsletter"),
         ]
+        indexes = [
+            models.Index(fields=["owner", "status"]),
+            models.Index(fields=["status", "start_time"]),
+            # Планировщик ищет ближайший end_time только среди запущенных рассылок
+            models.Index(
+                fields=["end_time"],
+                condition=models.Q(status="Запущена"),
+                name="mailing_newsletter_active_idx",
+            ),
+        ]
 
     def is_active(self):
         return (
@@ -83,7 +183,21 @@ class Newsletter(models.Model):
         return f"Рассылка: {self.message.subject} ({self.status})"
 
 
+class ServerResponse(models.Model):
+    # Тексты ответов сервера хранятся один раз: попытки ссылаются на них.
+    # digest (sha1 текста) позволяет найти ответ без индекса по самому тексту
+    digest = models.CharField(max_length=40, unique=True)
+    text = models.TextField()
+
+    def __str__(self):
+        return self.text
+
+
 class Attempt(models.Model):
+    class Status(models.IntegerChoices):
+        SUCCESS = 1, "Успешно"
+        FAILURE = 2, "Не успешно"
+
     newsletter = models.ForeignKey(
         "Newsletter", on_delete=models.CASCADE, related_name="attempts"
     )
@@ -91,10 +205,99 @@ class Attempt(models.Model):
         "Recipient", on_delete=models.CASCADE, null=True
     )  # Разрешить null
     attempt_time = models.DateTimeField(default=now)
+    status = models.PositiveSmallIntegerField(choices=Status.choices)
+    # Попытки по ответу не ищутся, поэтому отдельный индекс не нужен
+    response = models.ForeignKey(
+        "ServerResponse", on_delete=models.PROTECT, related_name="+", db_index=False
+    )
+
+    class Meta:
+        indexes = [
+            # Журнал попыток листается по курсору (attempt_time, id)
+            models.Index(fields=["newsletter", "-attempt_time", "-id"]),
+            models.Index(fields=["newsletter", "status", "-attempt_time", "-id"]),
+        ]
+
+    @property
+    def server_response(self):
+        return self.response.text
+
+    def __str__(self):
+        return f"Попытка для {self.recipient.email} ({self.get_status_display()})"
+
+
+class AttemptSummary(models.Model):
+    # Попытки старше срока хранения сворачиваются в счётчики по дням
+    # (команда compact_attempts), чтобы журнал Attempt не рос бесконечно
+    newsletter = models.ForeignKey(
+        "Newsletter", on_delete=models.CASCADE, related_name="attempt_summaries"
+    )
+    day = models.DateField()
+    total_attempts = models.PositiveIntegerField(default=0)
+    successful_attempts = models.PositiveIntegerField(default=0)
+    unsuccessful_attempts = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["newsletter", "day"], name="mailing_attempt_summary_day_uniq"
+            )
+        ]
+
+    def __str__(self):
+        return f"Итоги рассылки {self.newsletter_id} за {self.day}"
+
+
+class DeliveryJob(models.Model):
+    STATUS_CHOICES = [
+        ("Запланирована", "Запланирована"),
+        ("В очереди", "В очереди"),
+        ("Выполняется", "Выполняется"),
+        ("Выполнена", "Выполнена"),
+        ("Ошибка", "Ошибка"),
+    ]
+
+    newsletter = models.OneToOneField(
+        "Newsletter", on_delete=models.CASCADE, related_name="delivery_job"
+    )
     status = models.CharField(
-        max_length=20, choices=[("Успешно", "Успешно"), ("Не успешно", "Не успешно")]
+        max_length=15, choices=STATUS_CHOICES, default="В очереди"
+    )
+    run_after = models.DateTimeField(default=now)
+    worker = models.CharField(max_length=255, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    # Курсор доставки: номер раунда и последний обработанный в нём получатель
+    round_number = models.PositiveIntegerField(default=0)
+    last_recipient_id = models.BigIntegerField(null=True, blank=True)
+    # Получатели до курсора, отложенные лимитом отправки их домена
+    deferred_recipient_ids = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "run_after"])]
+
+    def __str__(self):
+        return f"Задача рассылки {self.newsletter_id} ({self.status})"
+
+
+class OwnerStatistics(models.Model):
+    # Сводная статистика владельца, обновляется инкрементально при записи
+    # попыток и изменении рассылок (см. mailing.statistics)
+    owner = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="mailing_statistics",
     )
-    server_response = models.TextField()
+    total_newsletters = models.PositiveIntegerField(default=0)
+    active_newsletters = models.PositiveIntegerField(default=0)
+    # NULL — состав сегментов изменился, число пересчитывается при чтении
+    unique_recipients = models.PositiveIntegerField(null=True, default=0)
+    total_attempts = models.PositiveBigIntegerField(default=0)
+    successful_attempts = models.PositiveBigIntegerField(default=0)
+    unsuccessful_attempts = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f"Попытка для {self.recipient.email} ({self.status})"
+        return f"Статистика {self.owner}"
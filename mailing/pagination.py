@@ -0,0 +1,37 @@
+from datetime import datetime
+
+from django.core.exceptions import BadRequest
+from django.db.models import Q
+from django.utils.encoding import force_bytes, force_str
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+
+def encode_cursor(moment, pk):
+    return urlsafe_base64_encode(force_bytes(f"{moment.isoformat()}|{pk}"))
+
+
+def decode_cursor(value):
+    try:
+        moment, pk = force_str(urlsafe_base64_decode(value)).split("|")
+        return datetime.fromisoformat(moment), int(pk)
+    except ValueError:
+        raise BadRequest("Некорректный курсор страницы") from None
+
+
+def keyset_page(queryset, cursor, page_size, field="attempt_time"):
+    # Страница после курсора в порядке (-field, -id). В отличие от OFFSET
+    # глубина листания не влияет на время запроса: индекс сразу позиционируется
+    # на курсор
+    queryset = queryset.order_by(f"-{field}", "-id")
+    if cursor:
+        moment, pk = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(**{f"{field}__lt": moment}) | Q(**{field: moment, "id__lt": pk})
+        )
+    rows = list(queryset[: page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, field), last.pk)
+    return rows, next_cursor
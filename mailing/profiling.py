@@ -0,0 +1,177 @@
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.dispatch import Signal, receiver
+
+from .control import get_redis
+
+logger = logging.getLogger(__name__)
+
+PROFILE_PREFIX = "mailing:profile:"
+PROFILE_VIEWS_KEY = f"{PROFILE_PREFIX}views"
+PROFILE_COUNTERS = (
+    "requests",
+    "queries",
+    "duplicate_queries",
+    "cache_hits",
+    "cache_misses",
+)
+PROFILE_TIMINGS = ("db_time_ms", "wall_ms")
+
+# Отправляются профилирующим клиентом кэша (ProfiledRedisClient)
+cache_hit = Signal()
+cache_miss = Signal()
+# Отправляется middleware после каждого запроса, profile — RequestProfile
+request_profiled = Signal()
+
+_current_profile = ContextVar("mailing_request_profile", default=None)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.wall_time = 0.0
+        self.view_name = None
+        self.path = ""
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper: время и текст каждого SQL-запроса
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            self.statements[sql] += 1
+
+    @property
+    def duplicates(self):
+        # Один и тот же SQL с разными параметрами — обычно признак N+1
+        return [
+            (sql, count) for sql, count in self.statements.most_common() if count > 1
+        ]
+
+    @property
+    def duplicate_queries(self):
+        return sum(count - 1 for _, count in self.duplicates)
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.MAILING_PROFILING:
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        token = _current_profile.set(profile)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile))
+                response = self.get_response(request)
+        finally:
+            profile.wall_time = time.perf_counter() - started
+            _current_profile.reset(token)
+
+        match = request.resolver_match
+        if match is not None:
+            profile.view_name = match.view_name
+            profile.path = request.path
+            request_profiled.send(sender=self.__class__, profile=profile)
+        return response
+
+
+@receiver(cache_hit)
+def _count_cache_hit(sender, count=1, **kwargs):
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.cache_hits += count
+
+
+@receiver(cache_miss)
+def _count_cache_miss(sender, count=1, **kwargs):
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.cache_misses += count
+
+
+@receiver(request_profiled)
+def store_profile(sender, profile, **kwargs):
+    # Суммы по имени URL в Redis; средние считает команда profile_report
+    client = get_redis()
+    if client is None:
+        return
+    key = f"{PROFILE_PREFIX}{profile.view_name}"
+    try:
+        pipe = client.pipeline(transaction=False)
+        pipe.sadd(PROFILE_VIEWS_KEY, profile.view_name)
+        pipe.hincrby(key, "requests", 1)
+        pipe.hincrby(key, "queries", profile.queries)
+        pipe.hincrby(key, "duplicate_queries", profile.duplicate_queries)
+        pipe.hincrby(key, "cache_hits", profile.cache_hits)
+        pipe.hincrby(key, "cache_misses", profile.cache_misses)
+        pipe.hincrbyfloat(key, "db_time_ms", profile.db_time * 1000)
+        pipe.hincrbyfloat(key, "wall_ms", profile.wall_time * 1000)
+        pipe.execute()
+    except Exception:
+        logger.warning("Не удалось сохранить профиль запроса", exc_info=True)
+
+
+@receiver(request_profiled)
+def log_slow_request(sender, profile, **kwargs):
+    if profile.wall_time * 1000 < settings.MAILING_SLOW_REQUEST_MS:
+        return
+    lines = [
+        f"Медленный запрос {profile.path} ({profile.view_name}): "
+        f"{profile.wall_time * 1000:.0f} мс, SQL-запросов {profile.queries} "
+        f"за {profile.db_time * 1000:.0f} мс, "
+        f"кэш {profile.cache_hits}/{profile.cache_hits + profile.cache_misses}"
+    ]
+    for sql, count in profile.duplicates[:5]:
+        lines.append(f"  повторён {count} раз: {sql[:300]}")
+    logger.warning("\n".join(lines))
+
+
+def load_profiles():
+    # {имя URL: {счётчик: сумма}} из Redis, None если Redis недоступен
+    client = get_redis()
+    if client is None:
+        return None
+    names = sorted(
+        name.decode() if isinstance(name, bytes) else name
+        for name in client.smembers(PROFILE_VIEWS_KEY)
+    )
+    pipe = client.pipeline(transaction=False)
+    for name in names:
+        pipe.hgetall(f"{PROFILE_PREFIX}{name}")
+    profiles = {}
+    for name, values in zip(names, pipe.execute()):
+        profiles[name] = {
+            (field.decode() if isinstance(field, bytes) else field): float(value)
+            for field, value in values.items()
+        }
+    return profiles
+
+
+def reset_profiles():
+    client = get_redis()
+    if client is None:
+        return
+    names = client.smembers(PROFILE_VIEWS_KEY)
+    keys = [
+        f"{PROFILE_PREFIX}{name.decode() if isinstance(name, bytes) else name}"
+        for name in names
+    ]
+    client.delete(PROFILE_VIEWS_KEY, *keys)
@@ -0,0 +1,204 @@
+import binascii
+import re
+import threading
+from collections import OrderedDict
+from email.utils import formatdate, make_msgid
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.core.mail.message import (
+    RFC5322_EMAIL_LINE_LENGTH_LIMIT,
+    forbid_multi_line_headers,
+    sanitize_address,
+)
+from django.core.mail.utils import DNS_NAME
+
+# Поля получателя, доступные в теме и тексте сообщения: {{ full_name }} и т.д.
+PLACEHOLDER_RE = re.compile(r"\{\{\s*(full_name|comment|email)\s*\}\}")
+
+
+class LRUCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+def encode_address(address, encoding):
+    # sanitize_address() разбирает адрес парсером заголовков и стоит ~100 мкс;
+    # обычный ASCII-адрес без переводов строк возвращается как есть
+    if address.isascii() and "\n" not in address and "\r" not in address:
+        return address
+    return sanitize_address(address, encoding)
+
+
+class CompiledTemplate:
+    # Шаблон разбирается один раз в список «текст, поле, текст, ...»;
+    # подстановка сводится к одному join без движка шаблонов Django
+    def __init__(self, source):
+        self.parts = PLACEHOLDER_RE.split(source)
+        self.fields = self.parts[1::2]
+
+    @property
+    def is_static(self):
+        return not self.fields
+
+    def render(self, context):
+        parts = self.parts[:]
+        parts[1::2] = [context.get(field) or "" for field in self.fields]
+        return "".join(parts)
+
+
+class PreparedMessage:
+    # Заголовки и тело письма сериализуются один раз средствами Django;
+    # для получателя остаётся вставить To, Date и Message-ID
+    def __init__(self, subject, body, from_email):
+        self.subject = subject
+        self.body = body
+        self.from_email = from_email
+        self.encoding = settings.DEFAULT_CHARSET
+        self.subject_template = CompiledTemplate(subject)
+        self.body_template = CompiledTemplate(body)
+        self.is_personalised = not (
+            self.subject_template.is_static and self.body_template.is_static
+        )
+
+        if self.is_personalised:
+            # Django выбирает кодировку тела по его содержимому, поэтому для писем
+            # с подстановкой готовятся заголовки под utf-8/8bit и под
+            # quoted-printable (строки длиннее 998 байт), а тело кодируется
+            # для каждого получателя
+            self._head, _ = self._serialize("\u0451")
+            self._qp_head, _ = self._serialize(
+                "\u0451" * RFC5322_EMAIL_LINE_LENGTH_LIMIT
+            )
+        else:
+            self._head, self._payload = self._serialize(body)
+
+    def _serialize(self, body):
+        mime = EmailMessage(
+            self.subject, body, self.from_email, ["prepared@localhost"]
+        ).message()
+        for header in ("To", "Date", "Message-ID"):
+            del mime[header]
+        if not self.subject_template.is_static:
+            del mime["Subject"]
+        head, _, payload = mime.as_bytes(linesep="\r\n").partition(b"\r\n\r\n")
+        return head + b"\r\n", b"\r\n" + payload
+
+    def personalise(self, context):
+        return (
+            self.subject_template.render(context),
+            self.body_template.render(context),
+        )
+
+    def render(self, to, subject=None, body=None):
+        head = self._head
+        if self.is_personalised:
+            payload = (
+                (self.body if body is None else body)
+                .replace("\r\n", "\n")
+                .replace("\n", "\r\n")
+                .encode(self.encoding)
+            )
+            if len(payload) > RFC5322_EMAIL_LINE_LENGTH_LIMIT and any(
+                len(line) > RFC5322_EMAIL_LINE_LENGTH_LIMIT
+                for line in payload.split(b"\r\n")
+            ):
+                head = self._qp_head
+                payload = (
+                    binascii.b2a_qp(payload, istext=True)
+                    .replace(b"\r\n", b"\n")
+                    .replace(b"\n", b"\r\n")
+                )
+            payload = b"\r\n" + payload
+        else:
+            payload = self._payload
+
+        parts = [
+            head,
+            b"To: ",
+            encode_address(to, self.encoding).encode(),
+            b"\r\nDate: ",
+            formatdate(localtime=settings.EMAIL_USE_LOCALTIME).encode(),
+            b"\r\nMessage-ID: ",
+            make_msgid(domain=DNS_NAME).encode(),
+            b"\r\n",
+        ]
+        if not self.subject_template.is_static:
+            _, value = forbid_multi_line_headers(
+                "Subject", self.subject if subject is None else subject, self.encoding
+            )
+            parts += [b"Subject: ", value.replace("\n", "\r\n").encode(), b"\r\n"]
+        parts.append(payload)
+        return b"".join(parts)
+
+
+class _RenderedMessage:
+    # Минимальный интерфейс email.message.Message, которого достаточно
+    # SMTP-бэкенду Django и асинхронному движку: им нужен только as_bytes()
+    def __init__(self, data):
+        self._data = data
+
+    def as_bytes(self, unixfrom=False, linesep="\n"):
+        if linesep == "\r\n":
+            return self._data
+        return self._data.replace(b"\r\n", linesep.encode())
+
+    def as_string(self, unixfrom=False, linesep="\n"):
+        return self.as_bytes(linesep=linesep).decode()
+
+
+class PreparedEmailMessage(EmailMessage):
+    # prerendered=False — письмо собирается обычным EmailMessage.message():
+    # консольному, файловому и сторонним бэкендам нужен полноценный
+    # email.message.Message (get_charset(), заголовки и т.д.)
+    def __init__(self, prepared, to, context=None, prerendered=True):
+        if prepared.is_personalised and context is not None:
+            subject, body = prepared.personalise(context)
+        else:
+            subject, body = prepared.subject, prepared.body
+        super().__init__(subject, body, prepared.from_email, [to])
+        self.prepared = prepared
+        self.prerendered = prerendered
+
+    def message(self):
+        if not self.prerendered:
+            return super().message()
+        return _RenderedMessage(
+            self.prepared.render(self.to[0], self.subject, self.body)
+        )
+
+
+_prepared_messages = LRUCache(settings.MAILING_PREPARED_MESSAGE_CACHE_SIZE)
+
+
+def get_prepared_message(message):
+    # Ключ меняется при каждом сохранении сообщения, поэтому правка темы
+    # или текста не требует явной инвалидации
+    key = (message.pk, message.updated_at)
+    prepared = _prepared_messages.get(key)
+    if prepared is None:
+        prepared = PreparedMessage(
+            message.subject, message.body, settings.DEFAULT_FROM_EMAIL
+        )
+        _prepared_messages.set(key, prepared)
+    return prepared
@@ -0,0 +1,27 @@
+import hashlib
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import ServerResponse
+from .rendering import LRUCache
+
+_response_ids = LRUCache(settings.MAILING_SERVER_RESPONSE_CACHE_SIZE)
+
+
+def response_digest(text):
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def intern_response(text):
+    # id записи ServerResponse с этим текстом; частые ответы («Сообщение
+    # отправлено», типовые ошибки SMTP) берутся из кэша процесса без запроса
+    response_id = _response_ids.get(text)
+    if response_id is None:
+        response, _ = ServerResponse.objects.get_or_create(
+            digest=response_digest(text), defaults={"text": text}
+        )
+        response_id = response.pk
+        # Запись, созданная в откатившейся транзакции, не должна попасть в кэш
+        transaction.on_commit(lambda: _response_ids.set(text, response_id))
+    return response_id
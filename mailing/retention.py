@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import TruncDate
+
+from .models import Attempt, AttemptSummary
+from .statistics import attempt_counts
+
+
+def compact_attempts(before, batch_size=None):
+    # Попытки раньше before сворачиваются в AttemptSummary по рассылке и дню
+    # и удаляются из журнала. Итоги и удаление пишутся в одной транзакции,
+    # а сводная статистика владельцев не меняется: счётчики переезжают в итоги
+    batch_size = batch_size or settings.MAILING_COMPACTION_BATCH_SIZE
+    compacted = 0
+    while True:
+        with transaction.atomic():
+            # Журнал растёт по id, поэтому старые попытки находятся в его начале.
+            # Блокировка строк не даёт параллельному запуску учесть их дважды
+            ids = list(
+                Attempt.objects.filter(attempt_time__lt=before)
+                .order_by("id")
+                .select_for_update()
+                .values_list("pk", flat=True)[:batch_size]
+            )
+            if not ids:
+                return compacted
+            batch = Attempt.objects.filter(pk__in=ids)
+            per_day = (
+                batch.annotate(day=TruncDate("attempt_time"))
+                .values("newsletter_id", "day")
+                .annotate(**attempt_counts())
+                .order_by()
+            )
+            for row in per_day:
+                newsletter_id, day = row.pop("newsletter_id"), row.pop("day")
+                if not AttemptSummary.objects.filter(
+                    newsletter_id=newsletter_id, day=day
+                ).update(**{field: F(field) + value for field, value in row.items()}):
+                    AttemptSummary.objects.create(
+                        newsletter_id=newsletter_id, day=day, **row
+                    )
+            batch.delete()
+        compacted += len(ids)
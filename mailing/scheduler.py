@@ -0,0 +1,106 @@
+import logging
+
+from django.conf import settings
+from django.utils import timezone
+
+from .control import QUEUE_CHANNEL, SCHEDULER_CHANNEL, Wakeup, notify, publish_command
+from .cache import NEWSLETTERS, bump_version
+from .models import DeliveryJob, Newsletter
+from .statistics import refresh_newsletter_counts
+
+logger = logging.getLogger(__name__)
+
+
+class Scheduler:
+    # Время следующего события берётся из индекса (status, run_after) задач
+    # и частичного индекса end_time запущенных рассылок, поэтому планировщик
+    # не перебирает все строки и просыпается ровно к ближайшему
+    # start_time/раунду или end_time
+    def __init__(self, chunk_size=None, max_sleep=None):
+        self.chunk_size = chunk_size or settings.MAILING_SCHEDULER_CHUNK_SIZE
+        self.max_sleep = max_sleep or settings.MAILING_SCHEDULER_MAX_SLEEP
+        self._wakeup = Wakeup(SCHEDULER_CHANNEL)
+
+    def run_forever(self):
+        while True:
+            self.run_once()
+            self._wakeup.wait(self.seconds_until_next_event())
+
+    def run_once(self):
+        dispatched = self.dispatch_due_jobs()
+        finished = self.finish_expired_newsletters()
+        if dispatched or finished:
+            logger.info(
+                f"Поставлено в очередь задач: {dispatched}, завершено рассылок: {finished}"
+            )
+        return dispatched, finished
+
+    def dispatch_due_jobs(self):
+        dispatched = 0
+        while True:
+            ids = list(
+                DeliveryJob.objects.filter(
+                    status="Запланирована", run_after__lte=timezone.now()
+                )
+                .order_by("run_after")
+                .values_list("pk", flat=True)[: self.chunk_size]
+            )
+            if not ids:
+                break
+            dispatched += DeliveryJob.objects.filter(
+                pk__in=ids, status="Запланирована"
+            ).update(status="В очереди")
+        if dispatched:
+            notify(QUEUE_CHANNEL)
+        return dispatched
+
+    def finish_expired_newsletters(self):
+        finished = 0
+        while True:
+            ids = list(
+                Newsletter.objects.filter(
+                    status="Запущена", end_time__lte=timezone.now()
+                )
+                .order_by("end_time")
+                .values_list("pk", flat=True)[: self.chunk_size]
+            )
+            if not ids:
+                break
+            finished += Newsletter.objects.filter(pk__in=ids, status="Запущена").update(
+                status="Завершена"
+            )
+            DeliveryJob.objects.filter(newsletter_id__in=ids).exclude(
+                status="Выполняется"
+            ).update(
+                status="Выполнена", last_recipient_id=None, deferred_recipient_ids=[]
+            )
+            # update() не отправляет post_save, счётчики и кэш обновляются явно
+            owner_ids = set(
+                Newsletter.objects.filter(pk__in=ids).values_list("owner_id", flat=True)
+            )
+            refresh_newsletter_counts(owner_ids)
+            for owner_id in owner_ids:
+                bump_version(owner_id, NEWSLETTERS)
+            # Раунд, который ещё идёт, останавливается ровно в end_time
+            for newsletter_id in ids:
+                publish_command(newsletter_id, "stop")
+        return finished
+
+    def seconds_until_next_event(self):
+        next_run = (
+            DeliveryJob.objects.filter(status="Запланирована")
+            .order_by("run_after")
+            .values_list("run_after", flat=True)
+            .first()
+        )
+        next_end = (
+            Newsletter.objects.filter(status="Запущена")
+            .order_by("end_time")
+            .values_list("end_time", flat=True)
+            .first()
+        )
+        events = [moment for moment in (next_run, next_end) if moment is not None]
+        if not events:
+            return self.max_sleep
+        delay = (min(events) - timezone.now()).total_seconds()
+        return max(0, min(delay, self.max_sleep))
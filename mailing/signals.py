@@ -0,0 +1,91 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .cache import MESSAGES, NEWSLETTERS, RECIPIENTS, SEGMENTS, bump_version
+from .models import Attempt, AttemptSummary, Message, Newsletter, Recipient, Segment
+from .statistics import (
+    discount_attempts,
+    discount_summaries,
+    refresh_newsletter_counts,
+)
+
+
+class _RefreshCounts:
+    # Пересчёт счётчиков владельца после фиксации транзакции
+    def __init__(self, owner_id):
+        self.owner_id = owner_id
+        self.done = False
+
+    def __call__(self):
+        self.done = True
+        refresh_newsletter_counts([self.owner_id])
+
+
+def _refresh_on_commit(owner_id):
+    # Один пересчёт на владельца за транзакцию, сколько бы объектов в ней ни
+    # сохранили. При откате транзакции или точки сохранения Django сам
+    # убирает её колбэки из run_on_commit
+    connection = transaction.get_connection()
+    if connection.in_atomic_block and any(
+        isinstance(func, _RefreshCounts) and func.owner_id == owner_id and not func.done
+        for _, func, _ in connection.run_on_commit
+    ):
+        return
+    transaction.on_commit(_RefreshCounts(owner_id))
+
+
+@receiver(post_save, sender=Newsletter)
+def newsletter_saved(sender, instance, **kwargs):
+    bump_version(instance.owner_id, NEWSLETTERS)
+    _refresh_on_commit(instance.owner_id)
+
+
+@receiver(pre_delete, sender=Newsletter)
+def newsletter_deleting(sender, instance, **kwargs):
+    discount_attempts(Attempt.objects.filter(newsletter=instance))
+    discount_summaries(AttemptSummary.objects.filter(newsletter=instance))
+
+
+@receiver(post_delete, sender=Newsletter)
+def newsletter_deleted(sender, instance, **kwargs):
+    bump_version(instance.owner_id, NEWSLETTERS)
+    _refresh_on_commit(instance.owner_id)
+
+
+@receiver(m2m_changed, sender=Segment.recipients.through)
+def segment_recipients_changed(sender, instance, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        # instance — сегмент или получатель, у обоих есть owner
+        _refresh_on_commit(instance.owner_id)
+
+
+@receiver([post_save, post_delete], sender=Segment)
+def segment_changed(sender, instance, **kwargs):
+    # Название сегмента выводится и в списке рассылок
+    bump_version(instance.owner_id, SEGMENTS, NEWSLETTERS)
+    _refresh_on_commit(instance.owner_id)
+
+
+@receiver(pre_delete, sender=Recipient)
+def recipient_deleting(sender, instance, **kwargs):
+    discount_attempts(Attempt.objects.filter(recipient=instance))
+
+
+@receiver(post_save, sender=Recipient)
+def recipient_saved(sender, instance, **kwargs):
+    bump_version(instance.owner_id, RECIPIENTS)
+    # Получатель мог попасть в динамический сегмент или выйти из него
+    _refresh_on_commit(instance.owner_id)
+
+
+@receiver(post_delete, sender=Recipient)
+def recipient_deleted(sender, instance, **kwargs):
+    bump_version(instance.owner_id, RECIPIENTS)
+    _refresh_on_commit(instance.owner_id)
+
+
+@receiver([post_save, post_delete], sender=Message)
+def message_changed(sender, instance, **kwargs):
+    # Тема сообщения выводится и в списке рассылок
+    bump_version(instance.owner_id, MESSAGES, NEWSLETTERS)
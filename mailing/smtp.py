@@ -0,0 +1,87 @@
+import logging
+import smtplib
+import threading
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.mail.backends.smtp import EmailBackend as SMTPBackend
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, после которых соединение считается разорванным и открывается заново
+RECONNECT_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+_local = threading.local()
+
+
+class DeliveryConnection:
+    def __init__(self, pooled=True):
+        self.pooled = pooled
+        self._connection = None
+        self._sent = 0
+
+    def _open(self):
+        if self._connection is None:
+            self._connection = get_connection(fail_silently=False)
+            self._connection.open()
+            self._sent = 0
+        return self._connection
+
+    def close(self):
+        if self._connection is None:
+            return
+        try:
+            self._connection.close()
+        except Exception:
+            logger.debug("Ошибка при закрытии SMTP-соединения", exc_info=True)
+        finally:
+            self._connection = None
+
+    def send_messages(self, messages, should_stop=None):
+        # Возвращает список ошибок по каждому письму (None - письмо отправлено).
+        # Если should_stop() сработал, список обрывается на последнем отправленном
+        errors = []
+        for message in messages:
+            if should_stop is not None and should_stop():
+                break
+            errors.append(self._send(message))
+        return errors
+
+    def _send(self, message):
+        for retry in (False, True):
+            try:
+                # send_messages() не закрывает соединение, открытое заранее,
+                # поэтому все письма пачки идут в одной SMTP-сессии
+                backend = self._open()
+                # Готовые байты письма понимает только SMTP-бэкенд
+                message.prerendered = isinstance(backend, SMTPBackend)
+                backend.send_messages([message])
+            except RECONNECT_ERRORS as e:
+                self.close()
+                if retry:
+                    return e
+                logger.info("SMTP-соединение разорвано, переподключение")
+                continue
+            except Exception as e:
+                return e
+            finally:
+                if not self.pooled:
+                    self.close()
+
+            self._sent += 1
+            if self._sent >= settings.MAILING_SMTP_MAX_MESSAGES_PER_CONNECTION:
+                self.close()
+            return None
+
+
+def get_delivery_connection(engine=None):
+    engine = engine or settings.MAILING_DELIVERY_ENGINE
+    if engine == "async":
+        from .async_delivery import AsyncDeliveryConnection
+
+        return AsyncDeliveryConnection()
+
+    # Одно долгоживущее соединение на поток воркера
+    if getattr(_local, "connection", None) is None:
+        _local.connection = DeliveryConnection()
+    return _local.connection
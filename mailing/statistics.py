@@ -0,0 +1,216 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Exists, F, Max, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from .cache import STATISTICS, bump_version
+from .models import (
+    Attempt,
+    AttemptSummary,
+    Newsletter,
+    OwnerStatistics,
+    Recipient,
+    Segment,
+)
+
+STATISTICS_FIELDS = (
+    "total_newsletters",
+    "active_newsletters",
+    "unique_recipients",
+    "total_attempts",
+    "successful_attempts",
+    "unsuccessful_attempts",
+)
+ATTEMPT_FIELDS = STATISTICS_FIELDS[3:]
+
+
+def attempt_counts():
+    # Условная агрегация: все счётчики попыток за один проход по таблице
+    return {
+        "total_attempts": Count("id"),
+        "successful_attempts": Count("id", filter=Q(status=Attempt.Status.SUCCESS)),
+        "unsuccessful_attempts": Count("id", filter=Q(status=Attempt.Status.FAILURE)),
+    }
+
+
+def summary_counts():
+    # Те же счётчики по итогам свёрнутых попыток (см. AttemptSummary)
+    return {field: Coalesce(Sum(field), 0) for field in ATTEMPT_FIELDS}
+
+
+def _per_newsletter(model, aggregate):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(newsletter=OuterRef("pk"))
+            .values("newsletter")
+            .annotate(total=aggregate)
+            .values("total")
+        ),
+        0,
+    )
+
+
+def newsletter_attempt_counts():
+    # Аннотации рассылки с учётом свёрнутых попыток. Коррелированные подзапросы
+    # вычисляются только для строк страницы и идут по индексу
+    # (newsletter, status, ...), а не группируют весь журнал попыток
+    hot = attempt_counts()
+    archived = summary_counts()
+    return {
+        field: _per_newsletter(Attempt, hot[field])
+        + _per_newsletter(AttemptSummary, archived[field])
+        for field in ATTEMPT_FIELDS
+    }
+
+
+def _add(*counts):
+    return {field: sum(count[field] for count in counts) for field in ATTEMPT_FIELDS}
+
+
+def newsletter_counts():
+    return {
+        "total_newsletters": Count("id"),
+        "active_newsletters": Count("id", filter=Q(status="Запущена")),
+    }
+
+
+def _unique_recipients(owner_id):
+    # Получатели, входящие хотя бы в один сегмент рассылок владельца. Все
+    # списки проверяются одним EXISTS по связи, к нему добавляются только
+    # различающиеся условия фильтров, поэтому размер запроса не растёт
+    # с числом рассылок
+    segments = Segment.objects.filter(newsletters__owner_id=owner_id)
+    if not segments.exists():
+        return 0
+    condition = Exists(
+        Segment.recipients.through.objects.filter(
+            segment_id__in=segments.filter(kind="Список").values("pk"),
+            recipient_id=OuterRef("pk"),
+        )
+    )
+    filters = (
+        segments.exclude(kind="Список")
+        .values_list("owner_id", "email_domain", "comment_contains")
+        .distinct()
+    )
+    for owner, email_domain, comment_contains in filters:
+        condition |= Segment(
+            kind="Фильтр",
+            owner_id=owner,
+            email_domain=email_domain,
+            comment_contains=comment_contains,
+        ).membership()
+    return Recipient.objects.filter(condition).count()
+
+
+def _newsletter_counts(owner_id):
+    return {
+        **Newsletter.objects.filter(owner_id=owner_id).aggregate(**newsletter_counts()),
+        "unique_recipients": _unique_recipients(owner_id),
+    }
+
+
+def _attempt_counts(owner_id):
+    return _add(
+        Attempt.objects.filter(newsletter__owner_id=owner_id).aggregate(
+            **attempt_counts()
+        ),
+        AttemptSummary.objects.filter(newsletter__owner_id=owner_id).aggregate(
+            **summary_counts()
+        ),
+    )
+
+
+def newsletter_statistics(newsletter):
+    # Счётчики включают свёрнутые попытки; reached_recipients и
+    # last_attempt_time считаются по журналу за срок хранения
+    statistics = Attempt.objects.filter(newsletter=newsletter).aggregate(
+        **attempt_counts(),
+        reached_recipients=Count("recipient", distinct=True),
+        last_attempt_time=Max("attempt_time"),
+    )
+    statistics.update(
+        _add(
+            statistics,
+            AttemptSummary.objects.filter(newsletter=newsletter).aggregate(
+                **summary_counts()
+            ),
+        )
+    )
+    return statistics
+
+
+def rebuild_owner_statistics(owner_id):
+    # Полный пересчёт: для первого обращения и команды rebuild_statistics
+    values = {**_newsletter_counts(owner_id), **_attempt_counts(owner_id)}
+    try:
+        with transaction.atomic():
+            stats, _ = OwnerStatistics.objects.update_or_create(
+                owner_id=owner_id, defaults=values
+            )
+    except IntegrityError:
+        # Строку одновременно создал другой процесс
+        OwnerStatistics.objects.filter(owner_id=owner_id).update(**values)
+        stats = OwnerStatistics.objects.get(owner_id=owner_id)
+    bump_version(owner_id, STATISTICS)
+    return stats
+
+
+def get_owner_statistics(owner):
+    stats = OwnerStatistics.objects.filter(owner=owner).first()
+    if stats is None:
+        stats = rebuild_owner_statistics(owner.pk)
+    elif stats.unique_recipients is None:
+        # Отложенный пересчёт: один на все изменения с прошлого чтения
+        stats.unique_recipients = _unique_recipients(owner.pk)
+        OwnerStatistics.objects.filter(
+            pk=stats.pk, unique_recipients__isnull=True
+        ).update(unique_recipients=stats.unique_recipients)
+    return stats
+
+
+def refresh_newsletter_counts(owner_ids):
+    # Рассылки меняются редко, поэтому их счётчики просто пересчитываются.
+    # Число уникальных получателей дорого считать на каждое сохранение:
+    # оно только помечается устаревшим и пересчитывается при чтении
+    for owner_id in set(owner_ids):
+        counts = Newsletter.objects.filter(owner_id=owner_id).aggregate(
+            **newsletter_counts()
+        )
+        if OwnerStatistics.objects.filter(owner_id=owner_id).update(
+            unique_recipients=None, **counts
+        ):
+            bump_version(owner_id, STATISTICS)
+
+
+def record_attempts(owner_id, successful, unsuccessful):
+    # Вызывается в транзакции вместе с bulk_create попыток
+    if not OwnerStatistics.objects.filter(owner_id=owner_id).update(
+        total_attempts=F("total_attempts") + successful + unsuccessful,
+        successful_attempts=F("successful_attempts") + successful,
+        unsuccessful_attempts=F("unsuccessful_attempts") + unsuccessful,
+    ):
+        rebuild_owner_statistics(owner_id)
+    else:
+        bump_version(owner_id, STATISTICS)
+
+
+def _discount(per_owner):
+    for row in per_owner:
+        owner_id = row.pop("newsletter__owner_id")
+        OwnerStatistics.objects.filter(owner_id=owner_id).update(
+            **{field: F(field) - value for field, value in row.items()}
+        )
+        bump_version(owner_id, STATISTICS)
+
+
+def discount_attempts(attempts):
+    # Попытки удаляются каскадом вместе с рассылкой или получателем
+    _discount(
+        attempts.order_by().values("newsletter__owner_id").annotate(**attempt_counts())
+    )
+
+
+def discount_summaries(summaries):
+    _discount(
+        summaries.order_by().values("newsletter__owner_id").annotate(**summary_counts())
+    )
@@ -0,0 +1,39 @@
+import smtplib
+
+import aiosmtplib
+from django.db.models import Exists, OuterRef
+
+from .models import SuppressedAddress
+
+
+def permanent_failure(error):
+    # SMTP-код постоянного отказа получателю (5xx на RCPT TO) или None.
+    # Отказы, не связанные с адресом (отправитель, содержимое письма,
+    # временные 4xx), адрес не блокируют
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in error.recipients.values()]
+    elif isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        codes = [refused.code for refused in error.recipients]
+    elif isinstance(error, aiosmtplib.SMTPRecipientRefused):
+        codes = [error.code]
+    else:
+        return None
+    return next((code for code in codes if 500 <= code < 600), None)
+
+
+def suppress_addresses(bounces):
+    # bounces: {адрес в нижнем регистре: (код SMTP, ответ сервера)}
+    if bounces:
+        SuppressedAddress.objects.bulk_create(
+            [
+                SuppressedAddress(email=email, smtp_code=code, reason=reason)
+                for email, (code, reason) in bounces.items()
+            ],
+            ignore_conflicts=True,
+        )
+
+
+def not_suppressed():
+    # Условие для queryset получателей с аннотацией email_key=Lower("email"):
+    # NOT EXISTS по уникальному индексу SuppressedAddress.email
+    return ~Exists(SuppressedAddress.objects.filter(email=OuterRef("email_key")))
@@ -1,3 +1,1981 @@
-from django.test import TestCase
+import csv
+import email
+import gzip
+import io
+import json
+import os
+import re
+import smtplib
+import socket
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import fakeredis
+from aiosmtpd.controller import Controller
+from django.contrib.auth.models import Group
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail import EmailMessage
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import urlsafe_base64_encode
+
+from users.models import CustomUser
+from .async_delivery import AsyncDeliveryConnection
+from .control import _Monitor, publish_command
+from .cache import (
+    MESSAGES,
+    NEWSLETTERS,
+    RECIPIENTS,
+    SEGMENTS,
+    get_cached,
+    get_version,
+)
+from .delivery import (
+    AttemptBuffer,
+    claim_jobs,
+    enqueue_newsletter,
+    iter_recipients,
+    run_job,
+    send_newsletter_round,
+)
+from .export import EXPORT_FIELDS
+from .profiling import RequestProfile, load_profiles
+from .forms import RecipientForm
+from .imports import _existing_keys, import_recipients, read_rows
+from .models import (
+    Attempt,
+    AttemptSummary,
+    DeliveryJob,
+    Message,
+    Newsletter,
+    OwnerStatistics,
+    Recipient,
+    Segment,
+    ServerResponse,
+    SuppressedAddress,
+)
+from .retention import compact_attempts
+from .statistics import (
+    ATTEMPT_FIELDS,
+    STATISTICS_FIELDS,
+    _unique_recipients,
+    get_owner_statistics,
+    newsletter_statistics,
+    rebuild_owner_statistics,
+    refresh_newsletter_counts,
+)
+from .rendering import PreparedEmailMessage, PreparedMessage
+from .responses import intern_response
+from .scheduler import Scheduler
+from .smtp import DeliveryConnection
+from .throttling import TAKE_SCRIPT, LocalBuckets, pause_domain, take_tokens
+
+
+def create_newsletter(owner, emails, subject="Тема", body="Текст", **fields):
+    # Рассылка владельца по статическому списку из новых получателей
+    segment = Segment.objects.create(name="Список", owner=owner)
+    segment.recipients.add(
+        *(
+            Recipient.objects.create(email=email, full_name="", owner=owner)
+            for email in emails
+        )
+    )
+    now = timezone.now()
+    fields.setdefault("start_time", now)
+    fields.setdefault("end_time", now + timedelta(hours=1))
+    return Newsletter.objects.create(
+        message=Message.objects.create(subject=subject, body=body, owner=owner),
+        segment=segment,
+        owner=owner,
+        **fields,
+    )
+
+
+class HotQueryIndexTests(TestCase):
+    # Запросы отчётов и доставки должны идти по индексу, а журнал попыток —
+    # ещё и без сортировки: порядок курсора (-attempt_time, -id) даёт индекс.
+    # Проверяется форма плана, а не имя индекса: на данных, похожих на
+    # настоящие, планировщик вправе выбрать любой подходящий индекс
+    @classmethod
+    def setUpTestData(cls):
+        owners = [
+            CustomUser.objects.create(email=f"owner{i}@example.com", username=f"o{i}")
+            for i in range(4)
+        ]
+        cls.owner = owners[0]
+        now = timezone.now()
+        response_id = intern_response("Сообщение отправлено")
+        for owner in owners:
+            message = Message.objects.create(subject="Тема", body="Текст", owner=owner)
+            recipients = Recipient.objects.bulk_create(
+                Recipient(email=f"user{i}@example.com", full_name="", owner=owner)
+                for i in range(250)
+            )
+            newsletters = Newsletter.objects.bulk_create(
+                Newsletter(
+                    start_time=now - timedelta(days=i),
+                    end_time=now + timedelta(days=i + 1),
+                    message=message,
+                    owner=owner,
+                    status=("Создана", "Запущена", "Завершена")[i % 3],
+                )
+                for i in range(10)
+            )
+            # Пачками по секунде: у многих попыток одинаковое attempt_time
+            Attempt.objects.bulk_create(
+                Attempt(
+                    newsletter=newsletter,
+                    recipient=recipient,
+                    attempt_time=now - timedelta(seconds=i // 10),
+                    status=(
+                        Attempt.Status.FAILURE if i % 5 == 0 else Attempt.Status.SUCCESS
+                    ),
+                    response_id=response_id,
+                )
+                for newsletter in newsletters
+                for i, recipient in enumerate(recipients[:100])
+            )
+        cls.newsletter = newsletters[0]
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def setUp(self):
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SET enable_seqscan = off")
+
+    def assertIndexScan(self, queryset, table, ordered=False):
+        plan = queryset.explain()
+        if connection.vendor == "postgresql":
+            scanned = re.findall(
+                r"(?:Index Scan|Index Only Scan)(?: Backward)? using \S+ on (\w+)"
+                r"|Bitmap Heap Scan on (\w+)",
+                plan,
+            )
+            scanned = {name for names in scanned for name in names if name}
+            sorted_ = re.search(r"\bSort\b", plan)
+        else:
+            scanned = set(re.findall(r"SEARCH (\w+) USING (?:COVERING )?INDEX", plan))
+            sorted_ = "TEMP B-TREE" in plan
+        self.assertIn(table, scanned, plan)
+        if ordered:
+            self.assertFalse(sorted_, plan)
+
+    def keyset_queryset(self, **filters):
+        cursor = Attempt.objects.filter(newsletter=self.newsletter).order_by(
+            "-attempt_time", "-id"
+        )[50]
+        queryset = (
+            Attempt.objects.filter(newsletter=self.newsletter, **filters)
+            .order_by("-attempt_time", "-id")
+            .filter(
+                Q(attempt_time__lt=cursor.attempt_time)
+                | Q(attempt_time=cursor.attempt_time, id__lt=cursor.pk)
+            )
+        )
+        return queryset[:51]
+
+    def test_attempts_of_newsletter_by_time(self):
+        first_page = Attempt.objects.filter(newsletter=self.newsletter).order_by(
+            "-attempt_time", "-id"
+        )[:51]
+        self.assertIndexScan(first_page, "mailing_attempt", ordered=True)
+        self.assertIndexScan(self.keyset_queryset(), "mailing_attempt", ordered=True)
+
+    def test_attempts_of_newsletter_by_status_and_time(self):
+        self.assertIndexScan(
+            self.keyset_queryset(status=Attempt.Status.FAILURE),
+            "mailing_attempt",
+            ordered=True,
+        )
+
+    def test_attempts_of_owner_by_status(self):
+        self.assertIndexScan(
+            Attempt.objects.filter(
+                newsletter__owner=self.owner, status=Attempt.Status.FAILURE
+            ),
+            "mailing_attempt",
+        )
+
+    def test_newsletters_of_owner_by_status(self):
+        self.assertIndexScan(
+            Newsletter.objects.filter(owner=self.owner, status="Запущена"),
+            "mailing_newsletter",
+        )
+
+    def test_newsletters_by_status_and_start_time(self):
+        self.assertIndexScan(
+            Newsletter.objects.filter(
+                status="Создана", start_time__lte=timezone.now()
+            ).order_by("start_time"),
+            "mailing_newsletter",
+            ordered=True,
+        )
+
+    @skipUnless(
+        connection.vendor == "postgresql",
+        "SQLite не применяет частичный индекс к запросу с параметром",
+    )
+    def test_next_end_time_of_active_newsletters(self):
+        self.assertIndexScan(
+            Newsletter.objects.filter(status="Запущена").order_by("end_time")[:1],
+            "mailing_newsletter",
+            ordered=True,
+        )
+
+    def test_recipient_of_owner_by_email(self):
+        self.assertIndexScan(
+            Recipient.objects.annotate(email_key=Lower("email")).filter(
+                owner=self.owner, email_key="user7@example.com"
+            ),
+            "mailing_recipient",
+        )
+
+
+class ManagerDashboardQueryTests(TestCase):
+    # Число запросов страницы менеджера не должно зависеть от объёма данных
+    QUERY_BUDGET = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = CustomUser.objects.create(
+            email="manager@example.com", username="manager"
+        )
+        cls.manager.groups.add(Group.objects.create(name="Менеджеры"))
+        cls.response = ServerResponse.objects.create(
+            digest="0" * 40, text="Сообщение отправлено"
+        )
+
+    def create_data(self, count):
+        start = CustomUser.objects.count()
+        now = timezone.now()
+        for i in range(start, start + count):
+            owner = CustomUser.objects.create(
+                email=f"user{i}@example.com", username=f"user{i}"
+            )
+            message = Message.objects.create(subject=f"Тема {i}", body="", owner=owner)
+            recipient = Recipient.objects.create(
+                email=f"user{i}@example.com", full_name="", owner=owner
+            )
+            newsletter = Newsletter.objects.create(
+                start_time=now,
+                end_time=now + timedelta(hours=1),
+                message=message,
+                owner=owner,
+            )
+            Attempt.objects.create(
+                newsletter=newsletter,
+                recipient=recipient,
+                status=Attempt.Status.SUCCESS,
+                response=self.response,
+            )
+
+    def count_queries(self, url):
+        self.client.force_login(self.manager)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_data(self):
+        self.create_data(3)
+        small = self.count_queries(reverse("mailing:dashboard"))
+        self.create_data(60)
+        large = self.count_queries(reverse("mailing:dashboard"))
+        self.assertEqual(small, large)
+        self.assertLessEqual(large, self.QUERY_BUDGET)
+
+    def test_search_and_second_page_stay_within_budget(self):
+        self.create_data(60)
+        url = reverse("mailing:dashboard")
+        self.assertLessEqual(
+            self.count_queries(f"{url}?page=2&newsletters_page=2"), self.QUERY_BUDGET
+        )
+        self.assertLessEqual(self.count_queries(f"{url}?q=user1"), self.QUERY_BUDGET)
+
+
+class RecipientImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create(
+            email="owner@example.com", username="owner"
+        )
+        Recipient.objects.create(
+            email="old@example.com", full_name="Уже есть", owner=cls.owner
+        )
+
+    def import_csv(self, content, chunk_size=2):
+        return import_recipients(
+            self.owner.id, read_rows(io.BytesIO(content.encode())), chunk_size
+        )
+
+    def test_skips_invalid_rows_and_duplicates_across_chunks(self):
+        result = self.import_csv(
+            "email;full_name;comment\n"
+            "new@example.com;Новый;\n"
+            "old@example.com;Повтор из базы;\n"
+            "not-an-email;Ошибка;\n"
+            "new@example.com;Повтор из файла;\n"
+            "other@example.com;Другой;VIP\n"
+        )
+        self.assertEqual((result.rows, result.created), (5, 2))
+        self.assertEqual((result.duplicates, result.invalid), (2, 1))
+        self.assertEqual(
+            dict(
+                Recipient.objects.filter(owner=self.owner).values_list(
+                    "email", "full_name"
+                )
+            ),
+            {
+                "old@example.com": "Уже есть",
+                "new@example.com": "Новый",
+                "other@example.com": "Другой",
+            },
+        )
+
+    def test_requires_email_column(self):
+        with self.assertRaises(ValueError):
+            self.import_csv("name,comment\nИмя,\n")
+
+    def test_retries_chunk_after_concurrent_insert(self):
+        # Первая сверка не видит old@example.com, как будто его добавили
+        # в другом запросе между сверкой и вставкой
+        calls = []
+
+        def miss_first(owner_id, cleaned):
+            calls.append(cleaned)
+            return set() if len(calls) == 1 else _existing_keys(owner_id, cleaned)
+
+        with mock.patch("mailing.imports._existing_keys", miss_first):
+            result = self.import_csv(
+                "email,full_name\nnew@example.com,Новый\nOLD@example.com,Повтор\n"
+            )
+        self.assertEqual(len(calls), 2)
+        self.assertEqual((result.created, result.duplicates), (1, 1))
+        self.assertEqual(
+            sorted(
+                Recipient.objects.filter(owner=self.owner).values_list(
+                    "email", flat=True
+                )
+            ),
+            ["new@example.com", "old@example.com"],
+        )
+
+    def test_form_reports_persistent_conflict(self):
+        self.client.force_login(self.owner)
+        upload = io.BytesIO(b"email\nold@example.com\n")
+        upload.name = "recipients.csv"
+        with mock.patch("mailing.imports._existing_keys", return_value=set()):
+            response = self.client.post(
+                reverse("mailing:import_recipients"), {"file": upload}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("одновременно добавляются", str(response.context["form"].errors))
+        self.assertEqual(Recipient.objects.filter(owner=self.owner).count(), 1)
+
+
+class RecipientDeduplicationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create(
+            email="owner@example.com", username="owner"
+        )
+        cls.other = CustomUser.objects.create(
+            email="other@example.com", username="other"
+        )
+        message = Message.objects.create(subject="Тема", body="Текст", owner=cls.owner)
+        cls.segment = Segment.objects.create(name="Список", owner=cls.owner)
+        now = timezone.now()
+        cls.newsletter = Newsletter.objects.create(
+            start_time=now,
+            end_time=now + timedelta(hours=1),
+            message=message,
+            segment=cls.segment,
+            owner=cls.owner,
+        )
+
+    def test_email_is_unique_per_owner_ignoring_case(self):
+        Recipient.objects.create(
+            email="User@Example.com", full_name="", owner=self.owner
+        )
+        form = RecipientForm(
+            {"email": "user@example.com", "full_name": "Повтор"},
+            instance=Recipient(owner=self.owner),
+        )
+        self.assertFalse(form.is_valid())
+        self.assertIn("email", form.errors)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Recipient.objects.create(
+                email="user@example.com", full_name="", owner=self.owner
+            )
+        Recipient.objects.create(
+            email="user@example.com", full_name="", owner=self.other
+        )
+
+    def test_delivery_skips_repeated_addresses(self):
+        # Одинаковые адреса у разных владельцев попадают в список только
+        # через админку, но и тогда письмо уходит один раз
+        first = Recipient.objects.create(
+            email="user@example.com", full_name="", owner=self.owner
+        )
+        unique = Recipient.objects.create(
+            email="unique@example.com", full_name="", owner=self.owner
+        )
+        repeated = Recipient.objects.create(
+            email="USER@example.com", full_name="", owner=self.other
+        )
+        self.segment.recipients.add(first, unique, repeated)
+        for chunk_size in (1, 10):
+            self.assertEqual(
+                [r.pk for r in iter_recipients(self.newsletter, chunk_size=chunk_size)],
+                [first.pk, unique.pk],
+            )
+
+
+class SegmentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create(
+            email="owner@example.com", username="owner"
+        )
+        cls.message = Message.objects.create(
+            subject="Тема", body="Текст", owner=cls.owner
+        )
+        cls.listed, cls.corporate, cls.other = (
+            Recipient.objects.create(email=email, full_name="", owner=cls.owner)
+            for email in ("a@example.com", "b@corp.example", "c@example.com")
+        )
+
+    def create_newsletter(self, segment):
+        now = timezone.now()
+        return Newsletter.objects.create(
+            start_time=now,
+            end_time=now + timedelta(hours=1),
+            message=self.message,
+            segment=segment,
+            owner=self.owner,
+        )
+
+    def test_filter_is_resolved_at_send_time(self):
+        segment = Segment.objects.create(
+            name="Корпоративные",
+            kind="Фильтр",
+            email_domain="CORP.example",
+            owner=self.owner,
+        )
+        newsletter = self.create_newsletter(segment)
+        late = Recipient.objects.create(
+            email="d@corp.example", full_name="", owner=self.owner
+        )
+        self.assertEqual(
+            [r.pk for r in iter_recipients(newsletter)], [self.corporate.pk, late.pk]
+        )
+
+    def test_unique_recipients_combine_lists_and_filters(self):
+        static = Segment.objects.create(name="Список", owner=self.owner)
+        static.recipients.add(self.listed, self.corporate)
+        dynamic = Segment.objects.create(
+            name="Фильтр", kind="Фильтр", email_domain="corp.example", owner=self.owner
+        )
+        self.create_newsletter(static)
+        self.create_newsletter(dynamic)
+        OwnerStatistics.objects.filter(owner=self.owner).delete()
+        self.assertEqual(get_owner_statistics(self.owner).unique_recipients, 2)
+
+
+class UniqueRecipientsTests(TestCase):
+    def test_many_segments_are_counted_once_per_transaction(self):
+        # Миграция 0022 создала по сегменту на каждую рассылку
+        owner = CustomUser.objects.create(email="owner@example.com", username="owner")
+        now = timezone.now()
+        with mock.patch(
+            "mailing.signals.refresh_newsletter_counts",
+            wraps=refresh_newsletter_counts,
+        ) as refresh, self.captureOnCommitCallbacks(execute=True):
+            message = Message.objects.create(subject="Тема", body="Текст", owner=owner)
+            segments = Segment.objects.bulk_create(
+                Segment(name=f"Рассылка {i}", owner=owner) for i in range(1200)
+            )
+            segments += Segment.objects.bulk_create(
+                Segment(
+                    name=f"Фильтр {i}",
+                    kind="Фильтр",
+                    email_domain="corp.example",
+                    owner=owner,
+                )
+                for i in range(300)
+            )
+            Newsletter.objects.bulk_create(
+                Newsletter(
+                    start_time=now,
+                    end_time=now + timedelta(hours=1),
+                    message=message,
+                    segment=segment,
+                    owner=owner,
+                )
+                for segment in segments
+            )
+            listed = Recipient.objects.bulk_create(
+                Recipient(email=email, full_name="", owner=owner)
+                for email in ("a@example.com", "b@example.com")
+            )
+            Segment.recipients.through.objects.bulk_create(
+                [
+                    Segment.recipients.through(
+                        segment=segments[0], recipient=listed[0]
+                    ),
+                    Segment.recipients.through(
+                        segment=segments[1199], recipient=listed[1]
+                    ),
+                ]
+            )
+            for email in ("c@corp.example", "d@other.example", "e@corp.example"):
+                Recipient.objects.create(email=email, full_name="", owner=owner)
+        self.assertEqual(refresh.call_count, 1)
+        self.assertEqual(get_owner_statistics(owner).unique_recipients, 4)
+
+    def test_recount_is_deferred_until_read(self):
+        owner = CustomUser.objects.create(email="owner@example.com", username="owner")
+        with self.captureOnCommitCallbacks(execute=True):
+            create_newsletter(owner, ["a@example.com"])
+        self.assertEqual(get_owner_statistics(owner).unique_recipients, 1)
+
+        with mock.patch(
+            "mailing.statistics._unique_recipients", wraps=_unique_recipients
+        ) as count:
+            with self.captureOnCommitCallbacks(execute=True):
+                for email in ("b@example.com", "c@example.com"):
+                    recipient = Recipient.objects.create(
+                        email=email, full_name="", owner=owner
+                    )
+                    owner.segment_set.get().recipients.add(recipient)
+            stats = OwnerStatistics.objects.get(owner=owner)
+            self.assertEqual(
+                (stats.total_newsletters, stats.unique_recipients), (1, None)
+            )
+            self.assertEqual(count.call_count, 0)
+            for _ in range(2):
+                self.assertEqual(get_owner_statistics(owner).unique_recipients, 3)
+        self.assertEqual(count.call_count, 1)
+
+
+class BouncingConnection:
+    # Отказывает на RCPT TO адресам из bounced, остальные письма «отправляет»
+    def __init__(self, bounced):
+        self.bounced = bounced
+        self.sent = []
+
+    def send_messages(self, messages, should_stop=None):
+        errors = []
+        for message in messages:
+            address = message.to[0]
+            self.sent.append(address)
+            errors.append(
+                smtplib.SMTPRecipientsRefused({address: (550, b"5.1.1 User unknown")})
+                if address in self.bounced
+                else None
+            )
+        return errors
+
+
+class SuppressionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create(
+            email="owner@example.com", username="owner"
+        )
+        cls.segment = Segment.objects.create(name="Список", owner=cls.owner)
+        cls.valid, cls.invalid, cls.bounced = (
+            Recipient.objects.create(email=email, full_name="", owner=cls.owner)
+            for email in ("good@example.com", "not-an-email", "Gone@example.com")
+        )
+        cls.segment.recipients.add(cls.valid, cls.invalid, cls.bounced)
+        now = timezone.now()
+        cls.newsletter = Newsletter.objects.create(
+            start_time=now,
+            end_time=now + timedelta(hours=1),
+            message=Message.objects.create(
+                subject="Тема", body="Текст", owner=cls.owner
+            ),
+            segment=cls.segment,
+            owner=cls.owner,
+        )
+
+    def test_invalid_and_bounced_addresses_are_skipped_next_round(self):
+        connection = BouncingConnection({"Gone@example.com"})
+        send_newsletter_round(self.newsletter, connection)
+        self.assertEqual(connection.sent, ["good@example.com", "Gone@example.com"])
+        self.invalid.refresh_from_db()
+        self.assertEqual(self.invalid.validation_status, Recipient.Validation.INVALID)
+        suppressed = SuppressedAddress.objects.get()
+        self.assertEqual(
+            (suppressed.email, suppressed.smtp_code), ("gone@example.com", 550)
+        )
+
+        connection = BouncingConnection(set())
+        send_newsletter_round(self.newsletter, connection)
+        self.assertEqual(connection.sent, ["good@example.com"])
+        # Повторная рассылка не пишет новых неудачных попыток
+        self.assertEqual(
+            Attempt.objects.filter(status=Attempt.Status.FAILURE).count(), 2
+        )
+
+    @override_settings(MAILING_DOMAIN_BACKOFF=0.01)
+    def test_temporary_failures_are_retried_and_not_suppressed(self):
+        connection = BouncingConnection(set())
+        connection.send_messages = lambda messages, should_stop=None: [
+            smtplib.SMTPRecipientsRefused({m.to[0]: (451, b"Try later")})
+            for m in messages
+        ]
+        result = send_newsletter_round(self.newsletter, connection)
+        self.assertEqual(result.sent, 0)
+        self.assertFalse(SuppressedAddress.objects.exists())
+        # Неудачная попытка пишется только после исчерпания повторов
+        self.assertEqual(Attempt.objects.filter(recipient=self.valid).count(), 1)
+
+
+@override_settings(
+    MAILING_DOMAIN_RATE_LIMIT=None,
+    MAILING_DOMAIN_RATE_LIMITS={"slow.example": (50, 1)},
+)
+class ThrottlingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create(
+            email="owner@example.com", username="owner"
+        )
+        segment = Segment.objects.create(name="Список", owner=cls.owner)
+        cls.recipients = [
+            Recipient.objects.create(email=email, full_name="", owner=cls.owner)
+            for email in (
+                "a@slow.example",
+                "b@slow.example",
+                "c@fast.example",
+                "d@slow.example",
+                "e@fast.example",
+            )
+        ]
+        segment.recipients.add(*cls.recipients)
+        now = timezone.now()
+        cls.newsletter = Newsletter.objects.create(
+            start_time=now,
+            end_time=now + timedelta(hours=1),
+            message=Message.objects.create(
+                subject="Тема", body="Текст", owner=cls.owner
+            ),
+            segment=segment,
+            owner=cls.owner,
+        )
+
+    def setUp(self):
+        # Свежие вёдра в памяти процесса: в Redis они переживали бы тест
+        for patcher in (
+            mock.patch("mailing.throttling._local", LocalBuckets()),
+            mock.patch("mailing.throttling.get_redis", return_value=None),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_throttled_domain_does_not_hold_back_others(self):
+        connection = BouncingConnection(set())
+        result = send_newsletter_round(self.newsletter, connection)
+        self.assertEqual(result.sent, 5)
+        self.assertEqual(
+            connection.sent,
+            [
+                "a@slow.example",
+                "c@fast.example",
+                "e@fast.example",
+                "b@slow.example",
+                "d@slow.example",
+            ],
+        )
+
+    def test_deferred_recipients_survive_pause(self):
+        job = DeliveryJob.objects.create(newsletter=self.newsletter)
+        connection = BouncingConnection(set())
+        result = send_newsletter_round(
+            self.newsletter,
+            connection,
+            should_stop=lambda: bool(connection.sent),
+            job=job,
+        )
+        deferred = [self.recipients[1].id, self.recipients[3].id]
+        self.assertEqual((result.sent, result.deferred_ids), (3, deferred))
+        job.refresh_from_db()
+        self.assertEqual(job.last_recipient_id, self.recipients[-1].id)
+        self.assertEqual(job.deferred_recipient_ids, deferred)
+
+        connection = BouncingConnection(set())
+        send_newsletter_round(self.newsletter, connection, job=job)
+        self.assertEqual(connection.sent, ["b@slow.example", "d@slow.example"])
+
+    @override_settings(
+        MAILING_ATTEMPT_FLUSH_INTERVAL=0.01, MAILING_CONTROL_POLL_INTERVAL=0.01
+    )
+    def test_waiting_round_keeps_its_lock(self):
+        # Все получатели на приостановленном домене: раунд только ждёт,
+        # попыток для записи нет
+        newsletter = create_newsletter(self.owner, ["x@slow.example", "y@slow.example"])
+        pause_domain("slow.example", 0.1)
+        claimed = timezone.now()
+        job = DeliveryJob.objects.create(
+            newsletter=newsletter, status="Выполняется", locked_at=claimed
+        )
+        connection = BouncingConnection(set())
+        locked_at = []
+
+        def wait(seconds):
+            if not connection.sent:
+                locked_at.append(DeliveryJob.objects.get().locked_at)
+            time.sleep(seconds)
+
+        # Подменяется только модуль time в mailing.delivery: time.sleep
+        # вызывают и фоновые потоки (монитор команд)
+        with mock.patch("mailing.delivery.time", wraps=time) as patched:
+            patched.sleep.side_effect = wait
+            result = send_newsletter_round(newsletter, connection, job=job)
+        self.assertEqual(result.sent, 2)
+        self.assertGreater(locked_at[-1], claimed)
+
+    def test_redis_script_is_registered_once(self):
+        client = mock.Mock()
+        client.register_script.return_value.return_value = [[1, 0]]
+        with mock.patch(
+            "mailing.throttling.get_redis", return_value=client
+        ), mock.patch("mailing.throttling._take_script", None):
+            for _ in range(3):
+                self.assertEqual(
+                    take_tokens({"fast.example": 1}), {"fast.example": (1, 0)}
+                )
+        client.register_script.assert_called_once_with(TAKE_SCRIPT)
+        self.assertEqual(client.register_script.return_value.call_count, 3)
+
+
+class DeliveryBackendTests(TestCase):
+    # Раунд через стандартные бэкенды Django, отличные от SMTP
+    @classmethod
+    def setUpTestData(cls):
+        owner = CustomUser.objects.create(email="owner@example.com", username="owner")
+        cls.newsletter = create_newsletter(
+            owner,
+            ["a@example.com", "b@example.com"],
+            subject="Для {{ email }}",
+            body="Здравствуйте, {{ email }}",
+        )
+
+    def assertRoundSucceeds(self):
+        result = send_newsletter_round(self.newsletter, DeliveryConnection())
+        self.assertEqual(result.sent, 2)
+        self.assertFalse(Attempt.objects.filter(status=Attempt.Status.FAILURE).exists())
+
+    def test_locmem_backend(self):
+        self.assertRoundSucceeds()
+        self.assertEqual(
+            [(m.to, m.subject) for m in mail.outbox],
+            [
+                (["a@example.com"], "Для a@example.com"),
+                (["b@example.com"], "Для b@example.com"),
+            ],
+        )
+
+    @override_settings(EMAIL_BACKEND="django.core.mail.backends.console.EmailBackend")
+    def test_console_backend(self):
+        with mock.patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            self.assertRoundSucceeds()
+        self.assertIn("Subject: =?utf-8?b?", stdout.getvalue())
+        self.assertIn("To: b@example.com", stdout.getvalue())
+
+
+class SendNewsletterCommandTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = CustomUser.objects.create(email="owner@example.com", username="owner")
+        cls.newsletter = create_newsletter(owner, ["a@example.com", "b@example.com"])
+
+    def send(self):
+        out = io.StringIO()
+        call_command("send_newsletter", self.newsletter.pk, stdout=out)
+        return out.getvalue()
+
+    def test_refuses_job_held_by_worker(self):
+        DeliveryJob.objects.create(
+            newsletter=self.newsletter,
+            status="Выполняется",
+            worker="host:1",
+            locked_at=timezone.now(),
+        )
+        self.assertIn("уже отправляет воркер host:1", self.send())
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(DeliveryJob.objects.get().worker, "host:1")
+
+    def test_reclaims_stale_job_and_releases_it(self):
+        DeliveryJob.objects.create(
+            newsletter=self.newsletter,
+            status="Выполняется",
+            worker="host:1",
+            locked_at=timezone.now() - timedelta(days=1),
+        )
+        self.assertIn("Рассылка завершена", self.send())
+        self.assertEqual(len(mail.outbox), 2)
+        job = DeliveryJob.objects.get()
+        self.assertEqual(
+            (job.status, job.worker, job.round_number), ("Выполнена", "", 1)
+        )
+
+
+class BenchmarkStatisticsCommandTests(TestCase):
+    def test_leaves_no_data_behind(self):
+        call_command(
+            "benchmark_statistics", attempts=50, repeat=1, stdout=io.StringIO()
+        )
+        self.assertFalse(CustomUser.objects.exists())
+        self.assertFalse(Attempt.objects.exists())
+
+
+class BenchmarkDeliveryCommandTests(TestCase):
+    def test_reports_each_size_and_leaves_no_data_behind(self):
+        out = io.StringIO()
+        call_command("benchmark_delivery", recipients=[20, 5], stdout=out)
+        self.assertIn("Получателей 5: отправлено 5", out.getvalue())
+        self.assertIn("Получателей 20: отправлено 20", out.getvalue())
+        self.assertFalse(CustomUser.objects.exists())
+        self.assertFalse(Recipient.objects.exists())
+        self.assertFalse(Attempt.objects.exists())
+
+
+class AttemptListAccessTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create(
+            email="owner@example.com", username="owner"
+        )
+        cls.other = CustomUser.objects.create(
+            email="other@example.com", username="other"
+        )
+        cls.manager = CustomUser.objects.create(
+            email="manager@example.com", username="manager"
+        )
+        cls.manager.groups.add(Group.objects.create(name="Менеджеры"))
+        cls.newsletter = create_newsletter(cls.owner, ["a@example.com"])
+        cls.url = reverse("mailing:newsletter_attempts", args=[cls.newsletter.pk])
+
+    def test_anonymous_is_sent_to_login(self):
+        response = self.client.get(self.url, {"format": "json"})
+        self.assertEqual(response.status_code, 302)
+
+    def test_other_user_is_forbidden(self):
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.assertEqual(self.client.get(self.url, {"format": "json"}).status_code, 403)
+
+    def test_owner_and_manager_can_read(self):
+        for user in (self.owner, self.manager):
+            self.client.force_login(user)
+            response = self.client.get(self.url, {"format": "json"})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["results"], [])
+
+
+@override_settings(MAILING_ATTEMPTS_PAGE_SIZE=3)
+class AttemptPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create(
+            email="owner@example.com", username="owner"
+        )
+        cls.newsletter = create_newsletter(
+            cls.owner, [f"r{i}@example.com" for i in range(10)]
+        )
+        now = timezone.now().replace(microsecond=0)
+        response_id = intern_response("Сообщение отправлено")
+        # По три-четыре попытки на одну секунду: порядок внутри решает id
+        Attempt.objects.bulk_create(
+            Attempt(
+                newsletter=cls.newsletter,
+                recipient=recipient,
+                attempt_time=now - timedelta(seconds=i // 4),
+                status=Attempt.Status.FAILURE if i % 3 else Attempt.Status.SUCCESS,
+                response_id=response_id,
+            )
+            for i, recipient in enumerate(
+                cls.newsletter.segment.members().order_by("id")
+            )
+        )
+        cls.url = reverse("mailing:newsletter_attempts", args=[cls.newsletter.pk])
+
+    def setUp(self):
+        self.client.force_login(self.owner)
+
+    def expected_ids(self, **filters):
+        return list(
+            Attempt.objects.filter(newsletter=self.newsletter, **filters)
+            .order_by("-attempt_time", "-id")
+            .values_list("id", flat=True)
+        )
+
+    def walk(self, **params):
+        ids, pages, cursor = [], 0, None
+        while True:
+            query = {"format": "json", **params}
+            if cursor:
+                query["cursor"] = cursor
+            response = self.client.get(self.url, query)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertLessEqual(len(data["results"]), 3)
+            ids += [row["id"] for row in data["results"]]
+            pages += 1
+            cursor = data["next_cursor"]
+            if cursor is None:
+                return ids, pages
+
+    def test_pages_follow_cursor_without_gaps_or_repeats(self):
+        ids, pages = self.walk()
+        self.assertEqual(ids, self.expected_ids())
+        self.assertEqual(pages, 4)
+
+    def test_status_filter(self):
+        ids, pages = self.walk(status=Attempt.Status.FAILURE)
+        self.assertEqual(ids, self.expected_ids(status=Attempt.Status.FAILURE))
+        # Шесть попыток ровно на две страницы: пустой третьей нет
+        self.assertEqual((len(ids), pages), (6, 2))
+        # Неизвестный статус не фильтрует
+        ids, _ = self.walk(status="удалено")
+        self.assertEqual(ids, self.expected_ids())
+
+    def test_json_payload(self):
+        data = self.client.get(self.url, {"format": "json"}).json()
+        attempt = Attempt.objects.get(pk=data["results"][0]["id"])
+        self.assertEqual(
+            data["results"][0],
+            {
+                "id": attempt.id,
+                "recipient": attempt.recipient.email,
+                "attempt_time": attempt.attempt_time.isoformat().replace("+00:00", "Z"),
+                "status": attempt.get_status_display(),
+                "server_response": "Сообщение отправлено",
+            },
+        )
+
+    def test_html_page(self):
+        response = self.client.get(self.url)
+        self.assertEqual(len(response.context["attempts"]), 3)
+        self.assertIsNotNone(response.context["next_cursor"])
+
+    def test_malformed_cursor(self):
+        for cursor in (
+            "не-курсор",
+            urlsafe_base64_encode(b"2024-01-01|abc"),
+            urlsafe_base64_encode(b"\xff\xfe"),
+            urlsafe_base64_encode(b"no separator"),
+        ):
+            response = self.client.get(self.url, {"format": "json", "cursor": cursor})
+            self.assertEqual(response.status_code, 400, cursor)
+
+
+class EditNewsletterRestartTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create(
+            email="owner@example.com", username="owner"
+        )
+        cls.newsletter = create_newsletter(
+            cls.owner, ["a@example.com", "b@example.com"], status="Приостановлена"
+        )
+        cls.recipients = list(cls.newsletter.segment.members().order_by("id"))
+
+    def test_edit_starts_the_round_over(self):
+        job = DeliveryJob.objects.create(
+            newsletter=self.newsletter,
+            status="Выполняется",
+            last_recipient_id=self.recipients[0].id,
+            deferred_recipient_ids=[self.recipients[0].id],
+        )
+        self.client.force_login(self.owner)
+        response = self.client.post(
+            reverse("mailing:edit_newsletter", args=[self.newsletter.pk]),
+            {
+                "start_time": "2030-01-01T10:00",
+                "end_time": "2030-01-02T10:00",
+                "message": self.newsletter.message_id,
+                "segment": self.newsletter.segment_id,
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        restarted = DeliveryJob.objects.get()
+        self.assertEqual(
+            (restarted.round_number, restarted.last_recipient_id), (1, None)
+        )
+        self.assertEqual(restarted.deferred_recipient_ids, [])
+
+        # Воркер, ещё отправляющий прежний раунд, курсор не перезапишет
+        with AttemptBuffer(job) as attempts:
+            attempts.add(
+                Attempt(
+                    newsletter=self.newsletter,
+                    recipient=self.recipients[1],
+                    status=Attempt.Status.SUCCESS,
+                    response_id=intern_response("Сообщение отправлено"),
+                )
+            )
+            attempts.checkpoint(self.recipients[1].id)
+        self.assertIsNone(DeliveryJob.objects.get().last_recipient_id)
+
+        connection = BouncingConnection(set())
+        send_newsletter_round(self.newsletter, connection, job=restarted)
+        self.assertEqual(connection.sent, ["a@example.com", "b@example.com"])
+
+
+class JobQueueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create(
+            email="owner@example.com", username="owner"
+        )
+
+    def create_job(self, status="В очереди", emails=None, **fields):
+        # У каждой рассылки свой получатель: email уникален у владельца
+        emails = emails or [f"r{DeliveryJob.objects.count()}@example.com"]
+        newsletter = create_newsletter(self.owner, emails, status="Запущена")
+        return DeliveryJob.objects.create(
+            newsletter=newsletter, status=status, **fields
+        )
+
+    def test_claim_skips_fresh_locks_and_reclaims_stale_ones(self):
+        now = timezone.now()
+        queued = self.create_job(run_after=now - timedelta(minutes=1))
+        stale = self.create_job(
+            "Выполняется", worker="host:1", locked_at=now - timedelta(days=1)
+        )
+        self.create_job("Выполняется", worker="host:2", locked_at=now)
+        self.create_job("Запланирована", run_after=now + timedelta(hours=1))
+
+        claimed = claim_jobs("host:3", limit=10)
+        self.assertEqual({job.pk for job in claimed}, {queued.pk, stale.pk})
+        self.assertEqual(
+            set(
+                DeliveryJob.objects.filter(worker="host:3").values_list("pk", "status")
+            ),
+            {(queued.pk, "Выполняется"), (stale.pk, "Выполняется")},
+        )
+        self.assertEqual(claim_jobs("host:4", limit=10), [])
+
+    def test_claim_respects_limit_and_order(self):
+        now = timezone.now()
+        later = self.create_job(run_after=now - timedelta(minutes=1))
+        earlier = self.create_job(run_after=now - timedelta(minutes=2))
+        self.assertEqual(
+            [job.pk for job in claim_jobs("host:1", limit=1)], [earlier.pk]
+        )
+        self.assertEqual([job.pk for job in claim_jobs("host:2", limit=1)], [later.pk])
+
+    def test_run_job_sends_round_and_requeues_it(self):
+        self.create_job(emails=["a@example.com", "b@example.com"])
+        (job,) = claim_jobs("host:1", limit=1)
+        run_job(job)
+        self.assertEqual(len(mail.outbox), 2)
+        job.refresh_from_db()
+        # Следующий раунд через MAILING_DELIVERY_INTERVAL ждёт планировщика
+        self.assertEqual(
+            (job.status, job.worker, job.locked_at, job.round_number),
+            ("Запланирована", "", None, 1),
+        )
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertIsNone(job.last_recipient_id)
+
+    def test_run_job_finishes_expired_newsletter(self):
+        job = self.create_job("Выполняется")
+        Newsletter.objects.filter(pk=job.newsletter_id).update(
+            end_time=timezone.now() - timedelta(minutes=1)
+        )
+        run_job(job)
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(Newsletter.objects.get().status, "Завершена")
+        self.assertEqual(DeliveryJob.objects.get().status, "Выполнена")
+
+    def test_run_job_finishes_newsletter_that_is_not_running(self):
+        job = self.create_job("Выполняется")
+        Newsletter.objects.update(status="Приостановлена")
+        run_job(job)
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(DeliveryJob.objects.get().status, "Выполнена")
+
+    def test_run_job_records_error(self):
+        job = self.create_job("Выполняется", worker="host:1")
+        with mock.patch(
+            "mailing.delivery.send_newsletter_round",
+            side_effect=RuntimeError("SMTP недоступен"),
+        ), self.assertLogs("mailing.delivery", "ERROR"):
+            run_job(job)
+        job.refresh_from_db()
+        self.assertEqual(
+            (job.status, job.worker, job.last_error),
+            ("Ошибка", "", "SMTP недоступен"),
+        )
+
+
+class SMTPHandler:
+    # Обработчик aiosmtpd: отвечает адресам из replies заданной строкой,
+    # остальные письма принимает
+    def __init__(self):
+        self.replies = {}  # {адрес: "451 4.7.1 Try again later"}
+        self.rcpt = []  # все RCPT TO по порядку
+        self.messages = []  # принятые письма: (получатели, байты)
+        self.sessions = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.sessions += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        self.rcpt.append(address)
+        reply = self.replies.get(address)
+        if reply is not None:
+            return reply
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append((envelope.rcpt_tos, envelope.original_content))
+        return "250 Message accepted for delivery"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class LocalSMTPServerMixin:
+    # Рассылка через настоящий SMTP-сервер на локальном порту
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.handler = SMTPHandler()
+        cls.server = Controller(cls.handler, hostname="127.0.0.1", port=free_port())
+        cls.server.start()
+        cls.addClassCleanup(cls.server.stop)
+        cls.enterClassContext(
+            override_settings(
+                EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+                EMAIL_HOST="127.0.0.1",
+                EMAIL_PORT=cls.server.port,
+                EMAIL_HOST_USER="",
+                EMAIL_HOST_PASSWORD="",
+                EMAIL_USE_TLS=False,
+                EMAIL_USE_SSL=False,
+                MAILING_DOMAIN_RATE_LIMIT=None,
+                MAILING_DOMAIN_BACKOFF=0.01,
+            )
+        )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create(
+            email="owner@example.com", username="owner"
+        )
+        cls.newsletter = create_newsletter(
+            cls.owner,
+            ["a@example.com", "gone@example.com", "busy@example.org"],
+            subject="Для {{ email }}",
+            body="Здравствуйте, {{ email }}",
+        )
+
+    def setUp(self):
+        self.handler.replies = {
+            "gone@example.com": "550 5.1.1 User unknown",
+            "busy@example.org": "451 4.7.1 Try again later",
+        }
+        self.handler.rcpt.clear()
+        self.handler.messages.clear()
+        self.handler.sessions = 0
+        patcher = mock.patch("mailing.throttling._local", LocalBuckets())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_connection(self):
+        return DeliveryConnection()
+
+    def send_round(self):
+        connection = self.get_connection()
+        try:
+            return send_newsletter_round(self.newsletter, connection)
+        finally:
+            connection.close()
+
+    def test_round(self):
+        result = self.send_round()
+        self.assertEqual(result.sent, 1)
+        ((rcpt_tos, data),) = self.handler.messages
+        self.assertEqual(rcpt_tos, ["a@example.com"])
+        self.assertIn(b"To: a@example.com\r\n", data)
+        self.assertIn("Здравствуйте, a@example.com".encode(), data)
+
+        # 550 — адрес попадает в список подавления, 451 — три повтора,
+        # после которых пишется неудачная попытка
+        self.assertEqual(self.handler.rcpt.count("gone@example.com"), 1)
+        self.assertEqual(self.handler.rcpt.count("busy@example.org"), 4)
+        suppressed = SuppressedAddress.objects.get()
+        self.assertEqual(
+            (suppressed.email, suppressed.smtp_code), ("gone@example.com", 550)
+        )
+        self.assertEqual(
+            dict(Attempt.objects.values_list("recipient__email", "status")),
+            {
+                "a@example.com": Attempt.Status.SUCCESS,
+                "gone@example.com": Attempt.Status.FAILURE,
+                "busy@example.org": Attempt.Status.FAILURE,
+            },
+        )
+
+        # В следующем раунде подавленный адрес уже не отправляется
+        self.handler.rcpt.clear()
+        self.send_round()
+        self.assertNotIn("gone@example.com", self.handler.rcpt)
+
+
+class SyncEngineTests(LocalSMTPServerMixin, TestCase):
+    def test_round_uses_one_session(self):
+        self.send_round()
+        self.assertEqual(self.handler.sessions, 1)
+
+
+class AsyncEngineTests(LocalSMTPServerMixin, TestCase):
+    def get_connection(self):
+        return AsyncDeliveryConnection()
+
+    def test_stop_skips_remaining_messages(self):
+        self.handler.replies = {}
+        result = send_newsletter_round(
+            self.newsletter,
+            AsyncDeliveryConnection(concurrency=1),
+            should_stop=lambda: bool(self.handler.messages),
+        )
+        self.assertEqual((result.sent, result.stopped), (1, True))
+        self.assertEqual(len(self.handler.messages), 1)
+        self.assertEqual(Attempt.objects.count(), 1)
+
+
+class AttemptBufferTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = CustomUser.objects.create(email="owner@example.com", username="owner")
+        cls.newsletter = create_newsletter(
+            owner, ["a@example.com", "b@example.com", "c@example.com"]
+        )
+        cls.recipients = list(cls.newsletter.segment.members().order_by("id"))
+
+    def attempt(self, recipient):
+        return Attempt(
+            newsletter=self.newsletter,
+            recipient=recipient,
+            status=Attempt.Status.SUCCESS,
+            response_id=intern_response("Сообщение отправлено"),
+        )
+
+    def test_flushes_at_checkpoint_when_batch_is_full(self):
+        first, second, third = self.recipients
+        # Сводка уже есть: сброс попыток должен обновить её счётчики
+        get_owner_statistics(self.newsletter.owner)
+        with AttemptBuffer(batch_size=2, flush_interval=60) as attempts:
+            attempts.add(self.attempt(first))
+            attempts.checkpoint(first.id)
+            attempts.add(self.attempt(second))
+            self.assertFalse(Attempt.objects.exists())
+            attempts.checkpoint(second.id)
+            self.assertEqual(Attempt.objects.count(), 2)
+            attempts.add(self.attempt(third))
+            attempts.checkpoint(third.id)
+            self.assertEqual(Attempt.objects.count(), 2)
+        self.assertEqual(Attempt.objects.count(), 3)
+        stats = get_owner_statistics(self.newsletter.owner)
+        self.assertEqual((stats.total_attempts, stats.successful_attempts), (3, 3))
+
+    def test_exception_keeps_attempts_consistent_with_cursor(self):
+        first, second, third = self.recipients
+        job = DeliveryJob.objects.create(
+            newsletter=self.newsletter, status="Выполняется"
+        )
+        with self.assertRaises(RuntimeError):
+            with AttemptBuffer(job, batch_size=10, flush_interval=60) as attempts:
+                attempts.add(self.attempt(first))
+                attempts.add(self.attempt(second))
+                attempts.checkpoint(second.id)
+                # Попытка после курсора: её получатель будет обработан заново
+                attempts.add(self.attempt(third))
+                raise RuntimeError
+        self.assertEqual(
+            sorted(Attempt.objects.values_list("recipient_id", flat=True)),
+            [first.id, second.id],
+        )
+        job.refresh_from_db()
+        self.assertEqual(job.last_recipient_id, second.id)
+
+
+class DeliveryCursorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = CustomUser.objects.create(email="owner@example.com", username="owner")
+        cls.newsletter = create_newsletter(
+            owner, ["a@example.com", "b@example.com", "c@example.com"]
+        )
+
+    @override_settings(MAILING_SMTP_BATCH_SIZE=1, MAILING_ATTEMPT_BATCH_SIZE=1)
+    def test_round_resumes_after_error(self):
+        job = DeliveryJob.objects.create(
+            newsletter=self.newsletter, status="Выполняется"
+        )
+        connection = BouncingConnection(set())
+        send = connection.send_messages
+
+        def fail_second_batch(messages, should_stop=None):
+            if connection.sent:
+                raise smtplib.SMTPException("Соединение потеряно")
+            return send(messages, should_stop)
+
+        connection.send_messages = fail_second_batch
+        with self.assertRaises(smtplib.SMTPException):
+            send_newsletter_round(self.newsletter, connection, job=job)
+        job.refresh_from_db()
+        first = Attempt.objects.get().recipient
+        self.assertEqual(job.last_recipient_id, first.id)
+
+        connection = BouncingConnection(set())
+        result = send_newsletter_round(self.newsletter, connection, job=job)
+        self.assertEqual(connection.sent, ["b@example.com", "c@example.com"])
+        self.assertEqual(result.sent, 2)
+        self.assertEqual(Attempt.objects.count(), 3)
+
+    @override_settings(MAILING_SMTP_BATCH_SIZE=1, MAILING_ATTEMPT_BATCH_SIZE=10)
+    def test_round_resumes_after_error_between_checkpoints(self):
+        # Ошибка после отправки второго письма, но до checkpoint(): его
+        # попытка не сохраняется, и при продолжении письмо уходит снова
+        # без второй записи в журнале
+        job = DeliveryJob.objects.create(
+            newsletter=self.newsletter, status="Выполняется"
+        )
+        with mock.patch(
+            "mailing.delivery.suppress_addresses",
+            side_effect=[None, RuntimeError("База недоступна")],
+        ):
+            with self.assertRaises(RuntimeError):
+                send_newsletter_round(
+                    self.newsletter, BouncingConnection(set()), job=job
+                )
+        job.refresh_from_db()
+        first = Attempt.objects.get().recipient
+        self.assertEqual(job.last_recipient_id, first.id)
+
+        connection = BouncingConnection(set())
+        send_newsletter_round(self.newsletter, connection, job=job)
+        self.assertEqual(connection.sent, ["b@example.com", "c@example.com"])
+        self.assertEqual(
+            sorted(Attempt.objects.values_list("recipient__email", flat=True)),
+            ["a@example.com", "b@example.com", "c@example.com"],
+        )
+
+
+class RecipientChunkTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = CustomUser.objects.create(email="owner@example.com", username="owner")
+        cls.newsletter = create_newsletter(
+            owner, [f"user{i}@example.com" for i in range(9)]
+        )
+        cls.ids = list(
+            cls.newsletter.segment.recipients.order_by("id").values_list(
+                "id", flat=True
+            )
+        )
+
+    def test_chunk_boundaries(self):
+        # 3 — число получателей кратно порции, 2 и 4 — последняя порция
+        # короче, 1 и 9 — крайние случаи
+        for chunk_size in (1, 2, 3, 4, 9):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(
+                    [
+                        r.pk
+                        for r in iter_recipients(self.newsletter, chunk_size=chunk_size)
+                    ],
+                    self.ids,
+                )
+
+    def test_resume_inside_chunk(self):
+        for chunk_size in (2, 3, 4):
+            for position, after_id in enumerate(self.ids):
+                with self.subTest(chunk_size=chunk_size, after_id=after_id):
+                    self.assertEqual(
+                        [
+                            r.pk
+                            for r in iter_recipients(
+                                self.newsletter, after_id, chunk_size
+                            )
+                        ],
+                        self.ids[position + 1 :],
+                    )
+
+    @override_settings(
+        MAILING_RECIPIENT_CHUNK_SIZE=3,
+        MAILING_SMTP_BATCH_SIZE=2,
+        MAILING_ATTEMPT_BATCH_SIZE=1,
+    )
+    def test_interrupted_round_sends_everyone_once(self):
+        # Пачки отправки (по 2) не совпадают с порциями чтения (по 3),
+        # и раунд прерывается посреди второй порции
+        job = DeliveryJob.objects.create(
+            newsletter=self.newsletter, status="Выполняется"
+        )
+        first = BouncingConnection(set())
+        stop_after = iter([False, False, True])
+        send_newsletter_round(
+            self.newsletter, first, should_stop=lambda: next(stop_after), job=job
+        )
+        job.refresh_from_db()
+        self.assertEqual(job.last_recipient_id, self.ids[3])
+
+        second = BouncingConnection(set())
+        send_newsletter_round(self.newsletter, second, job=job)
+        sent = first.sent + second.sent
+        self.assertEqual(sent, [f"user{i}@example.com" for i in range(9)])
+        self.assertEqual(
+            sorted(Attempt.objects.values_list("recipient_id", flat=True)), self.ids
+        )
+
+
+class ControlChannelTests(TransactionTestCase):
+    # Монитор читает статусы в своём потоке, поэтому данные теста
+    # должны быть закоммичены
+    def setUp(self):
+        owner = CustomUser.objects.create(email="owner@example.com", username="owner")
+        self.newsletter = create_newsletter(owner, ["a@example.com"], status="Запущена")
+
+    def watch(self, client):
+        patcher = mock.patch("mailing.control.get_redis", return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        monitor = _Monitor()
+        self.addCleanup(monitor.unwatch, self.newsletter.pk)
+        return monitor.watch(self.newsletter.pk)
+
+    def test_redis_command_sets_event(self):
+        event = self.watch(fakeredis.FakeRedis())
+        publish_command(self.newsletter.pk + 1, "pause")
+        self.assertFalse(event.wait(0.2))
+        publish_command(self.newsletter.pk, "pause")
+        self.assertTrue(event.wait(5))
+
+    @override_settings(MAILING_CONTROL_POLL_INTERVAL=0.05)
+    def test_database_polling_without_redis(self):
+        event = self.watch(None)
+        self.assertFalse(event.wait(0.2))
+        Newsletter.objects.filter(pk=self.newsletter.pk).update(status="Приостановлена")
+        self.assertTrue(event.wait(5))
+
+
+class PauseResumeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = CustomUser.objects.create(email="owner@example.com", username="owner")
+        cls.newsletter = create_newsletter(
+            owner,
+            ["a@example.com", "b@example.com", "c@example.com"],
+            status="Запущена",
+        )
+
+    def run_job(self, connection, stop):
+        (job,) = claim_jobs("host:1", limit=1)
+        with mock.patch("mailing.delivery.watch_newsletter") as watch, mock.patch(
+            "mailing.delivery.get_delivery_connection", return_value=connection
+        ):
+            watch.return_value.__enter__.return_value = stop
+            run_job(job)
+        job.refresh_from_db()
+        return job
+
+    @override_settings(MAILING_SMTP_BATCH_SIZE=1)
+    def test_paused_round_resumes_from_cursor(self):
+        enqueue_newsletter(self.newsletter)
+        stop = threading.Event()
+        connection = BouncingConnection(set())
+        send = connection.send_messages
+
+        def send_and_pause(messages, should_stop=None):
+            # Команда pause приходит, пока отправляется первая пачка
+            Newsletter.objects.filter(pk=self.newsletter.pk).update(
+                status="Приостановлена"
+            )
+            stop.set()
+            return send(messages, should_stop)
+
+        connection.send_messages = send_and_pause
+        job = self.run_job(connection, stop)
+        self.assertEqual(connection.sent, ["a@example.com"])
+        first = Attempt.objects.get().recipient
+        self.assertEqual((job.status, job.last_recipient_id), ("Выполнена", first.id))
+
+        Newsletter.objects.filter(pk=self.newsletter.pk).update(status="Запущена")
+        enqueue_newsletter(self.newsletter)
+        connection = BouncingConnection(set())
+        job = self.run_job(connection, threading.Event())
+        self.assertEqual(connection.sent, ["b@example.com", "c@example.com"])
+        self.assertEqual((job.round_number, job.last_recipient_id), (1, None))
+
+
+class SchedulerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create(
+            email="owner@example.com", username="owner"
+        )
+
+    def create_job(self, email, run_after, status="Запланирована", **fields):
+        newsletter = create_newsletter(self.owner, [email], status="Запущена", **fields)
+        return DeliveryJob.objects.create(
+            newsletter=newsletter, status=status, run_after=run_after
+        )
+
+    def test_promotes_due_jobs_in_chunks(self):
+        now = timezone.now()
+        due = [
+            self.create_job(f"r{i}@example.com", now - timedelta(minutes=i))
+            for i in range(3)
+        ]
+        future = self.create_job("later@example.com", now + timedelta(minutes=5))
+
+        scheduler = Scheduler(chunk_size=2, max_sleep=600)
+        self.assertEqual(scheduler.run_once(), (3, 0))
+        self.assertEqual(
+            set(
+                DeliveryJob.objects.filter(status="В очереди").values_list(
+                    "pk", flat=True
+                )
+            ),
+            {job.pk for job in due},
+        )
+        future.refresh_from_db()
+        self.assertEqual(future.status, "Запланирована")
+        self.assertAlmostEqual(scheduler.seconds_until_next_event(), 300, delta=5)
+
+    def test_finishes_expired_newsletters(self):
+        now = timezone.now()
+        expired = self.create_job(
+            "old@example.com",
+            now,
+            status="В очереди",
+            start_time=now - timedelta(hours=2),
+            end_time=now - timedelta(hours=1),
+        )
+        DeliveryJob.objects.filter(pk=expired.pk).update(last_recipient_id=1)
+        running = self.create_job(
+            "running@example.com",
+            now,
+            status="Выполняется",
+            end_time=now - timedelta(minutes=1),
+        )
+        active = self.create_job("active@example.com", now + timedelta(minutes=1))
+
+        self.assertEqual(Scheduler().finish_expired_newsletters(), 2)
+        self.assertEqual(
+            dict(Newsletter.objects.values_list("pk", "status")),
+            {
+                expired.newsletter_id: "Завершена",
+                running.newsletter_id: "Завершена",
+                active.newsletter_id: "Запущена",
+            },
+        )
+        expired.refresh_from_db()
+        self.assertEqual(
+            (expired.status, expired.last_recipient_id), ("Выполнена", None)
+        )
+        # Задачу выполняющегося раунда закрывает сам воркер
+        running.refresh_from_db()
+        self.assertEqual(running.status, "Выполняется")
+        self.assertEqual(get_owner_statistics(self.owner).active_newsletters, 1)
+
+
+class PreparedMessageTests(TestCase):
+    # Готовое письмо должно совпадать с тем, что собрал бы EmailMessage,
+    # кроме Date и Message-ID
+    to = "Иван Петров <ivan@example.com>"
+    context = {"full_name": "Иван", "comment": "постоянный клиент", "email": to}
+
+    def assertSameMessage(self, subject, body, context=None):
+        prepared = PreparedMessage(subject, body, "from@example.com")
+        rendered = email.message_from_bytes(
+            PreparedEmailMessage(prepared, self.to, context).message().as_bytes()
+        )
+        if context is not None:
+            subject, body = prepared.personalise(context)
+        expected = email.message_from_bytes(
+            EmailMessage(subject, body, "from@example.com", [self.to])
+            .message()
+            .as_bytes()
+        )
+
+        def headers(message):
+            return sorted(
+                (name, str(value))
+                for name, value in message.items()
+                if name not in ("Date", "Message-ID")
+            )
+
+        self.assertEqual(headers(rendered), headers(expected))
+        self.assertEqual(
+            rendered.get_payload(decode=True), expected.get_payload(decode=True)
+        )
+        self.assertTrue(rendered["Date"] and rendered["Message-ID"])
+        return rendered
+
+    def test_static_message(self):
+        rendered = self.assertSameMessage(
+            "Новости недели", "Текст письма\nВторая строка"
+        )
+        self.assertEqual(rendered["Content-Transfer-Encoding"], "8bit")
+
+    def test_ascii_message(self):
+        self.assertSameMessage("Weekly news", "Plain text body")
+
+    def test_long_lines_use_quoted_printable(self):
+        rendered = self.assertSameMessage("Тема", "ё" * 1000)
+        self.assertEqual(rendered["Content-Transfer-Encoding"], "quoted-printable")
+
+    def test_personalised_message(self):
+        rendered = self.assertSameMessage(
+            "Для {{ full_name }}",
+            "Здравствуйте, {{full_name}}! Вы {{ comment }}.",
+            self.context,
+        )
+        self.assertEqual(
+            rendered.get_payload(decode=True).decode(),
+            "Здравствуйте, Иван! Вы постоянный клиент.",
+        )
+
+    def test_personalised_long_line_uses_quoted_printable(self):
+        rendered = self.assertSameMessage(
+            "Тема", "{{ full_name }} " + "ё" * 1000, self.context
+        )
+        self.assertEqual(rendered["Content-Transfer-Encoding"], "quoted-printable")
+
+    def test_missing_fields_are_empty(self):
+        self.assertSameMessage(
+            "{{ comment }}", "Привет, {{ full_name }}", {"email": self.to}
+        )
+
+
+@override_settings(MAILING_EXPORT_CHUNK_SIZE=2)
+class AttemptExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create(
+            email="owner@example.com", username="owner"
+        )
+        cls.other = CustomUser.objects.create(
+            email="other@example.com", username="other"
+        )
+        cls.newsletter = create_newsletter(
+            cls.owner, ["a@example.com", "b@example.com", "c@example.com"]
+        )
+        other_newsletter = create_newsletter(cls.other, ["x@example.com"])
+        for newsletter in (cls.newsletter, other_newsletter):
+            Attempt.objects.bulk_create(
+                Attempt(
+                    newsletter=newsletter,
+                    recipient=recipient,
+                    status=Attempt.Status.SUCCESS,
+                    response_id=intern_response("Сообщение отправлено"),
+                )
+                for recipient in newsletter.segment.members().order_by("id")
+            )
+        cls.url = reverse("mailing:export_attempts")
+
+    def export(self, **params):
+        self.client.force_login(self.owner)
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return list(response.streaming_content)
+
+    def test_csv_is_streamed_in_chunks(self):
+        chunks = self.export()
+        # Заголовок и две строки, затем последняя строка
+        self.assertEqual(len(chunks), 2)
+        rows = list(csv.reader(io.StringIO(b"".join(chunks).decode())))
+        self.assertEqual(rows[0], EXPORT_FIELDS)
+        self.assertEqual(
+            [(row[2], row[4], row[5]) for row in rows[1:]],
+            [
+                (email, "Успешно", "Сообщение отправлено")
+                for email in ("a@example.com", "b@example.com", "c@example.com")
+            ],
+        )
+
+    def test_jsonl_gzip(self):
+        plain = b"".join(self.export(format="jsonl"))
+        compressed = b"".join(self.export(format="jsonl", gzip="1"))
+        self.assertEqual(gzip.decompress(compressed), plain)
+        rows = [json.loads(line) for line in plain.decode().splitlines()]
+        self.assertEqual(
+            [row["recipient_email"] for row in rows],
+            ["a@example.com", "b@example.com", "c@example.com"],
+        )
+        self.assertEqual(set(rows[0]), set(EXPORT_FIELDS))
+
+    def test_filters(self):
+        self.assertEqual(b"".join(self.export(since="2000-01-01")).count(b"\n"), 4)
+        self.assertEqual(b"".join(self.export(until="2000-01-01")).count(b"\n"), 1)
+        # Чужие попытки не выгружаются даже с явным owner
+        body = b"".join(self.export(owner=self.other.pk))
+        self.assertNotIn(b"x@example.com", body)
+
+    def test_rejects_bad_parameters(self):
+        self.client.force_login(self.owner)
+        self.assertEqual(self.client.get(self.url, {"format": "xml"}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"since": "вчера"}).status_code, 400)
+
+    def test_command_writes_gzip_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "attempts.csv.gz")
+            call_command(
+                "export_attempts",
+                newsletter=self.newsletter.pk,
+                gzip=True,
+                output=path,
+            )
+            with gzip.open(path, "rt") as exported:
+                rows = list(csv.reader(exported))
+        self.assertEqual(len(rows), 4)
+
+
+class CompactionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create(
+            email="owner@example.com", username="owner"
+        )
+        cls.newsletter = create_newsletter(
+            cls.owner, [f"r{i}@example.com" for i in range(5)]
+        )
+        now = timezone.now()
+        cls.first_day = now - timedelta(days=101)
+        cls.second_day = now - timedelta(days=100)
+        success, failure = Attempt.Status.SUCCESS, Attempt.Status.FAILURE
+        history = [
+            (cls.first_day, success),
+            (cls.first_day, failure),
+            (cls.first_day, success),
+            (cls.second_day, failure),
+            (now, success),
+        ]
+        response_id = intern_response("Ответ сервера")
+        Attempt.objects.bulk_create(
+            Attempt(
+                newsletter=cls.newsletter,
+                recipient=recipient,
+                attempt_time=moment,
+                status=status,
+                response_id=response_id,
+            )
+            for recipient, (moment, status) in zip(
+                cls.newsletter.segment.members().order_by("id"), history
+            )
+        )
+        rebuild_owner_statistics(cls.owner.pk)
+
+    def owner_statistics(self):
+        stats = get_owner_statistics(self.owner)
+        return {field: getattr(stats, field) for field in STATISTICS_FIELDS}
+
+    def newsletter_statistics(self):
+        statistics = newsletter_statistics(self.newsletter)
+        return {field: statistics[field] for field in ATTEMPT_FIELDS}
+
+    def test_statistics_do_not_change(self):
+        owner_before = self.owner_statistics()
+        newsletter_before = self.newsletter_statistics()
+
+        # Первый день делится между пачками: итог дня дополняется
+        compacted = compact_attempts(timezone.now() - timedelta(days=90), 2)
+        self.assertEqual(compacted, 4)
+        self.assertEqual(Attempt.objects.count(), 1)
+        self.assertEqual(
+            set(
+                AttemptSummary.objects.values_list(
+                    "day",
+                    "total_attempts",
+                    "successful_attempts",
+                    "unsuccessful_attempts",
+                )
+            ),
+            {
+                (timezone.localdate(self.first_day), 3, 2, 1),
+                (timezone.localdate(self.second_day), 1, 0, 1),
+            },
+        )
+        self.assertEqual(self.owner_statistics(), owner_before)
+        self.assertEqual(self.newsletter_statistics(), newsletter_before)
+        rebuilt = rebuild_owner_statistics(self.owner.pk)
+        self.assertEqual(
+            {field: getattr(rebuilt, field) for field in STATISTICS_FIELDS},
+            owner_before,
+        )
+
+        # Повторный запуск ничего не сворачивает
+        self.assertEqual(compact_attempts(timezone.now() - timedelta(days=90)), 0)
+
+    def test_deleting_newsletter_discounts_summaries(self):
+        compact_attempts(timezone.now() - timedelta(days=90))
+        self.newsletter.delete()
+        stats = self.owner_statistics()
+        self.assertEqual([stats[field] for field in ATTEMPT_FIELDS], [0, 0, 0])
+
+
+def fake_redis_caches(location):
+    # django-redis поверх fakeredis: у каждого LOCATION свой пул соединений
+    return {
+        "default": {
+            "BACKEND": "django_redis.cache.RedisCache",
+            "LOCATION": location,
+            "OPTIONS": {
+                "CLIENT_CLASS": "mailing.cache_clients.ProfiledRedisClient",
+                "CONNECTION_POOL_KWARGS": {
+                    "connection_class": fakeredis.FakeConnection,
+                    "server": fakeredis.FakeServer(),
+                },
+            },
+        }
+    }
+
+
+@override_settings(
+    CACHES=fake_redis_caches("redis://localhost:6379/15"),
+    MAILING_PROFILING=True,
+    MAILING_SLOW_REQUEST_MS=60 * 1000,
+)
+class ProfilingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create(
+            email="owner@example.com", username="owner"
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.owner)
+
+    def test_middleware_stores_counters_per_view(self):
+        url = reverse("mailing:statistics")
+        self.client.get(url)
+        first = load_profiles()["mailing:statistics"]
+        self.client.get(url)
+        second = load_profiles()["mailing:statistics"]
+
+        self.assertEqual((first["requests"], second["requests"]), (1, 2))
+        self.assertGreater(first["queries"], 0)
+        self.assertGreater(second["wall_ms"], first["wall_ms"])
+        # Первый запрос строит сводку (промахи), второй читает её из кэша
+        self.assertGreater(first["cache_misses"], 0)
+        self.assertEqual(second["cache_misses"], first["cache_misses"])
+        self.assertGreater(second["cache_hits"], first["cache_hits"])
+
+    def test_get_many_counts_hits_and_misses(self):
+        cache.set("a", 1)
+        cache.set("b", 2)
+        profile = RequestProfile()
+        with mock.patch("mailing.profiling._current_profile") as current:
+            current.get.return_value = profile
+            self.assertEqual(cache.get_many(["a", "b", "c"]), {"a": 1, "b": 2})
+            self.assertIsNone(cache.get("c"))
+        self.assertEqual((profile.cache_hits, profile.cache_misses), (2, 2))
+
+    @override_settings(MAILING_SLOW_REQUEST_MS=0)
+    def test_slow_request_is_logged(self):
+        with self.assertLogs("mailing.profiling", "WARNING") as logs:
+            self.client.get(reverse("mailing:statistics"))
+        self.assertIn("Медленный запрос /", logs.output[0])
+
+    def test_duplicate_queries(self):
+        profile = RequestProfile()
+        for sql in ("SELECT 1", "SELECT 2", "SELECT 1", "SELECT 1"):
+            profile(lambda *args: None, sql, (), False, {})
+        self.assertEqual(profile.queries, 4)
+        self.assertEqual(profile.duplicates, [("SELECT 1", 3)])
+        self.assertEqual(profile.duplicate_queries, 2)
+
+
+class OwnerCacheVersionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create(
+            email="owner@example.com", username="owner"
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def assertBumps(self, sections, change):
+        before = {section: get_version(self.owner.pk, section) for section in sections}
+        # Версия меняется только после фиксации транзакции
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+            self.assertEqual(
+                {section: get_version(self.owner.pk, section) for section in sections},
+                before,
+            )
+        for section in sections:
+            self.assertNotEqual(get_version(self.owner.pk, section), before[section])
+
+    def test_save_and_delete_bump_versions(self):
+        recipient = Recipient(email="a@example.com", full_name="", owner=self.owner)
+        self.assertBumps([RECIPIENTS], recipient.save)
+        message = Message(subject="Тема", body="Текст", owner=self.owner)
+        self.assertBumps([MESSAGES, NEWSLETTERS], message.save)
+        segment = Segment(name="Список", owner=self.owner)
+        self.assertBumps([SEGMENTS, NEWSLETTERS], segment.save)
+        now = timezone.now()
+        newsletter = Newsletter(
+            start_time=now,
+            end_time=now + timedelta(hours=1),
+            message=message,
+            segment=segment,
+            owner=self.owner,
+        )
+        self.assertBumps([NEWSLETTERS], newsletter.save)
+
+        self.assertBumps([NEWSLETTERS], newsletter.delete)
+        self.assertBumps([SEGMENTS, NEWSLETTERS], segment.delete)
+        self.assertBumps([MESSAGES, NEWSLETTERS], message.delete)
+        self.assertBumps([RECIPIENTS], recipient.delete)
+
+    def test_cached_value_is_rebuilt_after_bump(self):
+        builder = mock.Mock(side_effect=[["старый"], ["новый"]])
+        for _ in range(2):
+            self.assertEqual(
+                get_cached(self.owner.pk, RECIPIENTS, "list", builder), ["старый"]
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipient.objects.create(
+                email="a@example.com", full_name="", owner=self.owner
+            )
+        self.assertEqual(
+            get_cached(self.owner.pk, RECIPIENTS, "list", builder), ["новый"]
+        )
+        self.assertEqual(builder.call_count, 2)
+
+    def test_evicted_version_does_not_repeat(self):
+        first = get_version(self.owner.pk, RECIPIENTS)
+        cache.delete(f"mailing:owner:{self.owner.pk}:{RECIPIENTS}:version")
+        self.assertGreater(get_version(self.owner.pk, RECIPIENTS), first)
@@ -0,0 +1,213 @@
+import logging
+import math
+import smtplib
+import threading
+import time
+
+import aiosmtplib
+from django.conf import settings
+
+from .control import get_redis
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "mailing:rate:"
+
+# Вёдра токенов учётной записи и доменов пополняются и списываются одним
+# атомарным вызовом, поэтому лимит общий для всех воркеров. Время берётся
+# у Redis, а не у воркеров, чьи часы могут расходиться.
+# KEYS: ведро учётной записи, затем для каждого домена ведро и ключ паузы.
+# ARGV: скорость и запас учётной записи, затем для каждого домена скорость,
+# запас и число писем. Скорость 0 означает «без ограничения».
+# Возвращает для каждого домена {разрешено писем, мс до следующего токена}
+TAKE_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local function load(key, rate, burst)
+    if rate <= 0 then
+        return math.huge
+    end
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    if not state[1] then
+        return burst
+    end
+    local elapsed = math.max(0, now - tonumber(state[2]))
+    return math.min(burst, tonumber(state[1]) + elapsed * rate)
+end
+
+local function save(key, tokens, rate, burst)
+    if rate > 0 then
+        redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', tostring(now))
+        redis.call('PEXPIRE', key, math.ceil(burst / rate * 1000) + 1000)
+    end
+end
+
+local function wait_ms(tokens, rate)
+    if tokens >= 1 then
+        return 0
+    end
+    return math.ceil((1 - tokens) / rate * 1000)
+end
+
+local account_rate = tonumber(ARGV[1])
+local account = load(KEYS[1], account_rate, tonumber(ARGV[2]))
+local result = {}
+for i = 1, (#KEYS - 1) / 2 do
+    local bucket, pause = KEYS[i * 2], KEYS[i * 2 + 1]
+    local rate = tonumber(ARGV[i * 3])
+    local burst = tonumber(ARGV[i * 3 + 1])
+    local requested = tonumber(ARGV[i * 3 + 2])
+    local paused = redis.call('PTTL', pause)
+    if paused > 0 then
+        result[i] = {0, paused}
+    else
+        local tokens = load(bucket, rate, burst)
+        local granted = math.min(requested, math.floor(tokens), math.floor(account))
+        tokens = tokens - granted
+        account = account - granted
+        save(bucket, tokens, rate, burst)
+        local wait = 0
+        if granted < requested then
+            wait = math.max(wait_ms(tokens, rate), wait_ms(account, account_rate))
+        end
+        result[i] = {granted, wait}
+    end
+end
+save(KEYS[1], account, account_rate, tonumber(ARGV[2]))
+return result
+"""
+
+
+def _limit(value):
+    # (писем в секунду, запас) из настроек; None — без ограничения
+    return value or (0, 0)
+
+
+def domain_limit(domain):
+    return _limit(
+        settings.MAILING_DOMAIN_RATE_LIMITS.get(
+            domain, settings.MAILING_DOMAIN_RATE_LIMIT
+        )
+    )
+
+
+def _account_key():
+    return f"{KEY_PREFIX}account:{settings.EMAIL_HOST}:{settings.EMAIL_HOST_USER}"
+
+
+class LocalBuckets:
+    # Те же вёдра в памяти процесса, если кэш настроен без Redis.
+    # Лимит тогда действует на каждый процесс отдельно
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}  # {ключ: (токены, время)}
+        self._paused = {}  # {домен: время окончания паузы}
+
+    def _load(self, key, rate, burst, now):
+        if rate <= 0:
+            return math.inf
+        tokens, updated = self._buckets.get(key, (burst, now))
+        return min(burst, tokens + (now - updated) * rate)
+
+    def _save(self, key, tokens, rate, now):
+        if rate > 0:
+            self._buckets[key] = (tokens, now)
+
+    def take(self, requests):
+        now = time.monotonic()
+        account_rate, account_burst = _limit(settings.MAILING_ACCOUNT_RATE_LIMIT)
+        result = {}
+        with self._lock:
+            account = self._load("account", account_rate, account_burst, now)
+            for domain, requested in requests.items():
+                paused = self._paused.get(domain, 0) - now
+                if paused > 0:
+                    result[domain] = (0, paused)
+                    continue
+                rate, burst = domain_limit(domain)
+                tokens = self._load(domain, rate, burst, now)
+                granted = int(min(requested, tokens, account))
+                tokens -= granted
+                account -= granted
+                self._save(domain, tokens, rate, now)
+                wait = 0
+                if granted < requested:
+                    wait = max(_wait(tokens, rate), _wait(account, account_rate))
+                result[domain] = (granted, wait)
+            self._save("account", account, account_rate, now)
+        return result
+
+    def pause(self, domain, seconds):
+        with self._lock:
+            self._paused[domain] = time.monotonic() + seconds
+
+
+def _wait(tokens, rate):
+    return 0 if tokens >= 1 else (1 - tokens) / rate
+
+
+_local = LocalBuckets()
+_take_script = None  # redis.commands.core.Script, регистрируется один раз
+
+
+def take_tokens(requests):
+    # requests: {домен: писем к отправке}.
+    # Возвращает {домен: (разрешено писем, секунд до следующего токена)}
+    client = get_redis()
+    if client is not None:
+        keys = [_account_key()]
+        args = list(_limit(settings.MAILING_ACCOUNT_RATE_LIMIT))
+        for domain, requested in requests.items():
+            keys += [f"{KEY_PREFIX}domain:{domain}", f"{KEY_PREFIX}pause:{domain}"]
+            args += [*domain_limit(domain), requested]
+        try:
+            granted = _take(client, keys, args)
+        except Exception:
+            logger.warning(
+                "Лимиты отправки в Redis недоступны, действуют лимиты процесса",
+                exc_info=True,
+            )
+        else:
+            return {
+                domain: (int(count), int(wait) / 1000)
+                for domain, (count, wait) in zip(requests, granted)
+            }
+    return _local.take(requests)
+
+
+def _take(client, keys, args):
+    # Script сам загружает скрипт в Redis (EVALSHA, при NOSCRIPT — SCRIPT LOAD)
+    global _take_script
+    if _take_script is None:
+        _take_script = client.register_script(TAKE_SCRIPT)
+    return _take_script(keys=keys, args=args, client=client)
+
+
+def pause_domain(domain, seconds=None):
+    # Сервер домена попросил повторить позже: домен не получает писем
+    # seconds секунд (по умолчанию MAILING_DOMAIN_BACKOFF)
+    seconds = seconds or settings.MAILING_DOMAIN_BACKOFF
+    client = get_redis()
+    if client is not None:
+        try:
+            client.set(f"{KEY_PREFIX}pause:{domain}", 1, px=int(seconds * 1000))
+            return
+        except Exception:
+            logger.warning(f"Не удалось приостановить домен {domain}", exc_info=True)
+    _local.pause(domain, seconds)
+
+
+def temporary_failure(error):
+    # Временный отказ сервера (4xx): письмо нужно повторить позже
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in error.recipients.values()]
+    elif isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        codes = [refused.code for refused in error.recipients]
+    elif isinstance(error, smtplib.SMTPResponseException):
+        codes = [error.smtp_code]
+    elif isinstance(error, aiosmtplib.SMTPResponseException):
+        codes = [error.code]
+    else:
+        return False
+    return any(400 <= code < 500 for code in codes)
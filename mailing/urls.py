@@ -9,11 +9,18 @@ urlpatterns = [
     path("dashboard/", views.ManagerDashboardView.as_view(), name="dashboard"),
     path("mailing/", views.MailingView.as_view(), name="mailing"),
     path("add_recipient/", views.AddRecipientView.as_view(), name="add_recipient"),
+    path(
+        "import_recipients/",
+        views.ImportRecipientsView.as_view(),
+        name="import_recipients",
+    ),
     path(
         "edit_recipient/<pk>/", views.EditRecipientView.as_view(), name="edit_recipient"
     ),
     path("add_message/", views.AddMessageView.as_view(), name="add_message"),
     path("edit_message/<pk>/", views.EditMessageView.as_view(), name="edit_message"),
+    path("add_segment/", views.AddSegmentView.as_view(), name="add_segment"),
+    path("edit_segment/<pk>/", views.EditSegmentView.as_view(), name="edit_segment"),
     path(
         "delete/<str:object_type>/<int:pk>/",
         views.DeleteObjectView.as_view(),
@@ -25,6 +32,12 @@ urlpatterns = [
         views.AttemptListView.as_view(),
         name="newsletter_attempts",
     ),
+    path("attempts/export/", views.AttemptExportView.as_view(), name="export_attempts"),
+    path(
+        "newsletters/<int:pk>/statistics/",
+        views.NewsletterStatisticsView.as_view(),
+        name="newsletter_statistics",
+    ),
     path("my_newsletters/", views.MyNewslettersView.as_view(), name="my_newsletters"),
     path(
         "send_newsletter/<pk>/",
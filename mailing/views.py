@@ -1,13 +1,7 @@
+import csv
 import logging
-import threading
-import time
 
-from django.conf import settings
-from django.core.cache import cache
-from django.views.decorators.cache import cache_page
 from django.views.decorators.cache import cache_control
-from django.utils.decorators import method_decorator
-from django.core.mail import send_mail
 from django.views.generic import (
     CreateView,
     UpdateView,
@@ -15,19 +9,50 @@ from django.views.generic import (
     ListView,
     View,
     TemplateView,
+    FormView,
 )
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse_lazy
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.utils import timezone
-from django.core.exceptions import ValidationError
-from django.core.validators import validate_email
+from django.core.exceptions import BadRequest, PermissionDenied
+from django.core.paginator import Paginator
+from django.db import IntegrityError
+from django.db.models import Count, ProtectedError, Q
+from django.http import JsonResponse, StreamingHttpResponse
+from django.conf import settings
 
 from users.models import CustomUser
+from .cache import (
+    MESSAGES,
+    NEWSLETTERS,
+    RECIPIENTS,
+    SEGMENTS,
+    STATISTICS,
+    get_cached,
+    get_versions,
+)
+from .control import publish_command
+from .delivery import enqueue_newsletter, restart_round
 from .mixins import UserMessagesAndRecipientsMixin, ManagerRequiredMixin
-from .models import Attempt, Recipient, Message, Newsletter
-from .forms import NewsletterForm, MessageForm, RecipientForm
+from .models import Attempt, Recipient, Message, Newsletter, Segment
+from .forms import (
+    NewsletterForm,
+    MessageForm,
+    RecipientForm,
+    RecipientImportForm,
+    SegmentForm,
+)
+from .export import EXPORT_FORMATS, export_attempts, parse_moment
+from .imports import import_recipients, read_rows
+from .pagination import keyset_page
+from .statistics import (
+    STATISTICS_FIELDS,
+    get_owner_statistics,
+    newsletter_attempt_counts,
+    newsletter_statistics,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -37,14 +62,16 @@ class MailingView(LoginRequiredMixin, ListView):
     template_name = "mailing/mailing.html"
     context_object_name = "newsletters"
 
-    @method_decorator(cache_page(10))
-    def dispatch(self, *args, **kwargs):
-        return super().dispatch(*args, **kwargs)
-
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        # Списки ленивые: при попадании во фрагментный кэш запросов нет вовсе
         context["messages_users"] = Message.objects.filter(owner=self.request.user)
         context["recipients"] = Recipient.objects.filter(owner=self.request.user)
+        context["segments"] = Segment.objects.filter(owner=self.request.user)
+        context["cache_versions"] = get_versions(
+            self.request.user.id, MESSAGES, RECIPIENTS, SEGMENTS
+        )
+        context["cache_timeout"] = settings.MAILING_OWNER_CACHE_TIMEOUT
         return context
 
 
@@ -56,14 +83,7 @@ class AddMessageView(LoginRequiredMixin, CreateView):
 
     def form_valid(self, form):
         form.instance.owner = self.request.user
-        response = super().form_valid(form)
-        print(f"Message created: {form.instance}")
-
-        # Обновление кэша
-        cache_key = f'user_{self.request.user.id}_messages'
-        cache.delete(cache_key)  # Удаление старого кэша
-
-        return response
+        return super().form_valid(form)
 
 
 class EditMessageView(LoginRequiredMixin, UpdateView):
@@ -80,6 +100,8 @@ class DeleteObjectView(LoginRequiredMixin, UserMessagesAndRecipientsMixin, View)
             obj = get_object_or_404(Message, pk=pk)
         elif object_type == "recipient":
             obj = get_object_or_404(Recipient, pk=pk)
+        elif object_type == "segment":
+            obj = get_object_or_404(Segment, pk=pk, owner=request.user)
         else:
             return redirect("mailing:mailing")
 
@@ -93,15 +115,17 @@ class DeleteObjectView(LoginRequiredMixin, UserMessagesAndRecipientsMixin, View)
     def post(request, pk, object_type):
         if object_type == "message":
             obj = get_object_or_404(Message, pk=pk)
-            cache_key = 'message_{}'.format(obj.id)  # Уникальный ключ для сообщения
         elif object_type == "recipient":
             obj = get_object_or_404(Recipient, pk=pk)
-            cache_key = 'recipient_{}'.format(obj.id)  # Уникальный ключ для получателя
+        elif object_type == "segment":
+            obj = get_object_or_404(Segment, pk=pk, owner=request.user)
         else:
             return redirect("mailing:mailing")
 
-        obj.delete()
-        cache.delete(cache_key)
+        try:
+            obj.delete()
+        except ProtectedError:
+            messages.error(request, "Список используется в рассылках.")
         return redirect("mailing:mailing")
 
 
@@ -111,11 +135,53 @@ class AddRecipientView(LoginRequiredMixin, CreateView):
     template_name = "mailing/add_recipient.html"
     success_url = reverse_lazy("mailing:mailing")
 
+    def get_form_kwargs(self):
+        # Владелец нужен форме до проверки, чтобы найти дубликат адреса
+        kwargs = super().get_form_kwargs()
+        kwargs["instance"] = Recipient(owner=self.request.user)
+        return kwargs
+
+
+class ImportRecipientsView(LoginRequiredMixin, FormView):
+    # Загрузка больше FILE_UPLOAD_MAX_MEMORY_SIZE Django пишет во временный
+    # файл, а read_rows читает его построчно. Для списков на миллионы адресов
+    # удобнее команда import_recipients
+    form_class = RecipientImportForm
+    template_name = "mailing/import_recipients.html"
+    success_url = reverse_lazy("mailing:mailing")
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs["user"] = self.request.user
+        return kwargs
+
     def form_valid(self, form):
-        form.instance.owner = self.request.user
-        response = super().form_valid(form)
-        print(f"Recipient created: {form.instance}")
-        return response
+        try:
+            result = import_recipients(
+                self.request.user.id,
+                read_rows(form.cleaned_data["file"]),
+                segment=form.cleaned_data["segment"],
+            )
+        except (ValueError, csv.Error) as e:
+            form.add_error("file", f"Не удалось прочитать файл: {e}")
+            return self.form_invalid(form)
+        except IntegrityError:
+            # Адреса файла одновременно добавлялись в другом запросе, и
+            # повторы порции (CONFLICT_RETRIES) не помогли. Записанные
+            # порции сохранены, повторная загрузка их пропустит
+            form.add_error(
+                "file",
+                "Получатели из файла одновременно добавляются в другом окне. "
+                "Загрузите файл ещё раз.",
+            )
+            return self.form_invalid(form)
+        messages.success(
+            self.request,
+            f"Добавлено получателей: {result.created}, повторов: "
+            f"{result.duplicates}, с ошибками: {result.invalid} "
+            f"({result.rate:.0f} строк/с).",
+        )
+        return super().form_valid(form)
 
 
 class EditRecipientView(LoginRequiredMixin, UpdateView):
@@ -125,6 +191,27 @@ class EditRecipientView(LoginRequiredMixin, UpdateView):
     success_url = reverse_lazy("mailing:mailing")
 
 
+class AddSegmentView(LoginRequiredMixin, CreateView):
+    model = Segment
+    form_class = SegmentForm
+    template_name = "mailing/add_segment.html"
+    success_url = reverse_lazy("mailing:mailing")
+
+    def form_valid(self, form):
+        form.instance.owner = self.request.user
+        return super().form_valid(form)
+
+
+class EditSegmentView(LoginRequiredMixin, UpdateView):
+    model = Segment
+    form_class = SegmentForm
+    template_name = "mailing/add_segment.html"
+    success_url = reverse_lazy("mailing:mailing")
+
+    def get_queryset(self):
+        return Segment.objects.filter(owner=self.request.user)
+
+
 # CRUD for Newsletters
 class CreateNewsletterView(LoginRequiredMixin, CreateView):
     model = Newsletter
@@ -157,6 +244,10 @@ class EditNewsletterView(LoginRequiredMixin, UpdateView):
         newsletter = form.save(commit=False)
         newsletter.status = "Создана"
         newsletter.save()
+        # Изменённая рассылка отправляется заново с первого получателя;
+        # выполняющийся раунд со старыми данными останавливается
+        restart_round(newsletter)
+        publish_command(newsletter.id, "stop")
         messages.success(self.request, "Рассылка успешно обновлена.")
         return super().form_valid(form)
 
@@ -172,12 +263,18 @@ class MyNewslettersView(LoginRequiredMixin, ListView):
     template_name = "mailing/my_newsletters.html"
     context_object_name = "newsletters"
 
-    @method_decorator(cache_page(5))
-    def dispatch(self, *args, **kwargs):
-        return super().dispatch(*args, **kwargs)
-
     def get_queryset(self):
-        return Newsletter.objects.filter(owner=self.request.user)
+        # Кэшируются данные, а не HTML: оставшееся время считается при каждом запросе
+        return get_cached(
+            self.request.user.id,
+            NEWSLETTERS,
+            "list",
+            lambda: list(
+                Newsletter.objects.filter(owner=self.request.user).select_related(
+                    "message", "segment"
+                )
+            ),
+        )
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -204,75 +301,6 @@ class MyNewslettersView(LoginRequiredMixin, ListView):
         return context
 
 
-def send_newsletter(newsletter_id):
-    try:
-        newsletter = Newsletter.objects.get(id=newsletter_id)
-    except Newsletter.DoesNotExist:
-        return
-
-    recipients = newsletter.recipients.all()
-    if not recipients.exists():
-        return
-
-    interval = 120
-
-    end_time = newsletter.end_time
-
-    if end_time.tzinfo is None:
-        end_time = timezone.make_aware(end_time)
-
-    current_time = timezone.now()
-
-    if current_time > end_time:
-        newsletter.status = "Завершена"
-        newsletter.save()
-        return
-
-    while timezone.now() < end_time:
-        newsletter.refresh_from_db()
-        if newsletter.status == "Приостановлена":
-            return
-
-        for recipient in recipients:
-            try:
-                validate_email(recipient.email)
-
-                send_mail(
-                    newsletter.message.subject,
-                    newsletter.message.body,
-                    settings.DEFAULT_FROM_EMAIL,
-                    [recipient.email],
-                    fail_silently=False,
-                )
-                Attempt.objects.create(
-                    newsletter=newsletter,
-                    recipient=recipient,
-                    status="Успешно",
-                    server_response="Сообщение отправлено",
-                )
-
-            except ValidationError:
-                Attempt.objects.create(
-                    newsletter=newsletter,
-                    recipient=recipient,
-                    status="Не успешно",
-                    server_response="Некорректный адрес электронной почты",
-                )
-
-            except Exception as e:
-                Attempt.objects.create(
-                    newsletter=newsletter,
-                    recipient=recipient,
-                    status="Не успешно",
-                    server_response=str(e),
-                )
-
-        time.sleep(interval)
-
-    newsletter.status = "Завершена"
-    newsletter.save()
-
-
 class SendNewsletterView(LoginRequiredMixin, View):
     @staticmethod
     def post(request, pk):
@@ -285,9 +313,16 @@ class SendNewsletterView(LoginRequiredMixin, View):
         newsletter.status = "Запущена"
         newsletter.save()
 
-        threading.Thread(target=send_newsletter, args=(newsletter.id,)).start()
+        run_after = enqueue_newsletter(newsletter)
 
-        messages.success(request, "Рассылка запущена.")
+        if run_after > timezone.now():
+            messages.success(
+                request,
+                "Рассылка запланирована на "
+                f"{timezone.localtime(run_after):%d.%m.%Y %H:%M}.",
+            )
+        else:
+            messages.success(request, "Рассылка запущена.")
         return redirect("mailing:my_newsletters")
 
 
@@ -297,54 +332,139 @@ class PauseNewsletterView(LoginRequiredMixin, View):
         newsletter = get_object_or_404(Newsletter, pk=pk)
         newsletter.status = "Приостановлена"
         newsletter.save()
+        publish_command(newsletter.id, "pause")
         messages.success(request, "Рассылка приостановлена.")
         return redirect("mailing:my_newsletters")
 
 
-class AttemptListView(ListView):
+class AttemptListView(LoginRequiredMixin, ListView):
+    # Журнал (и его JSON-вариант) доступен владельцу рассылки и менеджерам
     model = Attempt
     template_name = "mailing/attempt_list.html"
     context_object_name = "attempts"
 
     def get_queryset(self):
-        newsletter_id = self.kwargs.get("pk")
-        return Attempt.objects.filter(newsletter_id=newsletter_id).order_by(
-            "-attempt_time"
+        newsletter = get_object_or_404(Newsletter, pk=self.kwargs.get("pk"))
+        if (
+            newsletter.owner_id != self.request.user.id
+            and not self.request.user.groups.filter(name="Менеджеры").exists()
+        ):
+            raise PermissionDenied
+        queryset = Attempt.objects.filter(newsletter=newsletter).select_related(
+            "recipient", "response"
+        )
+        self.status = self.request.GET.get("status", "")
+        if self.status in {str(value) for value in Attempt.Status.values}:
+            queryset = queryset.filter(status=self.status)
+        else:
+            self.status = ""
+        attempts, self.next_cursor = keyset_page(
+            queryset,
+            self.request.GET.get("cursor"),
+            settings.MAILING_ATTEMPTS_PAGE_SIZE,
+        )
+        return attempts
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["newsletter_id"] = self.kwargs.get("pk")
+        context["status"] = self.status
+        context["status_choices"] = Attempt.Status.choices
+        context["next_cursor"] = self.next_cursor
+        return context
+
+    def render_to_response(self, context, **response_kwargs):
+        # JSON-вариант для подгрузки следующих страниц без перезагрузки
+        if self.request.GET.get("format") == "json":
+            return JsonResponse(
+                {
+                    "results": [
+                        {
+                            "id": attempt.id,
+                            "recipient": (
+                                attempt.recipient.email if attempt.recipient else None
+                            ),
+                            "attempt_time": attempt.attempt_time,
+                            "status": attempt.get_status_display(),
+                            "server_response": attempt.server_response,
+                        }
+                        for attempt in context["attempts"]
+                    ],
+                    "next_cursor": self.next_cursor,
+                }
+            )
+        return super().render_to_response(context, **response_kwargs)
+
+
+class AttemptExportView(LoginRequiredMixin, View):
+    # Выгрузка журнала попыток: ?format=csv|jsonl&newsletter=&since=&until=&gzip=1.
+    # Менеджер может выгрузить попытки любого владельца (?owner=)
+    def get(self, request):
+        export_format = request.GET.get("format", "csv")
+        if export_format not in EXPORT_FORMATS:
+            raise BadRequest("Неизвестный формат выгрузки")
+        try:
+            filters = {
+                "newsletter_id": int(request.GET.get("newsletter") or 0) or None,
+                "owner_id": int(request.GET.get("owner") or 0) or None,
+                "since": parse_moment(request.GET.get("since")),
+                "until": parse_moment(request.GET.get("until")),
+            }
+        except ValueError as e:
+            raise BadRequest(str(e)) from None
+        if not request.user.groups.filter(name="Менеджеры").exists():
+            filters["owner_id"] = request.user.id
+
+        compress = request.GET.get("gzip") == "1"
+        response = StreamingHttpResponse(
+            export_attempts(export_format, compress, **filters),
+            content_type=(
+                "application/gzip" if compress else EXPORT_FORMATS[export_format]
+            ),
+        )
+        filename = f"attempts.{export_format}{'.gz' if compress else ''}"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+
+class NewsletterStatisticsView(LoginRequiredMixin, View):
+    def get(self, request, pk):
+        newsletter = get_object_or_404(Newsletter, pk=pk)
+        if (
+            newsletter.owner_id != request.user.id
+            and not request.user.groups.filter(name="Менеджеры").exists()
+        ):
+            raise PermissionDenied
+        return JsonResponse(
+            {
+                "newsletter_id": newsletter.id,
+                "status": newsletter.status,
+                **newsletter_statistics(newsletter),
+            }
         )
 
 
 class StatisticsView(LoginRequiredMixin, TemplateView):
     template_name = "mailing/statistics.html"
 
-    @method_decorator(cache_page(5))
-    def dispatch(self, *args, **kwargs):
-        return super().dispatch(*args, **kwargs)
-
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
         user = self.request.user
 
-        user_newsletters = Newsletter.objects.filter(owner=user)
-
-        context["total_newsletters"] = user_newsletters.count()
-        context["active_newsletters"] = user_newsletters.filter(
-            status="Запущена"
-        ).count()
-        context["unique_recipients"] = (
-            Recipient.objects.filter(newsletter__in=user_newsletters).distinct().count()
+        # Одна строка сводной таблицы вместо шести агрегатных запросов
+        context.update(
+            get_cached(
+                user.id,
+                STATISTICS,
+                "summary",
+                lambda: {
+                    field: getattr(get_owner_statistics(user), field)
+                    for field in STATISTICS_FIELDS
+                },
+            )
         )
 
-        context["total_attempts"] = Attempt.objects.filter(
-            newsletter__owner=user
-        ).count()
-        context["successful_attempts"] = Attempt.objects.filter(
-            newsletter__owner=user, status="Успешно"
-        ).count()
-        context["unsuccessful_attempts"] = Attempt.objects.filter(
-            newsletter__owner=user, status="Не успешно"
-        ).count()
-
         context["is_manager"] = user.groups.filter(name="Менеджеры").exists()
 
         return context
@@ -354,13 +474,40 @@ class ManagerDashboardView(ManagerRequiredMixin, ListView):
     model = CustomUser
     template_name = "mailing/manager_dashboard.html"
     context_object_name = "users"
+    paginate_by = settings.MAILING_DASHBOARD_PAGE_SIZE
 
     def get_queryset(self):
-        return CustomUser.objects.all()
+        # Счётчики рассылок считаются тем же запросом, что и страница
+        users = CustomUser.objects.annotate(
+            newsletters_count=Count("newsletter"),
+            active_newsletters_count=Count(
+                "newsletter", filter=Q(newsletter__status="Запущена")
+            ),
+        ).order_by("id")
+        query = self.request.GET.get("q", "").strip()
+        if query:
+            users = users.filter(
+                Q(email__icontains=query) | Q(username__icontains=query)
+            )
+        return users
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["newsletters"] = Newsletter.objects.all()
+        newsletters = (
+            Newsletter.objects.select_related("message", "owner")
+            .annotate(**newsletter_attempt_counts())
+            .order_by("-id")
+        )
+        query = self.request.GET.get("q", "").strip()
+        if query:
+            newsletters = newsletters.filter(
+                Q(message__subject__icontains=query) | Q(owner__email__icontains=query)
+            )
+        context["newsletters_page"] = Paginator(
+            newsletters, settings.MAILING_DASHBOARD_PAGE_SIZE
+        ).get_page(self.request.GET.get("newsletters_page"))
+        context["newsletters"] = context["newsletters_page"].object_list
+        context["query"] = query
         return context
 
     @staticmethod
@@ -382,5 +529,6 @@ class ManagerDashboardView(ManagerRequiredMixin, ListView):
             newsletter = get_object_or_404(Newsletter, id=newsletter_id)
             newsletter.status = "Отключена"
             newsletter.save()
+            publish_command(newsletter.id, "stop")
 
         return redirect("mailing:dashboard")